@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Benchmark thai_locations: import time and memory (legacy dict literal vs packed + lazy) and fuzzy search latency.
+
+    python bench_thai_locations.py [runs]
+
+Each case runs in a fresh interpreter (-B, so no .pyc is reused for the legacy
+literal) and reports the median wall time and the memory allocated by the step
+(tracemalloc), plus the process max RSS.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CASE_CODE = r'''
+import sys, time, tracemalloc, resource
+sys.path.insert(0, {path!r})
+tracemalloc.start()
+t0 = time.perf_counter()
+import {module} as m
+{touch}
+elapsed = time.perf_counter() - t0
+current, peak = tracemalloc.get_traced_memory()
+print(elapsed * 1000, current / 1024, peak / 1024, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+CASES = [
+    ("legacy dict literal: import", "legacy", "thai_locations_legacy", "len(m.LOCATION_DATA)"),
+    ("packed: import only", "packed", "thai_locations", "pass"),
+    ("packed: import + LOCATION_DATA", "packed", "thai_locations", "len(m.LOCATION_DATA)"),
+    ("packed: import + data + indexes", "packed", "thai_locations", "m.lookup_zipcode('10200')"),
+    ("packed: import + fuzzy index", "packed", "thai_locations", "m.fuzzy_search('chiang mai')"),
+]
+
+
+def write_legacy_module(directory):
+    """Recreate the old 1,000+ line dict-literal module from the packed data."""
+    sys.path.insert(0, HERE)
+    import thai_locations
+    data = {p: dict(ds) for p, ds in thai_locations.LOCATION_DATA.items()}
+    with open(os.path.join(directory, "thai_locations_legacy.py"), "w", encoding="utf-8") as f:
+        f.write("# -*- coding: utf-8 -*-\nLOCATION_DATA = ")
+        f.write(json.dumps(data, ensure_ascii=False, indent=4))
+        f.write("\n")
+
+
+def run_case(path, module, touch, runs):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-B", "-c", CASE_CODE.format(path=path, module=module, touch=touch)],
+                             capture_output=True, text=True, check=True).stdout.split()
+        samples.append([float(x) for x in out])
+    return [statistics.median(col) for col in zip(*samples)]
+
+
+def fuzzy_timings(runs):
+    """Per-query latency of fuzzy_search once its index is built."""
+    import timeit
+    sys.path.insert(0, HERE)
+    import thai_locations
+    thai_locations.fuzzy_search("x")
+    print(f"\n{'fuzzy query':34} {'us/query':>9}  best match")
+    for q in ("เชียงไหม่", "ขอนแกน", "chiang mai", "ladkrabang", "surat thani"):
+        us = min(timeit.repeat(lambda: thai_locations.fuzzy_search(q), number=200, repeat=runs)) / 200 * 1e6
+        print(f"{q:34} {us:9.0f}  {thai_locations.fuzzy_search(q, 1)[0]['name']}")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    with tempfile.TemporaryDirectory() as tmp:
+        write_legacy_module(tmp)
+        print(f"{'case':34} {'time ms':>9} {'kept KiB':>9} {'peak KiB':>9} {'maxrss KiB':>11}")
+        for label, where, module, touch in CASES:
+            ms, kept, peak, rss = run_case(tmp if where == "legacy" else HERE, module, touch, runs)
+            print(f"{label:34} {ms:9.2f} {kept:9.0f} {peak:9.0f} {rss:11.0f}")
+    fuzzy_timings(runs)
+    print(f"\ndata file: {os.path.getsize(os.path.join(HERE, 'thai_locations.bin')):,} bytes "
+          f"(median of {runs} runs per case)")
+
+
+if __name__ == "__main__":
+    main()
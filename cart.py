@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""POS cart and pricing engine.
+
+The cart keeps its subtotal up to date as lines are added or removed, and runs
+the pricing rules once per change; the page only reads `cart.totals`, so a rerun
+costs nothing.
+
+Pricing rules are functions (cart, totals) -> None that adjust the totals dict
+in order:
+    bundle_price_rule    a loaded package is charged its bundle price while all
+                         of its products are still in the cart
+    percent_discount_rule  the cart-wide percent discount
+
+Checkout still receives a flat list of items whose totals add up to the
+subtotal: each applied bundle becomes an adjustment line with id 0.
+
+A package (see crm_app.load_package_index) is a dict:
+    {"package_id", "name", "price" (bundle price), "items": [(product_id, name, unit price), ...]}
+"""
+
+BUNDLE_LINE_PREFIX = "ส่วนลดแพ็กเกจ: "
+
+
+def bundle_price_rule(cart, totals):
+    present = {}
+    for line in cart.lines:
+        if line.get("package_id"):
+            present.setdefault(line["package_id"], set()).add(line["id"])
+    for package_id, bundle in cart.bundles.items():
+        if bundle["product_ids"] <= present.get(package_id, set()):
+            list_price = sum(l["total"] for l in cart.lines if l.get("package_id") == package_id)
+            totals["adjustments"].append({"package_id": package_id, "name": BUNDLE_LINE_PREFIX + bundle["name"],
+                                          "amount": bundle["price"] - list_price})
+    totals["subtotal"] += sum(a["amount"] for a in totals["adjustments"])
+
+
+def percent_discount_rule(cart, totals):
+    totals["discount_pct"] = cart.discount_pct
+    totals["discount"] = totals["subtotal"] * cart.discount_pct / 100
+    totals["final"] = totals["subtotal"] - totals["discount"]
+
+
+PRICING_RULES = [bundle_price_rule, percent_discount_rule]
+
+
+class Cart:
+    """Cart lines plus the pricing result for the current contents."""
+
+    def __init__(self, rules=None):
+        self.rules = PRICING_RULES if rules is None else rules
+        self.lines = []
+        self.bundles = {}
+        self.discount_pct = 0.0
+        self.list_subtotal = 0.0
+        self.version = 0
+        self.totals = {}
+        self._reprice()
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    def _reprice(self):
+        self.version += 1
+        totals = {"list_subtotal": self.list_subtotal, "subtotal": self.list_subtotal, "adjustments": []}
+        for rule in self.rules:
+            rule(self, totals)
+        self.totals = totals
+
+    def add_product(self, product_id, name, price, qty=1, is_course=True):
+        """Add `qty` of a product; a product already in the cart (outside a package) just gets more qty."""
+        qty, price = int(qty), float(price)
+        for line in self.lines:
+            if line["id"] == product_id and not line.get("package_id") and line["price"] == price:
+                line["qty"] += qty
+                line["total"] = line["price"] * line["qty"]
+                break
+        else:
+            self.lines.append({"id": int(product_id), "name": name, "price": price, "qty": qty,
+                               "total": price * qty, "is_course": is_course})
+        self.list_subtotal = round(self.list_subtotal + price * qty, 2)
+        self._reprice()
+
+    def load_package(self, package):
+        """Replace the cart with a package's products, charged at the bundle price."""
+        self.lines, self.bundles, self.list_subtotal = [], {}, 0.0
+        pid = package["package_id"]
+        for product_id, name, price in package["items"]:
+            self.lines.append({"id": int(product_id), "name": name, "price": float(price), "qty": 1,
+                               "total": float(price), "is_course": True, "package_id": pid})
+            self.list_subtotal = round(self.list_subtotal + float(price), 2)
+        self.bundles[pid] = {"name": package["name"], "price": float(package["price"]),
+                             "product_ids": {int(p) for p, _, _ in package["items"]}}
+        self._reprice()
+
+    def remove(self, index):
+        line = self.lines.pop(index)
+        # Rounded to satang so adding and removing lines never leaves float drift behind
+        self.list_subtotal = round(self.list_subtotal - line["total"], 2)
+        self._reprice()
+
+    def set_discount_pct(self, pct):
+        if float(pct) != self.discount_pct:
+            self.discount_pct = float(pct)
+            self._reprice()
+
+    def clear(self):
+        self.lines, self.bundles, self.list_subtotal, self.discount_pct = [], {}, 0.0, 0.0
+        self._reprice()
+
+    def product_ids(self):
+        return [line["id"] for line in self.lines if line["id"] > 0]
+
+    def to_items(self):
+        """Flat checkout/receipt items: product lines plus one adjustment line (id 0) per applied bundle."""
+        items = [{k: line[k] for k in ("id", "name", "price", "qty", "total", "is_course")} for line in self.lines]
+        items += [{"id": 0, "name": a["name"], "price": a["amount"], "qty": 1, "total": a["amount"], "is_course": False}
+                  for a in self.totals["adjustments"]]
+        return items
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""Write-behind checkout queue.
+
+When the hosted database is slow, the cashier should not wait on it. A sale is
+committed to a local SQLite file (WAL, synchronous=FULL, so it survives a
+crash), the cashier gets a provisional bill number immediately, and a background
+thread replays queued sales to PostgreSQL strictly in order.
+
+Replays are safe to repeat: every sale carries the idempotency key used by
+pos_checkout(), so a sale that reached PostgreSQL but was not marked done here
+(crash, timeout) returns the same bill on the next attempt.
+
+Errors of a `transient` type (connection problems) are retried forever with
+backoff; any other error is retried `max_attempts` times and then the sale is
+parked as 'failed' so it does not block the sales behind it. Errors in the
+follow-up callbacks never stop the replay; they are logged, kept on the sale's
+row and reported by stats().
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkout_queue (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    idem_key TEXT UNIQUE NOT NULL,
+    payload TEXT NOT NULL,
+    receipt_html TEXT,
+    enqueued_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    bill_id TEXT,
+    done_at REAL
+)
+"""
+PROVISIONAL_PREFIX = "Q-"
+
+log = logging.getLogger(__name__)
+
+
+def provisional_id(seq):
+    return f"{PROVISIONAL_PREFIX}{seq:06d}"
+
+
+def is_provisional(bill_id):
+    return str(bill_id or "").startswith(PROVISIONAL_PREFIX)
+
+
+class CheckoutQueue:
+    """Durable FIFO of checkout payloads replayed by one background thread.
+
+    submit(payload, idem_key) -> result dict with 'bill_id' (raises on failure)
+    on_done(result)           -> called after each replayed sale
+    on_drain(results)         -> called once the queue empties after a batch
+    """
+
+    def __init__(self, path, submit, on_done=None, on_drain=None, transient=(), max_attempts=5,
+                 poll_seconds=1.0, max_backoff=60.0):
+        self.path = path
+        self.submit, self.on_done, self.on_drain = submit, on_done, on_drain
+        self.transient, self.max_attempts = tuple(transient), max_attempts
+        self.poll_seconds, self.max_backoff = poll_seconds, max_backoff
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.callback_error = None
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute(SCHEMA)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    # --- Cashier side ---
+
+    def enqueue(self, payload, idem_key, render_receipt=None):
+        """Durably queue a sale and return its provisional bill id (the same id if the key is already queued).
+
+        render_receipt(provisional_id) -> HTML is stored with the sale so the provisional receipt can be reprinted.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT seq FROM checkout_queue WHERE idem_key = ?", (idem_key,)).fetchone()
+            if row:
+                return provisional_id(row[0])
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._db.execute(
+                    "INSERT INTO checkout_queue (idem_key, payload, enqueued_at) VALUES (?, ?, ?)",
+                    (idem_key, json.dumps(payload, ensure_ascii=False), time.time())).lastrowid
+                if render_receipt:
+                    self._db.execute("UPDATE checkout_queue SET receipt_html = ? WHERE seq = ?",
+                                     (render_receipt(provisional_id(seq)), seq))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        self._wake.set()
+        return provisional_id(seq)
+
+    def lookup(self, provisional):
+        """(status, bill_id, receipt_html) of a provisional bill, or None if unknown."""
+        try:
+            seq = int(str(provisional)[len(PROVISIONAL_PREFIX):])
+        except ValueError:
+            return None
+        rows = self._query("SELECT status, bill_id, receipt_html FROM checkout_queue WHERE seq = ?", (seq,))
+        return rows[0] if rows else None
+
+    def stats(self):
+        """Queue depth, lag of the oldest pending sale (seconds), failed count, the latest error and the latest callback error."""
+        depth, oldest, failed = self._query("""
+            SELECT COUNT(*) FILTER (WHERE status = 'pending'), MIN(enqueued_at) FILTER (WHERE status = 'pending'),
+                   COUNT(*) FILTER (WHERE status = 'failed')
+            FROM checkout_queue
+        """)[0]
+        err = self._query("SELECT last_error FROM checkout_queue WHERE status <> 'done' AND last_error IS NOT NULL "
+                          "ORDER BY seq DESC LIMIT 1")
+        return {"depth": depth, "lag": time.time() - oldest if oldest else 0.0, "failed": failed,
+                "last_error": err[0][0] if err else None, "callback_error": self.callback_error,
+                "running": bool(self._thread and self._thread.is_alive())}
+
+    def retry_failed(self):
+        """Put parked sales back in line (e.g. after fixing the data they tripped on)."""
+        self._query("UPDATE checkout_queue SET status = 'pending', attempts = 0 WHERE status = 'failed'")
+        self._wake.set()
+
+    def purge_done(self, older_than_days=7):
+        self._query("DELETE FROM checkout_queue WHERE status = 'done' AND done_at < ?",
+                    (time.time() - older_than_days * 86400,))
+
+    # --- Worker side ---
+
+    def start(self):
+        if not (self._thread and self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="checkout-queue", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        backoff, batch = 0.0, []
+        while not self._stop.is_set():
+            rows = self._query("SELECT seq, idem_key, payload, attempts FROM checkout_queue "
+                               "WHERE status = 'pending' ORDER BY seq LIMIT 1")
+            if not rows:
+                if batch and self.on_drain:
+                    self._callback(self.on_drain, batch)
+                batch = []
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+                continue
+            seq, idem_key, payload, attempts = rows[0]
+            try:
+                result = self.submit(json.loads(payload), idem_key)
+            except Exception as e:
+                permanent = not isinstance(e, self.transient) and attempts + 1 >= self.max_attempts
+                self._query("UPDATE checkout_queue SET attempts = attempts + 1, last_error = ?, status = ? WHERE seq = ?",
+                            (f"{type(e).__name__}: {e}"[:500], "failed" if permanent else "pending", seq))
+                backoff = min(max(backoff * 2, self.poll_seconds), self.max_backoff)
+                self._stop.wait(backoff)
+                continue
+            backoff = 0.0
+            self._query("UPDATE checkout_queue SET status = 'done', bill_id = ?, last_error = NULL, done_at = ? WHERE seq = ?",
+                        (result["bill_id"], time.time(), seq))
+            batch.append(result)
+            if self.on_done:
+                self._callback(self.on_done, result, seq)
+
+    def _callback(self, fn, arg, seq=None):
+        # Follow-up work (receipts, rollups) must never stop the replay loop, but must leave a trace
+        name = getattr(fn, "__name__", "callback")
+        try:
+            fn(arg)
+        except Exception as e:
+            log.exception("checkout queue callback %s failed", name)
+            self.callback_error = f"{name}: {type(e).__name__}: {e}"[:500]
+            if seq is not None:
+                self._query("UPDATE checkout_queue SET last_error = ? WHERE seq = ?", (self.callback_error, seq))
+        else:
+            if (self.callback_error or "").startswith(name + ":"):
+                self.callback_error = None
@@ -1,9 +1,26 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import threading
+import re
+import math
+import time
+import unicodedata
+import io
+import os
+import tempfile
+import json
+import uuid
+from collections import Counter
 from datetime import datetime, timedelta
 import datetime as dt
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError, OperationalError
 import google.generativeai as genai
+from receipts import ThaiFontMissing, render_receipt_html, render_receipts_zip
+from checkout_queue import CheckoutQueue, is_provisional
+from cart import Cart
+from customer_import import excel_cell_text, normalize_phone
 
 # --- 1. Database Configuration (PostgreSQL) ---
 @st.cache_resource
@@ -11,14 +28,23 @@ def get_engine():
     return create_engine(st.secrets["database"]["url"])
 
 def run_query(query, params=None):
-    """Execute a query and return results as DataFrame for SELECT, or commit for others."""
+    """Execute a query and return results as DataFrame for SELECT/WITH, or commit for others."""
     with get_engine().connect() as conn:
         result = conn.execute(text(query), params or {})
-        if query.strip().upper().startswith("SELECT"):
-            return pd.DataFrame(result.fetchall(), columns=result.keys())
+        if result.returns_rows:
+            df = pd.DataFrame(result.fetchall(), columns=result.keys())
+            if not query.strip().upper().startswith("SELECT"):
+                conn.commit()
+            return df
         conn.commit()
         return None
 
+def run_transaction(statements):
+    """Execute a list of (query, params) statements atomically in one transaction."""
+    with get_engine().begin() as conn:
+        for query, params in statements:
+            conn.execute(text(query), params or {})
+
 def init_db():
     """Initialize database tables if they don't exist."""
     try:
@@ -212,6 +238,166 @@ def init_db():
                 customer_id INTEGER,
                 tag_name TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )''',
+            '''CREATE TABLE IF NOT EXISTS job_runs (
+                job_name TEXT PRIMARY KEY,
+                last_run TIMESTAMP
+            )''',
+            '''CREATE TABLE IF NOT EXISTS credit_alerts (
+                credit_id INTEGER PRIMARY KEY,
+                customer_id INTEGER,
+                product_id INTEGER,
+                expiry_date DATE,
+                days_left INTEGER,
+                bucket TEXT,
+                refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )''',
+            '''CREATE TABLE IF NOT EXISTS churn_scores (
+                customer_id INTEGER PRIMARY KEY,
+                last_bill DATE,
+                bill_count INTEGER,
+                lifetime_spend REAL,
+                days_since INTEGER,
+                typical_interval REAL,
+                risk_ratio REAL,
+                priority REAL,
+                risk_level TEXT,
+                refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )''',
+            '''CREATE TABLE IF NOT EXISTS sales_rollup_daily (
+                sale_day DATE,
+                channel TEXT,
+                cat_id INTEGER,
+                bill_count REAL DEFAULT 0,
+                revenue REAL DEFAULT 0,
+                PRIMARY KEY (sale_day, channel, cat_id)
+            )''',
+            '''CREATE TABLE IF NOT EXISTS funnel_rollup_monthly (
+                month_year TEXT,
+                channel TEXT,
+                cat_id INTEGER,
+                leads INTEGER DEFAULT 0,
+                registers INTEGER DEFAULT 0,
+                paid_bills REAL DEFAULT 0,
+                revenue REAL DEFAULT 0,
+                PRIMARY KEY (month_year, channel, cat_id)
+            )''',
+            '''CREATE TABLE IF NOT EXISTS ad_spend (
+                spend_id SERIAL PRIMARY KEY,
+                month_year TEXT,
+                channel TEXT,
+                amount REAL DEFAULT 0,
+                UNIQUE(month_year, channel)
+            )''',
+            '''CREATE TABLE IF NOT EXISTS channel_roi_monthly (
+                month_year TEXT,
+                channel TEXT,
+                ad_spend REAL,
+                forecast_amount REAL,
+                revenue REAL,
+                leads INTEGER,
+                registers INTEGER,
+                paid_bills REAL,
+                roas REAL,
+                cost_per_register REAL,
+                frozen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (month_year, channel)
+            )''',
+            '''CREATE TABLE IF NOT EXISTS campaigns (
+                campaign_id SERIAL PRIMARY KEY,
+                campaign_name TEXT UNIQUE NOT NULL,
+                start_date DATE,
+                end_date DATE,
+                channels TEXT[] DEFAULT '{}',
+                cat_ids INTEGER[] DEFAULT '{}',
+                budget REAL DEFAULT 0,
+                note TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )''',
+            '''CREATE TABLE IF NOT EXISTS campaign_bills (
+                campaign_id INTEGER,
+                bill_id TEXT,
+                revenue REAL,
+                sale_date TIMESTAMP,
+                PRIMARY KEY (campaign_id, bill_id)
+            )''',
+            '''CREATE TABLE IF NOT EXISTS campaign_stats (
+                campaign_id INTEGER PRIMARY KEY,
+                revenue REAL DEFAULT 0,
+                bills INTEGER DEFAULT 0,
+                customers INTEGER DEFAULT 0,
+                leads INTEGER DEFAULT 0,
+                registers INTEGER DEFAULT 0,
+                conversion REAL,
+                refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )''',
+            '''CREATE TABLE IF NOT EXISTS customer_actions (
+                customer_id INTEGER,
+                action_type TEXT,
+                title TEXT,
+                reason TEXT,
+                score REAL,
+                due_date DATE,
+                refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (customer_id, action_type)
+            )''',
+            '''CREATE TABLE IF NOT EXISTS commission_snapshots (
+                month_year TEXT,
+                emp_id INTEGER,
+                emp_name TEXT,
+                target REAL DEFAULT 0,
+                bill_count INTEGER DEFAULT 0,
+                gross_sales REAL DEFAULT 0,
+                clawback REAL DEFAULT 0,
+                net_sales REAL DEFAULT 0,
+                attainment REAL,
+                rate REAL DEFAULT 0,
+                commission REAL DEFAULT 0,
+                frozen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (month_year, emp_id)
+            )''',
+            '''CREATE TABLE IF NOT EXISTS checkout_requests (
+                idempotency_key TEXT PRIMARY KEY,
+                bill_id TEXT,
+                result JSONB,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )''',
+            '''CREATE TABLE IF NOT EXISTS bill_receipts (
+                bill_id TEXT PRIMARY KEY,
+                receipt_html TEXT,
+                rendered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )''',
+            '''CREATE TABLE IF NOT EXISTS province_map (
+                raw TEXT PRIMARY KEY,
+                province TEXT,
+                region TEXT
+            )''',
+            '''CREATE TABLE IF NOT EXISTS sales_geo_monthly (
+                month_year TEXT,
+                province TEXT,
+                region TEXT,
+                bill_count INTEGER DEFAULT 0,
+                customer_count INTEGER DEFAULT 0,
+                revenue REAL DEFAULT 0,
+                PRIMARY KEY (month_year, province)
+            )''',
+            '''CREATE TABLE IF NOT EXISTS events (
+                event_id SERIAL PRIMARY KEY,
+                event_name TEXT NOT NULL,
+                event_date DATE,
+                location TEXT,
+                event_type TEXT DEFAULT 'Openhouse',
+                status TEXT DEFAULT 'Planned',
+                note TEXT
+            )''',
+            '''CREATE TABLE IF NOT EXISTS event_stats (
+                event_id INTEGER PRIMARY KEY,
+                leads INTEGER DEFAULT 0,
+                registers INTEGER DEFAULT 0,
+                closes INTEGER DEFAULT 0,
+                revenue REAL DEFAULT 0,
+                frozen BOOLEAN DEFAULT FALSE,
+                refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )'''
         ]
         for q in queries:
@@ -258,6 +444,57 @@ def init_db():
             run_query("ALTER TABLE bill_items ADD COLUMN IF NOT EXISTS package_id INTEGER")
             run_query("ALTER TABLE bills ADD COLUMN IF NOT EXISTS package_id INTEGER")
         except: pass
+
+        # Indexes for the credit expiry alert engine
+        run_query("CREATE INDEX IF NOT EXISTS idx_course_credits_status_expiry ON course_credits (status, expiry_date)")
+        run_query("CREATE INDEX IF NOT EXISTS idx_credit_alerts_customer ON credit_alerts (customer_id, days_left)")
+
+        # Indexes for the churn scorer
+        run_query("CREATE INDEX IF NOT EXISTS idx_bills_customer_date ON bills (customer_id, sale_date)")
+        run_query("CREATE INDEX IF NOT EXISTS idx_churn_scores_priority ON churn_scores (priority DESC)")
+
+        # Event linkage (event_id 0 = not tied to an event, so it can be part of the unique key)
+        run_query("ALTER TABLE daily_leads ADD COLUMN IF NOT EXISTS event_id INTEGER NOT NULL DEFAULT 0")
+        run_query("ALTER TABLE daily_registers ADD COLUMN IF NOT EXISTS event_id INTEGER NOT NULL DEFAULT 0")
+        run_query("ALTER TABLE bills ADD COLUMN IF NOT EXISTS event_id INTEGER")
+        run_query("CREATE INDEX IF NOT EXISTS idx_bills_event ON bills (event_id) WHERE event_id IS NOT NULL")
+
+        # Rollup sources: one row per day/channel/category/event so the bulk-entry grid can upsert
+        run_query("CREATE INDEX IF NOT EXISTS idx_bills_sale_date ON bills (sale_date)")
+        try:
+            run_query("DROP INDEX IF EXISTS uq_daily_leads_day_channel_cat")
+            run_query("DROP INDEX IF EXISTS uq_daily_registers_day_channel_cat")
+            run_query("CREATE UNIQUE INDEX IF NOT EXISTS uq_daily_leads_day_channel_cat_event ON daily_leads (lead_date, channel, cat_id, event_id)")
+            run_query("CREATE UNIQUE INDEX IF NOT EXISTS uq_daily_registers_day_channel_cat_event ON daily_registers (reg_date, channel, cat_id, event_id)")
+        except Exception as e:
+            st.warning(f"⚠️ daily_leads/daily_registers มีข้อมูลซ้ำ ต้องรวมแถวก่อนใช้ตารางบันทึกแบบกลุ่ม: {e}")
+
+        # Customer activity timeline: every stream is read newest-first per customer
+        run_query("CREATE INDEX IF NOT EXISTS idx_contact_logs_customer_date ON contact_logs (customer_id, contact_date DESC)")
+        run_query("CREATE INDEX IF NOT EXISTS idx_customer_feedback_customer_date ON customer_feedback (customer_id, created_at DESC)")
+        run_query("CREATE INDEX IF NOT EXISTS idx_customer_tags_customer_date ON customer_tags (customer_id, created_at DESC)")
+
+        # Co-purchase index reads whole bills for new bill_items
+        run_query("CREATE INDEX IF NOT EXISTS idx_bill_items_bill ON bill_items (bill_id)")
+
+        # Checkout runs server-side in one call; retries with the same key return the first result
+        run_query(POS_CHECKOUT_FUNCTION)
+
+        # Incremental jobs remember how far they got
+        run_query("ALTER TABLE job_runs ADD COLUMN IF NOT EXISTS watermark TIMESTAMP")
+        
+        # Bills are spread over categories as fractions; integer rollups are converted and rebuilt once
+        int_rollup = run_query("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'sales_rollup_daily' AND column_name = 'bill_count' AND data_type = 'integer'
+        """)
+        if not int_rollup.empty:
+            run_transaction([
+                ("ALTER TABLE sales_rollup_daily ALTER COLUMN bill_count TYPE REAL", None),
+                ("ALTER TABLE funnel_rollup_monthly ALTER COLUMN paid_bills TYPE REAL", None),
+                ("ALTER TABLE channel_roi_monthly ALTER COLUMN paid_bills TYPE REAL", None),
+            ])
+            refresh_marketing_rollups()
     except Exception as e:
         st.error(f"⚠️ Database Error: {e}")
 
@@ -266,21 +503,1729 @@ def run_migration():
     st.success("✅ ระบบใช้ PostgreSQL บน Supabase - ไม่ต้อง migrate")
 
 
+# --- 1.1 Precomputed Tables & Daily Jobs ---
+
+# Course credit expiry alerts: (max days left, bucket) checked in order
+CREDIT_ALERT_WINDOW_DAYS = 90
+CREDIT_ALERT_BUCKETS = [(14, 'urgent'), (30, 'warning'), (CREDIT_ALERT_WINDOW_DAYS, 'normal')]
+CREDIT_BUCKET_LABELS = {'urgent': '🔴 เร่งด่วน', 'warning': '🟡 เตือน', 'normal': '🟢 ปกติ'}
+
+def credit_bucket(days_left):
+    """Map days until expiry to an urgency bucket."""
+    for max_days, bucket in CREDIT_ALERT_BUCKETS:
+        if days_left <= max_days:
+            return bucket
+    return 'normal'
+
+def refresh_credit_alerts():
+    """Mark overdue credits Expired and rebuild credit_alerts in one transaction."""
+    run_transaction([
+        ("""
+            UPDATE course_credits SET status = 'Expired'
+            WHERE status = 'Available' AND expiry_date < CURRENT_DATE
+        """, None),
+        ("DELETE FROM credit_alerts", None),
+        ("""
+            INSERT INTO credit_alerts (credit_id, customer_id, product_id, expiry_date, days_left, bucket)
+            SELECT credit_id, customer_id, product_id, expiry_date, expiry_date - CURRENT_DATE,
+                   CASE WHEN expiry_date - CURRENT_DATE <= :urgent THEN 'urgent'
+                        WHEN expiry_date - CURRENT_DATE <= :warning THEN 'warning'
+                        ELSE 'normal' END
+            FROM course_credits
+            WHERE status = 'Available'
+              AND expiry_date BETWEEN CURRENT_DATE AND CURRENT_DATE + :window
+        """, {"urgent": CREDIT_ALERT_BUCKETS[0][0], "warning": CREDIT_ALERT_BUCKETS[1][0],
+              "window": CREDIT_ALERT_WINDOW_DAYS}),
+    ])
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_credit_alert_badge():
+    """Number of customers with urgent credit alerts (for the sidebar)."""
+    df = run_query("SELECT COUNT(DISTINCT customer_id) AS cnt FROM credit_alerts WHERE bucket = 'urgent'")
+    return int(df['cnt'][0]) if not df.empty else 0
+
+# Churn risk: risk_ratio = days since last bill / customer's typical purchase interval
+CHURN_DEFAULT_INTERVAL_DAYS = 90
+CHURN_MIN_INTERVAL_DAYS = 14
+CHURN_RISK_LEVELS = [(1.5, 'low'), (2.0, 'medium'), (3.0, 'high')]  # below threshold -> level, else very_high
+CHURN_RISK_LABELS = {'low': '🟢 ปกติ', 'medium': '🟡 ปานกลาง', 'high': '🔴 สูง', 'very_high': '🔴 สูงมาก'}
+CHURN_SORT_OPTIONS = {
+    "ความเสี่ยง × มูลค่า": "priority",
+    "ความเสี่ยง": "risk_ratio",
+    "ยอดใช้จ่ายรวม": "lifetime_spend",
+    "ห่างหาย (วัน)": "days_since",
+}
+
+def refresh_churn_scores():
+    """Score every customer in one pass over per-customer bill aggregates."""
+    run_transaction([
+        ("DELETE FROM churn_scores", None),
+        ("""
+            WITH agg AS (
+                SELECT customer_id, MIN(sale_date)::date AS first_bill, MAX(sale_date)::date AS last_bill,
+                       COUNT(*) AS bill_count, COALESCE(SUM(final_amount), 0) AS lifetime_spend
+                FROM bills
+                WHERE customer_id IS NOT NULL
+                GROUP BY customer_id
+            ), base AS (
+                SELECT COALESCE(percentile_cont(0.5) WITHIN GROUP (
+                           ORDER BY (last_bill - first_bill)::float / (bill_count - 1)), :default_interval) AS median_interval
+                FROM agg WHERE bill_count > 1 AND last_bill > first_bill
+            ), scored AS (
+                SELECT a.*, CURRENT_DATE - a.last_bill AS days_since,
+                       GREATEST(CASE WHEN a.bill_count > 1 AND a.last_bill > a.first_bill
+                                     THEN (a.last_bill - a.first_bill)::float / (a.bill_count - 1)
+                                     ELSE b.median_interval END, :min_interval) AS typical_interval
+                FROM agg a CROSS JOIN base b
+            ), ratios AS (
+                SELECT *, days_since / typical_interval AS risk_ratio FROM scored
+            )
+            INSERT INTO churn_scores (customer_id, last_bill, bill_count, lifetime_spend, days_since,
+                                      typical_interval, risk_ratio, priority, risk_level)
+            SELECT customer_id, last_bill, bill_count, lifetime_spend, days_since,
+                   typical_interval, risk_ratio, risk_ratio * lifetime_spend,
+                   CASE WHEN risk_ratio < :low THEN 'low'
+                        WHEN risk_ratio < :medium THEN 'medium'
+                        WHEN risk_ratio < :high THEN 'high'
+                        ELSE 'very_high' END
+            FROM ratios
+        """, {"default_interval": CHURN_DEFAULT_INTERVAL_DAYS, "min_interval": CHURN_MIN_INTERVAL_DAYS,
+              "low": CHURN_RISK_LEVELS[0][0], "medium": CHURN_RISK_LEVELS[1][0], "high": CHURN_RISK_LEVELS[2][0]}),
+    ])
+
+# Next-best-action rules: (action_type, title); scores and reasons are computed in refresh_next_best_actions
+NBA_ACTIONS = {
+    'fix_experience': "⚠️ แก้ปัญหาความพึงพอใจ",
+    'credit_expiring': "📚 นัดเข้าเรียนก่อนเครดิตหมดอายุ",
+    'follow_up_due': "⏰ โทรติดตามตามนัด",
+    'win_back': "📞 โทรดึงกลับ (Win-back)",
+    'birthday': "🎂 ส่งอวยพรวันเกิด + Voucher",
+    'interest_offer': "🎯 เสนอคอร์สตามความสนใจ",
+    'upsell': "💎 เสนอคอร์สต่อยอด/Package",
+    'referral': "⭐ ขอรีวิว/ชวนเพื่อน (Referral)",
+}
+
+def refresh_next_best_actions():
+    """Score every customer's next best actions in one batch from credits, bills, contacts, feedback, tags and birthdays.
+    
+    Reads credit_alerts and churn_scores, so it runs after those jobs.
+    """
+    run_transaction([
+        ("DELETE FROM customer_actions", None),
+        ("""
+            WITH fb AS (
+                SELECT customer_id, AVG(rating) AS avg_rating, MIN(rating) AS min_rating, COUNT(*) AS fb_count
+                FROM customer_feedback
+                WHERE created_at >= CURRENT_DATE - 90
+                GROUP BY customer_id
+            ), fb_all AS (
+                SELECT customer_id, AVG(rating) AS avg_rating FROM customer_feedback GROUP BY customer_id
+            ), tags AS (
+                SELECT customer_id,
+                       BOOL_OR(tag_name ILIKE '%VIP%' OR tag_name LIKE '%งบสูง%') AS is_premium,
+                       STRING_AGG(tag_name, ', ') FILTER (WHERE tag_name LIKE '%สนใจ%') AS interests
+                FROM customer_tags
+                GROUP BY customer_id
+            ), last_contact AS (
+                SELECT DISTINCT ON (customer_id) customer_id, follow_up_date, contact_date
+                FROM contact_logs
+                ORDER BY customer_id, contact_date DESC
+            ), bd AS (
+                SELECT customer_id,
+                       (birth_date + date_part('year', age(CURRENT_DATE, birth_date)) * INTERVAL '1 year')::date AS bd_this
+                FROM customers WHERE birth_date IS NOT NULL
+            ), actions AS (
+                SELECT customer_id, 'fix_experience' AS action_type,
+                       'Rating เฉลี่ย ' || ROUND(avg_rating::numeric, 1) || '/5 (ต่ำสุด ' || min_rating || ') ใน 90 วัน' AS reason,
+                       95 + (3 - LEAST(avg_rating, 3)) AS score, CURRENT_DATE AS due_date
+                FROM fb WHERE avg_rating <= 3 OR min_rating <= 2
+                UNION ALL
+                SELECT customer_id, 'credit_expiring',
+                       'เครดิต ' || COUNT(*) || ' ครั้ง หมดอายุ ' || to_char(MIN(expiry_date), 'DD/MM/YYYY'),
+                       90 - LEAST(MIN(days_left), 60) / 2.0, GREATEST(MIN(expiry_date) - 14, CURRENT_DATE)
+                FROM credit_alerts WHERE days_left <= 60
+                GROUP BY customer_id
+                UNION ALL
+                SELECT customer_id, 'follow_up_due', 'นัดติดตามไว้วันที่ ' || to_char(follow_up_date, 'DD/MM/YYYY'),
+                       85 - GREATEST(follow_up_date - CURRENT_DATE, 0), follow_up_date
+                FROM last_contact WHERE follow_up_date BETWEEN CURRENT_DATE - 14 AND CURRENT_DATE + 7
+                UNION ALL
+                SELECT customer_id, 'win_back',
+                       'ไม่ได้ซื้อมา ' || days_since || ' วัน (ปกติทุก ' || ROUND(typical_interval::numeric) || ' วัน), ยอดสะสม ฿' || to_char(lifetime_spend, 'FM999,999,990'),
+                       60 + LEAST(risk_ratio * 5, 20) + LEAST(lifetime_spend / 10000, 10), CURRENT_DATE
+                FROM churn_scores WHERE risk_level IN ('high', 'very_high')
+                UNION ALL
+                SELECT customer_id, 'birthday', 'วันเกิด ' || to_char(next_bd, 'DD/MM') || ' (อีก ' || (next_bd - CURRENT_DATE) || ' วัน)',
+                       75 - (next_bd - CURRENT_DATE), GREATEST(next_bd - 7, CURRENT_DATE)
+                FROM (SELECT customer_id, CASE WHEN bd_this >= CURRENT_DATE THEN bd_this
+                                               ELSE (bd_this + INTERVAL '1 year')::date END AS next_bd
+                      FROM bd) b
+                WHERE next_bd - CURRENT_DATE <= 30
+                UNION ALL
+                SELECT t.customer_id, 'interest_offer', 'Tags: ' || t.interests, 55, CURRENT_DATE
+                FROM tags t
+                LEFT JOIN churn_scores cs ON cs.customer_id = t.customer_id
+                WHERE t.interests IS NOT NULL AND (cs.last_bill IS NULL OR cs.last_bill < CURRENT_DATE - 30)
+                UNION ALL
+                SELECT cs.customer_id, 'upsell', cs.bill_count || ' บิล ยอดสะสม ฿' || to_char(cs.lifetime_spend, 'FM999,999,990'),
+                       50 + LEAST(cs.lifetime_spend / 20000, 15), CURRENT_DATE
+                FROM churn_scores cs
+                LEFT JOIN tags t ON t.customer_id = cs.customer_id
+                WHERE cs.risk_level IN ('low', 'medium') AND cs.last_bill < CURRENT_DATE - 30
+                  AND (COALESCE(t.is_premium, FALSE) OR cs.bill_count >= 2)
+                UNION ALL
+                SELECT f.customer_id, 'referral', 'Rating เฉลี่ย ' || ROUND(f.avg_rating::numeric, 1) || '/5', 40, CURRENT_DATE
+                FROM fb_all f
+                JOIN churn_scores cs ON cs.customer_id = f.customer_id
+                WHERE f.avg_rating >= 4.5 AND cs.risk_level = 'low'
+            )
+            INSERT INTO customer_actions (customer_id, action_type, title, reason, score, due_date)
+            SELECT a.customer_id, a.action_type, t.title, a.reason, a.score, a.due_date
+            FROM actions a
+            JOIN unnest(CAST(:types AS TEXT[]), CAST(:titles AS TEXT[])) AS t(action_type, title) ON t.action_type = a.action_type
+            WHERE a.customer_id IS NOT NULL
+        """, {"types": list(NBA_ACTIONS.keys()), "titles": list(NBA_ACTIONS.values())}),
+    ])
+
+# Marketing channels shared by checkout, lead entry and the funnel
+MKT_CHANNELS = ["Facebook Ads", "Google Ads", "TikTok Ads", "Line OA", "Openhouse", "โรงเรียนอนุบาล", "ลูกค้าเก่า/Re-sale", "อื่นๆ"]
+
+# Rollup inserts; {where} is a date range (full rebuilds) or one day/month slice (after a sale).
+# A bill is spread over its categories by their share of its real (product) lines: bill_count gets the
+# share and revenue gets final_amount x share, so summing across categories gives each bill once and
+# package-discount lines (product_id 0) and the bill discount land on the categories they discounted.
+# Bills without product lines count in full under cat_id 0.
+SALES_ROLLUP_SQL = """
+    INSERT INTO sales_rollup_daily (sale_day, channel, cat_id, bill_count, revenue)
+    SELECT b.sale_date::date, COALESCE(b.sale_channel, '-'), COALESCE(s.cat_id, 0),
+           SUM(COALESCE(s.share, 1)), SUM(b.final_amount * COALESCE(s.share, 1))
+    FROM bills b
+    LEFT JOIN LATERAL (
+        SELECT COALESCE(p.cat_id, 0) AS cat_id, SUM(bi.subtotal) / SUM(SUM(bi.subtotal)) OVER () AS share
+        FROM bill_items bi JOIN products p ON p.product_id = bi.product_id
+        WHERE bi.bill_id = b.bill_id AND bi.subtotal > 0
+        GROUP BY 1
+    ) s ON TRUE
+    WHERE {where}
+    GROUP BY 1, 2, 3
+"""
+FUNNEL_ROLLUP_SQL = """
+    INSERT INTO funnel_rollup_monthly (month_year, channel, cat_id, leads, registers, paid_bills, revenue)
+    SELECT to_char(day, 'YYYY-MM'), channel, cat_id, SUM(leads), SUM(registers), SUM(paid_bills), SUM(revenue)
+    FROM (
+        SELECT lead_date AS day, COALESCE(channel, '-') AS channel,
+               COALESCE(cat_id, 0) AS cat_id, lead_count AS leads, 0 AS registers, 0 AS paid_bills, 0 AS revenue
+        FROM daily_leads
+        UNION ALL
+        SELECT reg_date, COALESCE(channel, '-'), COALESCE(cat_id, 0), 0, reg_count, 0, 0
+        FROM daily_registers
+        UNION ALL
+        SELECT sale_day, channel, cat_id, 0, 0, bill_count, revenue
+        FROM sales_rollup_daily
+    ) u
+    WHERE {where}
+    GROUP BY 1, channel, cat_id
+"""
+GEO_ROLLUP_SQL = """
+    INSERT INTO sales_geo_monthly (month_year, province, region, bill_count, customer_count, revenue)
+    SELECT to_char(b.sale_date, 'YYYY-MM'), COALESCE(m.province, '-'), COALESCE(m.region, '-'),
+           COUNT(*), COUNT(DISTINCT b.customer_id), SUM(b.final_amount)
+    FROM bills b
+    LEFT JOIN customers c ON c.customer_id = b.customer_id
+    LEFT JOIN province_map m ON m.raw = c.province
+    WHERE {where}
+    GROUP BY 1, 2, 3
+"""
+
+def refresh_sales_rollup(since=None):
+    """Rebuild sales_rollup_daily from `since` (a date) onward; None rebuilds all history.
+    
+    Item subtotals are scaled by final/total so per-category revenue sums to the net bill amount.
+    """
+    since = since or dt.date(1900, 1, 1)
+    run_transaction([
+        ("DELETE FROM sales_rollup_daily WHERE sale_day >= :since", {"since": since}),
+        (SALES_ROLLUP_SQL.format(where="b.sale_date >= :since"), {"since": since}),
+    ])
+
+def refresh_funnel_rollup(since=None):
+    """Rebuild funnel_rollup_monthly (leads, registers, paid bills) from the month of `since` onward."""
+    since = (since or dt.date(1900, 1, 1)).replace(day=1)
+    run_transaction([
+        ("DELETE FROM funnel_rollup_monthly WHERE month_year >= :m", {"m": since.strftime('%Y-%m')}),
+        # Frozen ROI months depend on these rows
+        ("DELETE FROM channel_roi_monthly WHERE month_year >= :m", {"m": since.strftime('%Y-%m')}),
+        (FUNNEL_ROLLUP_SQL.format(where="day >= :d"), {"d": since}),
+    ])
+
+def sync_province_map():
+    """Resolve customers.province spellings not yet in province_map to a canonical province and region."""
+    df = run_query("""
+        SELECT DISTINCT c.province AS raw FROM customers c
+        WHERE COALESCE(c.province, '') <> ''
+          AND NOT EXISTS (SELECT 1 FROM province_map m WHERE m.raw = c.province)
+    """)
+    if df.empty:
+        return
+    fixed = [normalize_province(v) for v in df['raw']]
+    run_query("""
+        INSERT INTO province_map (raw, province, region)
+        SELECT * FROM unnest(CAST(:raw AS TEXT[]), CAST(:prov AS TEXT[]), CAST(:reg AS TEXT[]))
+        ON CONFLICT (raw) DO UPDATE SET province = EXCLUDED.province, region = EXCLUDED.region
+    """, {"raw": df['raw'].tolist(), "prov": fixed, "reg": [region_of(p) for p in fixed]})
+
+def refresh_geo_rollup(since=None):
+    """Rebuild sales_geo_monthly (bills by customer province, through province_map) from the month of `since` onward."""
+    since = (since or dt.date(1900, 1, 1)).replace(day=1)
+    sync_province_map()
+    run_transaction([
+        ("DELETE FROM sales_geo_monthly WHERE month_year >= :m", {"m": since.strftime('%Y-%m')}),
+        (GEO_ROLLUP_SQL.format(where="b.sale_date >= :d"), {"d": since}),
+    ])
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_geo_rollup(sales_version):
+    """Whole monthly province rollup; small (months x 77 provinces), so the report slices it in memory."""
+    return run_query("SELECT month_year, province, region, bill_count, customer_count, revenue FROM sales_geo_monthly")
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_customer_base_by_province(sales_version):
+    """Registered customers per canonical province/region (where the audience for an event lives)."""
+    return run_query("""
+        SELECT COALESCE(m.province, '-') AS province, COALESCE(m.region, '-') AS region, COUNT(*) AS customers
+        FROM customers c LEFT JOIN province_map m ON m.raw = c.province
+        GROUP BY 1, 2
+    """)
+
+@st.cache_resource
+def _sales_version():
+    """Process-wide counter bumped whenever the sales rollup changes; keys in-memory sales caches."""
+    return {"v": 0}
+
+def get_sales_version():
+    return _sales_version()["v"]
+
+def refresh_marketing_rollups(since=None):
+    refresh_sales_rollup(since)
+    refresh_funnel_rollup(since)
+    refresh_geo_rollup(since)
+    load_funnel_rollup.clear()
+    get_channel_roi.clear()
+    _sales_version()["v"] += 1
+
+def apply_sales_to_rollups(bill_ids):
+    """After checkout: re-roll only the slices the new bills fall in, in one transaction.
+    
+    That is the bill's day and channel in sales_rollup_daily, its month and channel in
+    funnel_rollup_monthly (plus a frozen channel_roi_monthly row, if any), and its month and province
+    in sales_geo_monthly. Whole-month rebuilds are left to the daily job.
+    """
+    sync_province_map()
+    keys = run_query("""
+        SELECT DISTINCT b.sale_date::date AS day, COALESCE(b.sale_channel, '-') AS channel, COALESCE(m.province, '-') AS province
+        FROM bills b
+        LEFT JOIN customers c ON c.customer_id = b.customer_id
+        LEFT JOIN province_map m ON m.raw = c.province
+        WHERE b.bill_id = ANY(CAST(:ids AS TEXT[]))
+    """, {"ids": list(bill_ids)})
+    if keys.empty:
+        return
+    statements = []
+    for day, channel in keys[['day', 'channel']].drop_duplicates().itertuples(index=False):
+        p = {"s": day, "e": day + timedelta(days=1), "ch": channel}
+        statements += [
+            ("DELETE FROM sales_rollup_daily WHERE sale_day = :s AND channel = :ch", p),
+            (SALES_ROLLUP_SQL.format(where="b.sale_date >= :s AND b.sale_date < :e AND COALESCE(b.sale_channel, '-') = :ch"), p),
+        ]
+    keys['month'] = keys['day'].map(lambda d: d.replace(day=1))
+    next_month = lambda m: (m + timedelta(days=32)).replace(day=1)
+    # Funnel slices read sales_rollup_daily, so they come after the daily slices above
+    for month, channel in keys[['month', 'channel']].drop_duplicates().itertuples(index=False):
+        p = {"m": month.strftime('%Y-%m'), "s": month, "e": next_month(month), "ch": channel}
+        statements += [
+            ("DELETE FROM funnel_rollup_monthly WHERE month_year = :m AND channel = :ch", p),
+            ("DELETE FROM channel_roi_monthly WHERE month_year = :m AND channel = :ch", p),
+            (FUNNEL_ROLLUP_SQL.format(where="day >= :s AND day < :e AND channel = :ch"), p),
+        ]
+    for month, province in keys[['month', 'province']].drop_duplicates().itertuples(index=False):
+        p = {"m": month.strftime('%Y-%m'), "s": month, "e": next_month(month), "p": province}
+        statements += [
+            ("DELETE FROM sales_geo_monthly WHERE month_year = :m AND province = :p", p),
+            (GEO_ROLLUP_SQL.format(where="b.sale_date >= :s AND b.sale_date < :e AND COALESCE(m.province, '-') = :p"), p),
+        ]
+    run_transaction(statements)
+    load_funnel_rollup.clear()
+    get_channel_roi.clear()
+    _sales_version()["v"] += 1
+
+def refresh_recent_rollups():
+    """Daily job: re-roll the previous and current month (full rebuild on first run)."""
+    is_empty = run_query("""
+        SELECT NOT EXISTS (SELECT 1 FROM sales_rollup_daily) OR NOT EXISTS (SELECT 1 FROM sales_geo_monthly) AS empty
+    """)['empty'][0]
+    prev_month = (datetime.now().date().replace(day=1) - timedelta(days=1)).replace(day=1)
+    refresh_marketing_rollups(None if is_empty else prev_month)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_funnel_rollup():
+    """Whole monthly funnel rollup (months x channels x categories), filtered in memory by the page."""
+    return run_query("""
+        SELECT f.month_year, f.channel, f.cat_id, COALESCE(c.cat_name, '-') AS cat_name,
+               f.leads, f.registers, f.paid_bills, f.revenue
+        FROM funnel_rollup_monthly f
+        LEFT JOIN categories c ON f.cat_id = c.cat_id
+    """)
+
+# Channel ROI per month: funnel rollup + ad_spend + marketing_config forecasts
+CHANNEL_ROI_SQL = """
+    WITH f AS (
+        SELECT channel, SUM(leads) AS leads, SUM(registers) AS registers,
+               SUM(paid_bills) AS paid_bills, SUM(revenue) AS revenue
+        FROM funnel_rollup_monthly WHERE month_year = :m GROUP BY channel
+    ), s AS (
+        SELECT channel, amount FROM ad_spend WHERE month_year = :m
+    ), fc AS (
+        SELECT channel, SUM(chan_forecast_amount) AS forecast
+        FROM marketing_config WHERE month_year = :m GROUP BY channel
+    ), ch AS (
+        SELECT channel FROM f UNION SELECT channel FROM s UNION SELECT channel FROM fc
+    )
+    SELECT CAST(:m AS TEXT) AS month_year, ch.channel, COALESCE(s.amount, 0) AS ad_spend,
+           COALESCE(fc.forecast, 0) AS forecast_amount, COALESCE(f.revenue, 0) AS revenue,
+           COALESCE(f.leads, 0) AS leads, COALESCE(f.registers, 0) AS registers,
+           COALESCE(f.paid_bills, 0) AS paid_bills,
+           f.revenue / NULLIF(s.amount, 0) AS roas,
+           s.amount / NULLIF(f.registers, 0) AS cost_per_register
+    FROM ch
+    LEFT JOIN f ON f.channel = ch.channel
+    LEFT JOIN s ON s.channel = ch.channel
+    LEFT JOIN fc ON fc.channel = ch.channel
+"""
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_channel_roi(month_year):
+    """ROI rows for a month; finished months are computed once and frozen in channel_roi_monthly."""
+    if month_year >= datetime.now().strftime('%Y-%m'):
+        return run_query(CHANNEL_ROI_SQL, {"m": month_year})
+    df = run_query("SELECT * FROM channel_roi_monthly WHERE month_year = :m", {"m": month_year})
+    if df.empty:
+        run_query(f"""
+            INSERT INTO channel_roi_monthly (month_year, channel, ad_spend, forecast_amount, revenue,
+                                             leads, registers, paid_bills, roas, cost_per_register)
+            {CHANNEL_ROI_SQL}
+            ON CONFLICT (month_year, channel) DO NOTHING
+        """, {"m": month_year})
+        df = run_query("SELECT * FROM channel_roi_monthly WHERE month_year = :m", {"m": month_year})
+    return df
+
+# Campaign attribution: bills match a campaign by date window, sale_channel and (optionally) category
+CAMPAIGN_MATCH_SQL = """
+    b.sale_date::date BETWEEN c.start_date AND c.end_date
+    AND (cardinality(c.channels) = 0 OR b.sale_channel = ANY(c.channels))
+    AND (cardinality(c.cat_ids) = 0 OR EXISTS (
+        SELECT 1 FROM bill_items bi JOIN products p ON bi.product_id = p.product_id
+        WHERE bi.bill_id = b.bill_id AND p.cat_id = ANY(c.cat_ids)))
+"""
+
+def attribute_campaign_bills(campaign_id=None, bill_ids=None):
+    """Assign bills to campaigns.
+    
+    With campaign_id, that campaign is re-attributed over all bills (after it is created or edited).
+    With bill_ids, just those bills are attributed (sales replayed by the checkout queue keep the
+    cashier's sale_date, which can be older than the watermark); the watermark is left alone.
+    Without it, only bills since the last watermark are scanned; a one-day overlap catches late
+    commits and ON CONFLICT keeps the pass idempotent. Stats are refreshed only for campaigns that
+    gained bills, plus running campaigns (their lead and registration counts still move).
+    """
+    if campaign_id is not None:
+        run_transaction([
+            ("DELETE FROM campaign_bills WHERE campaign_id = :cid", {"cid": campaign_id}),
+            (f"""
+                INSERT INTO campaign_bills (campaign_id, bill_id, revenue, sale_date)
+                SELECT c.campaign_id, b.bill_id, b.final_amount, b.sale_date
+                FROM bills b JOIN campaigns c ON {CAMPAIGN_MATCH_SQL}
+                WHERE c.campaign_id = :cid
+            """, {"cid": campaign_id}),
+        ])
+        touched = [campaign_id]
+    elif bill_ids is not None:
+        added = run_query(f"""
+            INSERT INTO campaign_bills (campaign_id, bill_id, revenue, sale_date)
+            SELECT c.campaign_id, b.bill_id, b.final_amount, b.sale_date
+            FROM bills b JOIN campaigns c ON {CAMPAIGN_MATCH_SQL}
+            WHERE b.bill_id = ANY(CAST(:ids AS TEXT[]))
+            ON CONFLICT (campaign_id, bill_id) DO NOTHING
+            RETURNING campaign_id
+        """, {"ids": list(bill_ids)})
+        touched = sorted(set(added['campaign_id'].tolist()))
+    else:
+        wm = run_query("SELECT watermark FROM job_runs WHERE job_name = 'campaign_attribution'")
+        since = dt.datetime(1900, 1, 1)
+        if not wm.empty and pd.notnull(wm['watermark'][0]):
+            since = pd.to_datetime(wm['watermark'][0]).to_pydatetime() - timedelta(days=1)
+        new_wm = run_query("SELECT MAX(sale_date) AS wm FROM bills")['wm'][0]
+        added = run_query(f"""
+            INSERT INTO campaign_bills (campaign_id, bill_id, revenue, sale_date)
+            SELECT c.campaign_id, b.bill_id, b.final_amount, b.sale_date
+            FROM bills b JOIN campaigns c ON {CAMPAIGN_MATCH_SQL}
+            WHERE b.sale_date >= :since
+            ON CONFLICT (campaign_id, bill_id) DO NOTHING
+            RETURNING campaign_id
+        """, {"since": since})
+        running = run_query("SELECT campaign_id FROM campaigns WHERE end_date >= :d", {"d": since.date()})
+        touched = sorted(set(added['campaign_id'].tolist()) | set(running['campaign_id'].tolist()))
+        if pd.notnull(new_wm):
+            run_query("""
+                INSERT INTO job_runs (job_name, watermark) VALUES ('campaign_attribution', :wm)
+                ON CONFLICT (job_name) DO UPDATE SET watermark = EXCLUDED.watermark
+            """, {"wm": new_wm})
+    refresh_campaign_stats(touched)
+
+def refresh_campaign_stats(campaign_ids):
+    """Per-campaign revenue, bills, customers, leads, registrations and conversion for `campaign_ids`, in one grouped pass."""
+    campaign_ids = [int(c) for c in campaign_ids]
+    if not campaign_ids:
+        return
+    run_transaction([
+        ("DELETE FROM campaign_stats WHERE campaign_id = ANY(CAST(:ids AS INTEGER[]))", {"ids": campaign_ids}),
+        ("""
+            INSERT INTO campaign_stats (campaign_id, revenue, bills, customers, leads, registers, conversion)
+            SELECT c.campaign_id, COALESCE(cb.revenue, 0), COALESCE(cb.bills, 0), COALESCE(cb.customers, 0),
+                   COALESCE(l.leads, 0), COALESCE(r.registers, 0),
+                   cb.bills::float / NULLIF(l.leads, 0)
+            FROM campaigns c
+            LEFT JOIN (
+                SELECT cb.campaign_id, SUM(cb.revenue) AS revenue, COUNT(*) AS bills,
+                       COUNT(DISTINCT b.customer_id) AS customers
+                FROM campaign_bills cb JOIN bills b ON b.bill_id = cb.bill_id
+                WHERE cb.campaign_id = ANY(CAST(:ids AS INTEGER[]))
+                GROUP BY cb.campaign_id
+            ) cb ON cb.campaign_id = c.campaign_id
+            LEFT JOIN LATERAL (
+                SELECT SUM(dl.lead_count) AS leads FROM daily_leads dl
+                WHERE dl.lead_date BETWEEN c.start_date AND c.end_date
+                  AND (cardinality(c.channels) = 0 OR dl.channel = ANY(c.channels))
+                  AND (cardinality(c.cat_ids) = 0 OR dl.cat_id = ANY(c.cat_ids))
+            ) l ON TRUE
+            LEFT JOIN LATERAL (
+                SELECT SUM(dr.reg_count) AS registers FROM daily_registers dr
+                WHERE dr.reg_date BETWEEN c.start_date AND c.end_date
+                  AND (cardinality(c.channels) = 0 OR dr.channel = ANY(c.channels))
+                  AND (cardinality(c.cat_ids) = 0 OR dr.cat_id = ANY(c.cat_ids))
+            ) r ON TRUE
+            WHERE c.campaign_id = ANY(CAST(:ids AS INTEGER[]))
+        """, {"ids": campaign_ids}),
+    ])
+
+# Events: stats stop changing EVENT_FREEZE_DAYS after the event (late closes included)
+EVENT_TYPES = ["Openhouse", "โรงเรียนอนุบาล", "Fair / บูธ", "Workshop", "พบผู้ปกครอง", "อื่นๆ"]
+EVENT_FREEZE_DAYS = 30
+
+def refresh_event_stats(event_ids=None):
+    """Aggregate leads, registrations, closes and revenue per event in one grouped query.
+    
+    Runs as a daily job over every unfrozen event, and for `event_ids` only after a sale, lead entry or edit
+    for those events. Events older than EVENT_FREEZE_DAYS are frozen and skipped on later runs.
+    """
+    if event_ids is not None:
+        event_ids = sorted({int(e) for e in event_ids if e is not None and not pd.isna(e)})
+        if not event_ids:
+            return
+    run_query("""
+        INSERT INTO event_stats (event_id, leads, registers, closes, revenue, frozen, refreshed_at)
+        SELECT e.event_id, COALESCE(l.leads, 0), COALESCE(r.registers, 0), COALESCE(b.closes, 0), COALESCE(b.revenue, 0),
+               e.event_date < CURRENT_DATE - :freeze, CURRENT_TIMESTAMP
+        FROM events e
+        LEFT JOIN (SELECT event_id, SUM(lead_count) AS leads FROM daily_leads WHERE event_id > 0 GROUP BY event_id) l
+               ON l.event_id = e.event_id
+        LEFT JOIN (SELECT event_id, SUM(reg_count) AS registers FROM daily_registers WHERE event_id > 0 GROUP BY event_id) r
+               ON r.event_id = e.event_id
+        LEFT JOIN (SELECT event_id, COUNT(*) AS closes, SUM(final_amount) AS revenue FROM bills
+                   WHERE event_id IS NOT NULL GROUP BY event_id) b
+               ON b.event_id = e.event_id
+        WHERE NOT EXISTS (SELECT 1 FROM event_stats s WHERE s.event_id = e.event_id AND s.frozen)
+          AND (CAST(:ids AS INTEGER[]) IS NULL OR e.event_id = ANY(CAST(:ids AS INTEGER[])))
+        ON CONFLICT (event_id) DO UPDATE SET
+            leads = EXCLUDED.leads, registers = EXCLUDED.registers, closes = EXCLUDED.closes,
+            revenue = EXCLUDED.revenue, frozen = EXCLUDED.frozen, refreshed_at = EXCLUDED.refreshed_at
+    """, {"freeze": EVENT_FREEZE_DAYS, "ids": event_ids})
+
+def forecast_events(df_events):
+    """Forecast leads/registrations/closes/revenue for upcoming events from past events of the same type.
+    
+    Uses per-type means (falling back to all past events) and is computed with grouped pandas ops.
+    """
+    today = datetime.now().date()
+    past = df_events[(df_events['event_date'] < today) & (df_events['leads'] > 0)]
+    upcoming = df_events[df_events['event_date'] >= today].copy()
+    if past.empty or upcoming.empty:
+        return upcoming.assign(f_leads=None, f_registers=None, f_closes=None, f_revenue=None)
+    
+    def rates(g):
+        return pd.DataFrame({
+            'avg_leads': g['leads'].mean(),
+            'reg_rate': g['registers'].sum() / g['leads'].sum(),
+            'close_rate': g['closes'].sum() / g['leads'].sum(),
+            'rev_per_close': g['revenue'].sum() / g['closes'].sum().clip(lower=1),
+        })
+    by_type = rates(past.groupby('event_type')).reset_index()
+    overall = rates(past.assign(_all=1).groupby('_all')).iloc[0]
+    
+    upcoming = upcoming.merge(by_type, on='event_type', how='left')
+    for col in ['avg_leads', 'reg_rate', 'close_rate', 'rev_per_close']:
+        upcoming[col] = upcoming[col].fillna(overall[col])
+    upcoming['f_leads'] = upcoming['avg_leads'].round()
+    upcoming['f_registers'] = (upcoming['f_leads'] * upcoming['reg_rate']).round()
+    upcoming['f_closes'] = (upcoming['f_leads'] * upcoming['close_rate']).round()
+    upcoming['f_revenue'] = upcoming['f_closes'] * upcoming['rev_per_close']
+    return upcoming
+
+# Monthly goal tiers
+GOAL_TIERS = [('high', '🥇 High'), ('mid', '🥈 Mid'), ('low', '🥉 Low')]
+
+def recent_months(n=12, today=None):
+    """The last `n` calendar months as 'YYYY-MM', newest first (stepping by month, so none is skipped)."""
+    today = today or datetime.now().date()
+    start = today.year * 12 + today.month - 1
+    return [f"{(start - i) // 12:04d}-{(start - i) % 12 + 1:02d}" for i in range(n)]
+
+@st.cache_data(show_spinner=False, max_entries=24)
+def compute_goal_progress(month_year, as_of, sales_version):
+    """Month-to-date actuals vs the high/mid/low tiers, with pacing and a category/team split.
+    
+    Cached in memory per (month, day, sales_version), so it is only recomputed after a bill lands
+    (or goals change, which clears the cache).
+    """
+    goals = run_query("SELECT * FROM monthly_goals WHERE month_year = :m", {"m": month_year})
+    month_start = dt.datetime.strptime(month_year, '%Y-%m').date()
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    days_in_month = (next_month - month_start).days
+    days_elapsed = min(max((as_of - month_start).days + 1, 0), days_in_month)
+    
+    df_cat = run_query("""
+        SELECT r.cat_id, COALESCE(c.cat_name, '-') AS cat_name, SUM(r.revenue) AS actual,
+               COALESCE(MAX(w.mkt_weight), 70) AS mkt_weight, COALESCE(MAX(w.sale_weight), 30) AS sale_weight
+        FROM sales_rollup_daily r
+        LEFT JOIN categories c ON c.cat_id = r.cat_id
+        LEFT JOIN category_team_weights w ON w.cat_id = r.cat_id AND w.month_year = :m
+        WHERE r.sale_day >= :s AND r.sale_day < :e
+        GROUP BY r.cat_id, c.cat_name
+        ORDER BY actual DESC
+    """, {"m": month_year, "s": month_start, "e": next_month})
+    
+    actual = float(df_cat['actual'].sum()) if not df_cat.empty else 0.0
+    projected = actual / days_elapsed * days_in_month if days_elapsed else 0.0
+    days_left = days_in_month - days_elapsed
+    
+    if not df_cat.empty:
+        weight_sum = (df_cat['mkt_weight'] + df_cat['sale_weight']).replace(0, 100)
+        df_cat['mkt_actual'] = df_cat['actual'] * df_cat['mkt_weight'] / weight_sum
+        df_cat['sale_actual'] = df_cat['actual'] * df_cat['sale_weight'] / weight_sum
+        df_cat['projected'] = df_cat['actual'] / days_elapsed * days_in_month if days_elapsed else 0.0
+    
+    tiers = []
+    if not goals.empty:
+        g = goals.iloc[0]
+        high = float(g['high_target'] or 0)
+        targets = {
+            'high': high,
+            'mid': float(g['mid_target']) if pd.notnull(g['mid_target']) else high * float(g['mid_pct'] or 75) / 100,
+            'low': float(g['low_target']) if pd.notnull(g['low_target']) else high * float(g['low_pct'] or 50) / 100,
+        }
+        for key, label in GOAL_TIERS:
+            target = targets[key]
+            tiers.append({
+                "tier": label,
+                "target": target,
+                "actual_pct": actual / target * 100 if target else None,
+                "projected_pct": projected / target * 100 if target else None,
+                "gap": max(target - actual, 0),
+                "need_per_day": max(target - actual, 0) / days_left if days_left else None,
+                "on_pace": projected >= target,
+            })
+    
+    return {
+        "actual": actual, "projected": projected, "days_elapsed": days_elapsed, "days_in_month": days_in_month,
+        "tiers": pd.DataFrame(tiers), "categories": df_cat,
+    }
+
+# Commission: (minimum attainment %, commission rate % of net sales); the highest tier reached applies
+COMMISSION_TIERS = [(0, 0.0), (50, 1.0), (80, 2.0), (100, 3.0), (120, 4.0)]
+
+COMMISSION_SQL = """
+    WITH sales AS (
+        SELECT seller_id AS emp_id, COUNT(*) AS bill_count, SUM(final_amount) AS gross_sales
+        FROM bills
+        WHERE sale_date >= :s AND sale_date < :e AND seller_id IS NOT NULL
+        GROUP BY seller_id
+    ), claw AS (
+        SELECT b.seller_id AS emp_id, SUM(r.refund_amount) AS clawback
+        FROM refund_requests r
+        JOIN bills b ON b.bill_id = r.bill_id
+        WHERE r.status = 'approved' AND b.seller_id IS NOT NULL
+          AND COALESCE(r.updated_at, r.created_at) >= :s AND COALESCE(r.updated_at, r.created_at) < :e
+        GROUP BY b.seller_id
+    ), tiers AS (
+        SELECT * FROM unnest(CAST(:tier_min AS REAL[]), CAST(:tier_rate AS REAL[])) AS t(min_pct, rate)
+    ), scored AS (
+        SELECT e.emp_id, e.emp_name,
+               COALESCE(g.target_amount, 0) AS target,
+               COALESCE(sa.bill_count, 0) AS bill_count,
+               COALESCE(sa.gross_sales, 0) AS gross_sales,
+               COALESCE(c.clawback, 0) AS clawback,
+               COALESCE(sa.gross_sales, 0) - COALESCE(c.clawback, 0) AS net_sales,
+               CASE WHEN g.target_amount > 0
+                    THEN (COALESCE(sa.gross_sales, 0) - COALESCE(c.clawback, 0)) / g.target_amount * 100 END AS attainment
+        FROM employees e
+        LEFT JOIN sales sa ON sa.emp_id = e.emp_id
+        LEFT JOIN claw c ON c.emp_id = e.emp_id
+        LEFT JOIN individual_goals g ON g.emp_id = e.emp_id AND g.month_year = :m
+        WHERE sa.emp_id IS NOT NULL OR c.emp_id IS NOT NULL OR g.target_amount > 0
+    )
+    SELECT sc.*, COALESCE(t.rate, 0) AS rate, GREATEST(sc.net_sales, 0) * COALESCE(t.rate, 0) / 100 AS commission
+    FROM scored sc
+    LEFT JOIN LATERAL (
+        SELECT rate FROM tiers WHERE min_pct <= COALESCE(sc.attainment, 0) ORDER BY min_pct DESC LIMIT 1
+    ) t ON TRUE
+"""
+
+def _commission_params(month_year):
+    month_start = dt.datetime.strptime(month_year, '%Y-%m').date()
+    return {
+        "m": month_year, "s": month_start, "e": (month_start + timedelta(days=32)).replace(day=1),
+        "tier_min": [float(t[0]) for t in COMMISSION_TIERS], "tier_rate": [float(t[1]) for t in COMMISSION_TIERS],
+    }
+
+def get_commission_report(month_year):
+    """Per-seller attainment, tiered commission and refund clawbacks for a month.
+    
+    Refunds are clawed back in the month they are approved. The open month is computed live;
+    a closed month is frozen into commission_snapshots the first time it is read and served from there.
+    """
+    if month_year >= datetime.now().strftime('%Y-%m'):
+        return run_query(COMMISSION_SQL + " ORDER BY commission DESC, net_sales DESC", _commission_params(month_year)), False
+    
+    df = run_query("SELECT * FROM commission_snapshots WHERE month_year = :m ORDER BY commission DESC, net_sales DESC", {"m": month_year})
+    if df.empty:
+        run_query(f"""
+            INSERT INTO commission_snapshots (month_year, emp_id, emp_name, target, bill_count, gross_sales, clawback, net_sales, attainment, rate, commission)
+            SELECT :m, emp_id, emp_name, target, bill_count, gross_sales, clawback, net_sales, attainment, rate, commission
+            FROM ({COMMISSION_SQL}) x
+            ON CONFLICT (month_year, emp_id) DO NOTHING
+        """, _commission_params(month_year))
+        df = run_query("SELECT * FROM commission_snapshots WHERE month_year = :m ORDER BY commission DESC, net_sales DESC", {"m": month_year})
+    return df, True
+
+# Revenue forecast (additive Holt-Winters with a weekly season, falls back to seasonal naive)
+FORECAST_SEASON = 7
+
+def _holt_winters_sse(y, alpha, beta, gamma, m=FORECAST_SEASON):
+    level = y[:m].mean()
+    trend = (y[m:2 * m].mean() - y[:m].mean()) / m
+    season = y[:m] - level
+    sse = 0.0
+    for t in range(m, len(y)):
+        s_i = t % m
+        err = y[t] - (level + trend + season[s_i])
+        sse += err * err
+        prev_level = level
+        level = alpha * (y[t] - season[s_i]) + (1 - alpha) * (level + trend)
+        trend = beta * (level - prev_level) + (1 - beta) * trend
+        season[s_i] = gamma * (y[t] - level) + (1 - gamma) * season[s_i]
+    return sse, level, trend, season
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def fit_revenue_forecast(as_of):
+    """Fit the daily revenue model on complete days before `as_of`; cached so it refits once per day."""
+    df = run_query("""
+        SELECT sale_day, SUM(revenue) AS revenue
+        FROM sales_rollup_daily
+        WHERE sale_day >= :s AND sale_day < :e
+        GROUP BY sale_day
+    """, {"s": as_of - timedelta(days=364), "e": as_of})
+    if df.empty:
+        return None
+    
+    days = pd.date_range(as_of - timedelta(days=364), as_of - timedelta(days=1), freq='D').date
+    series = df.set_index('sale_day')['revenue'].astype(float).reindex(days, fill_value=0.0)
+    nonzero = series.to_numpy().nonzero()[0]
+    if len(nonzero) == 0:
+        return None
+    y = series.to_numpy()[nonzero[0]:]
+    m = FORECAST_SEASON
+    start = as_of - timedelta(days=len(y))
+    
+    if len(y) < 4 * m:
+        # Seasonal naive: mean of the same weekday over the last few weeks
+        pad = (-len(y)) % m
+        weeks = np.concatenate([np.full(pad, np.nan), y]).reshape(-1, m)[-4:]
+        season = np.nan_to_num(np.nanmean(weeks, axis=0))
+        return {"method": "seasonal_naive", "start": start - timedelta(days=pad), "n": len(y) + pad, "level": 0.0, "trend": 0.0,
+                "season": season.tolist(), "sigma": float(np.std(y)) if len(y) else 0.0}
+    
+    best = None
+    for alpha in (0.05, 0.1, 0.2, 0.3, 0.5):
+        for beta in (0.0, 0.01, 0.05):
+            for gamma in (0.05, 0.1, 0.2, 0.3):
+                sse, level, trend, season = _holt_winters_sse(y, alpha, beta, gamma)
+                if best is None or sse < best[0]:
+                    best = (sse, level, trend, season.copy(), alpha, beta, gamma)
+    sse, level, trend, season, alpha, beta, gamma = best
+    return {"method": "holt_winters", "start": start, "n": len(y), "level": float(level), "trend": float(trend),
+            "season": season.tolist(), "sigma": float(np.sqrt(sse / max(len(y) - m, 1))),
+            "alpha": alpha, "beta": beta, "gamma": gamma}
+
+def forecast_revenue(model, horizon):
+    """Daily revenue forecast for the `horizon` days starting at the day the model was fitted up to."""
+    if model is None or horizon <= 0:
+        return pd.DataFrame(columns=['date', 'forecast', 'low', 'high'])
+    m = FORECAST_SEASON
+    h = np.arange(1, horizon + 1)
+    season = np.asarray(model['season'])[(model['n'] + h - 1) % m]
+    yhat = np.maximum(model['level'] + model['trend'] * h + season, 0)
+    band = 1.28 * model['sigma'] * np.sqrt(h / m + 1)
+    first_day = model['start'] + timedelta(days=model['n'])
+    return pd.DataFrame({
+        'date': pd.date_range(first_day, periods=horizon, freq='D').date,
+        'forecast': yhat, 'low': np.maximum(yhat - band, 0), 'high': yhat + band,
+    })
+
+# Co-purchase index ("customers who bought X also bought Y")
+COPURCHASE_TOP_K = 5
+
+@st.cache_resource
+def _copurchase_index():
+    """Process-wide sparse co-occurrence counts kept in memory and grown incrementally."""
+    return {
+        "pairs": pd.Series(dtype=float),        # (product_a, product_b) -> bills containing both
+        "bills": pd.Series(dtype=float),        # product_id -> bills containing it
+        "top_k": {},                            # product_id -> [(product_id, bills_together, confidence), ...]
+        "watermark": 0,                         # last bill_items.item_id counted
+        "lock": threading.Lock(),
+    }
+
+def _co_counts(df):
+    """Pair counts and per-product bill counts from distinct (bill_id, product_id) rows."""
+    df = df[['bill_id', 'product_id']].drop_duplicates()
+    pairs = df.merge(df, on='bill_id', suffixes=('_a', '_b'))
+    pairs = pairs[pairs['product_id_a'] != pairs['product_id_b']]
+    return (pairs.groupby(['product_id_a', 'product_id_b']).size().astype(float),
+            df.groupby('product_id').size().astype(float))
+
+def update_copurchase_index():
+    """Fold bill_items added since the last call into the co-purchase index."""
+    idx = _copurchase_index()
+    with idx["lock"]:
+        df = run_query("""
+            SELECT bi.item_id, bi.bill_id, bi.product_id
+            FROM bill_items bi
+            WHERE bi.bill_id IN (SELECT bill_id FROM bill_items WHERE item_id > :w)
+              AND bi.product_id > 0
+        """, {"w": idx["watermark"]})
+        if df.empty:
+            return
+        # Bills that already had items counted: add only the pairs their new items create
+        new_pairs, new_bills = _co_counts(df)
+        old = df[df['item_id'] <= idx["watermark"]]
+        if not old.empty:
+            old_pairs, old_bills = _co_counts(old)
+            new_pairs = new_pairs.sub(old_pairs, fill_value=0)
+            new_bills = new_bills.sub(old_bills, fill_value=0)
+        if idx["pairs"].empty:
+            idx["pairs"], idx["bills"] = new_pairs, new_bills
+        else:
+            idx["pairs"] = idx["pairs"].add(new_pairs, fill_value=0)
+            idx["bills"] = idx["bills"].add(new_bills, fill_value=0)
+        idx["watermark"] = int(df['item_id'].max())
+        
+        # Refresh the top-K lists only for products whose counts moved
+        touched = new_pairs[new_pairs != 0].index.get_level_values(0).unique()
+        sub = idx["pairs"][idx["pairs"].index.get_level_values(0).isin(touched)]
+        top_k = idx["top_k"]
+        for pid_a, grp in sub.groupby(level=0):
+            best = grp.nlargest(COPURCHASE_TOP_K)
+            total = idx["bills"].get(pid_a, 0) or 1
+            top_k[int(pid_a)] = [(int(b), int(n), n / total) for (_, b), n in best.items() if n > 0]
+
+def get_also_bought(product_ids, k=COPURCHASE_TOP_K):
+    """Top-K products most often bought with any of `product_ids` (excluding them); dictionary lookups only."""
+    top_k = _copurchase_index()["top_k"]
+    in_cart = set(product_ids)
+    scores = {}
+    for pid in in_cart:
+        for other, together, confidence in top_k.get(pid, []):
+            if other not in in_cart:
+                prev = scores.get(other, (0, 0.0))
+                scores[other] = (prev[0] + together, max(prev[1], confidence))
+    return sorted(scores.items(), key=lambda x: (x[1][1], x[1][0]), reverse=True)[:k]
+
+# Customer activity timeline (one UNION ALL, keyset-paginated on (ts, kind, ref))
+TIMELINE_PAGE_SIZE = 25
+# Every branch names all of these, so any single kind can run on its own
+TIMELINE_COLUMNS = ['ts', 'kind', 'ref', 'title', 'detail', 'amount', 'actor', 'payment_method', 'sale_channel', 'follow_up_date']
+TIMELINE_SOURCES = {  # kind -> (select filtered to one customer, ts column, ref column)
+    'bill': ("""
+        SELECT b.sale_date AS ts, 'bill' AS kind, b.bill_id AS ref, '🧾 ซื้อ ' || b.bill_id AS title,
+               (SELECT STRING_AGG(bi.product_name, ', ') FROM bill_items bi WHERE bi.bill_id = b.bill_id) AS detail,
+               b.final_amount AS amount, e.emp_nickname AS actor,
+               b.payment_method AS payment_method, b.sale_channel AS sale_channel, NULL::date AS follow_up_date
+        FROM bills b LEFT JOIN employees e ON e.emp_id = b.seller_id
+        WHERE b.customer_id = :cid
+    """, "b.sale_date", "b.bill_id"),
+    'contact': ("""
+        SELECT cl.contact_date AS ts, 'contact' AS kind, cl.log_id::text AS ref, cl.contact_type AS title,
+               cl.notes AS detail, NULL::real AS amount, e.emp_nickname AS actor,
+               NULL::text AS payment_method, NULL::text AS sale_channel, cl.follow_up_date AS follow_up_date
+        FROM contact_logs cl LEFT JOIN employees e ON e.emp_id = cl.emp_id
+        WHERE cl.customer_id = :cid
+    """, "cl.contact_date", "cl.log_id::text"),
+    'feedback': ("""
+        SELECT f.created_at AS ts, 'feedback' AS kind, f.feedback_id::text AS ref,
+               REPEAT('⭐', f.rating) || ' (' || f.rating || ')' AS title, f.comment AS detail, NULL::real AS amount,
+               NULL::text AS actor, NULL::text AS payment_method, NULL::text AS sale_channel, NULL::date AS follow_up_date
+        FROM customer_feedback f
+        WHERE f.customer_id = :cid
+    """, "f.created_at", "f.feedback_id::text"),
+    'tag': ("""
+        SELECT t.created_at AS ts, 'tag' AS kind, t.tag_id::text AS ref, '🏷️ ' || t.tag_name AS title,
+               NULL::text AS detail, NULL::real AS amount, NULL::text AS actor,
+               NULL::text AS payment_method, NULL::text AS sale_channel, NULL::date AS follow_up_date
+        FROM customer_tags t
+        WHERE t.customer_id = :cid
+    """, "t.created_at", "t.tag_id::text"),
+}
+
+def get_customer_timeline(customer_id, kinds=None, before=None, limit=TIMELINE_PAGE_SIZE):
+    """One page of a customer's bills, contacts, feedback and tags, newest first.
+    
+    `before` is the (ts, kind, ref) of the last row already shown. Each branch is ordered and limited
+    on its (customer_id, ts) index, so a page costs the same however long the history is.
+    """
+    params = {"cid": customer_id, "n": limit}
+    if before is not None:
+        params.update({"ts": before[0], "kind": before[1], "ref": before[2]})
+    branches = []
+    for kind in (kinds or TIMELINE_SOURCES):
+        select_sql, ts_col, ref_col = TIMELINE_SOURCES[kind]
+        if before is not None:
+            select_sql += f" AND {ts_col} <= :ts AND ({ts_col}, '{kind}', {ref_col}) < (:ts, :kind, :ref)"
+        branches.append(f"({select_sql} ORDER BY {ts_col} DESC, {ref_col} DESC LIMIT :n)")
+    return run_query(" UNION ALL ".join(branches) + " ORDER BY ts DESC, kind DESC, ref DESC LIMIT :n", params)
+
+def render_customer_timeline(customer_id, kinds=None, key="all"):
+    """Show the timeline with a 'load more' button; loaded pages live in session_state.
+    
+    Pages are tagged with the sales version, so bills saved anywhere (POS, checkout queue) reload them.
+    """
+    state_key = f"timeline_{key}_{customer_id}"
+    tl = st.session_state.get(state_key)
+    if tl is None or tl["version"] != get_sales_version():
+        page = get_customer_timeline(customer_id, kinds)
+        tl = st.session_state[state_key] = {"rows": page, "done": len(page) < TIMELINE_PAGE_SIZE,
+                                            "version": get_sales_version()}
+    
+    if tl["rows"].empty:
+        st.info("ยังไม่มีกิจกรรม")
+        return
+    # Kind-specific columns (payment / channel for bills, follow-up for contacts) only when present
+    cols = ['ts', 'title', 'detail', 'amount', 'actor'] + [
+        c for c in ('payment_method', 'sale_channel', 'follow_up_date') if tl["rows"][c].notna().any()]
+    st.dataframe(tl["rows"][cols], hide_index=True, use_container_width=True,
+                 column_config={
+                     "ts": st.column_config.DatetimeColumn("วันที่-เวลา", format="DD/MM/YYYY HH:mm"),
+                     "title": "กิจกรรม",
+                     "detail": "รายละเอียด",
+                     "amount": st.column_config.NumberColumn("ยอด", format="฿%,.0f"),
+                     "actor": "พนักงาน",
+                     "payment_method": "ชำระโดย",
+                     "sale_channel": "ช่องทาง",
+                     "follow_up_date": st.column_config.DateColumn("นัดติดตาม", format="DD/MM/YYYY")
+                 })
+    if not tl["done"] and st.button("⬇️ โหลดเพิ่ม", key=f"more_{state_key}", use_container_width=True):
+        last = tl["rows"].iloc[-1]
+        page = get_customer_timeline(customer_id, kinds, before=(last['ts'], last['kind'], last['ref']))
+        tl["rows"] = pd.concat([tl["rows"], page], ignore_index=True)
+        tl["done"] = len(page) < TIMELINE_PAGE_SIZE
+        st.rerun()
+
+def reset_customer_timeline(customer_id):
+    for k in [k for k in st.session_state if str(k).startswith("timeline_") and str(k).endswith(f"_{customer_id}")]:
+        del st.session_state[k]
+
+# Full-text search: in-memory inverted index of character 2/3-grams (Thai has no spaces between words)
+SEARCH_KIND_LABELS = {
+    'customer': '👤 ลูกค้า', 'contact': '📞 บันทึกการติดต่อ', 'feedback': '⭐ Feedback',
+    'employee': '👔 พนักงาน', 'product': '📦 สินค้า',
+}
+SEARCH_SOURCES_SQL = """
+    SELECT 'customer' AS kind, customer_id AS ref, customer_id, full_name AS label,
+           CONCAT_WS(' ', full_name, nickname, phone, line_id, cust_note) AS body
+    FROM customers WHERE customer_id > :w_customer
+    UNION ALL
+    SELECT 'contact', cl.log_id, cl.customer_id, c.full_name, cl.notes
+    FROM contact_logs cl LEFT JOIN customers c ON c.customer_id = cl.customer_id
+    WHERE cl.log_id > :w_contact AND cl.notes IS NOT NULL
+    UNION ALL
+    SELECT 'feedback', f.feedback_id, f.customer_id, c.full_name, f.comment
+    FROM customer_feedback f LEFT JOIN customers c ON c.customer_id = f.customer_id
+    WHERE f.feedback_id > :w_feedback AND f.comment IS NOT NULL
+    UNION ALL
+    SELECT 'employee', emp_id, NULL, emp_name, CONCAT_WS(' ', emp_name, emp_nickname, position)
+    FROM employees WHERE emp_id > :w_employee
+    UNION ALL
+    SELECT 'product', product_id, NULL, product_name, product_name
+    FROM products WHERE product_id > :w_product
+"""
+_SEARCH_SPLIT = re.compile(r"[\s,.;:!?()\[\]{}\"'/\\|+*=<>#@&~-]+")
+_SEARCH_INVISIBLE = re.compile("[\u200b\u200c\u200d\ufeff]")
+
+def _search_chunks(text):
+    text = _SEARCH_INVISIBLE.sub('', unicodedata.normalize('NFC', str(text or ''))).lower()
+    return [c for c in _SEARCH_SPLIT.split(text) if c]
+
+def _search_grams(text, query=False):
+    """Character n-grams per chunk: documents index 2- and 3-grams, queries use 3-grams (or the short chunk)."""
+    grams = Counter()
+    for chunk in _search_chunks(text):
+        if len(chunk) < 3:
+            grams[chunk] += 1
+            if query:
+                continue
+        for n in ((3,) if query else (2, 3)):
+            grams.update(chunk[i:i + n] for i in range(len(chunk) - n + 1))
+    return grams
+
+@st.cache_resource
+def _search_index():
+    """Process-wide inverted index, grown incrementally from id watermarks per source."""
+    return {
+        "docs": {},                                   # (kind, ref) -> {customer_id, label, text, grams}
+        "postings": {},                               # gram -> {(kind, ref): tf}
+        "watermarks": {k: 0 for k in SEARCH_KIND_LABELS},
+        "lock": threading.Lock(),
+    }
+
+def _search_remove(idx, key):
+    doc = idx["docs"].pop(key, None)
+    if doc:
+        for g in doc["grams"]:
+            posting = idx["postings"].get(g)
+            if posting is not None:
+                posting.pop(key, None)
+                if not posting:
+                    del idx["postings"][g]
+
+def update_search_index():
+    """Index rows added since the last call (one query across all sources)."""
+    idx = _search_index()
+    with idx["lock"]:
+        df = run_query(SEARCH_SOURCES_SQL, {f"w_{k}": w for k, w in idx["watermarks"].items()})
+        for kind, ref, customer_id, label, body in df.itertuples(index=False):
+            key = (kind, int(ref))
+            _search_remove(idx, key)
+            grams = _search_grams(body)
+            idx["docs"][key] = {"customer_id": customer_id, "label": label, "text": body or "", "grams": grams}
+            for g, tf in grams.items():
+                idx["postings"].setdefault(g, {})[key] = tf
+        if not df.empty:
+            for kind, max_ref in df.groupby('kind')['ref'].max().items():
+                idx["watermarks"][kind] = int(max_ref)
+
+def invalidate_search_source(kind):
+    """Drop one source from the index after edits/deletes; it is re-read on the next search."""
+    idx = _search_index()
+    with idx["lock"]:
+        for key in [k for k in idx["docs"] if k[0] == kind]:
+            _search_remove(idx, key)
+        idx["watermarks"][kind] = 0
+
+def search_text(query, kinds=None, limit=50, min_score=0.1):
+    """Ranked matches as a DataFrame: score is the IDF-weighted share of query n-grams found in the document."""
+    update_search_index()
+    idx = _search_index()
+    q_grams = _search_grams(query, query=True)
+    n_docs = max(len(idx["docs"]), 1)
+    idf = {g: math.log(1 + n_docs / (len(idx["postings"].get(g, ())) or 1)) for g in q_grams}
+    total = sum(idf.values()) or 1
+    
+    scores = {}
+    for g, w in idf.items():
+        for key, tf in idx["postings"].get(g, {}).items():
+            if kinds is None or key[0] in kinds:
+                scores[key] = scores.get(key, 0) + w * (1 + math.log(tf) / 10)
+    
+    rows = []
+    for key, sc in sorted(scores.items(), key=lambda x: x[1], reverse=True)[:limit]:
+        score = min(sc / total, 1.0)
+        if score < min_score:
+            break
+        doc = idx["docs"][key]
+        # Snippet around the rarest query n-gram present
+        doc_text = doc["text"]
+        hit = max((g for g in q_grams if g in doc["grams"]), key=lambda g: idf[g], default="")
+        pos = doc_text.lower().find(hit) if hit else -1
+        snippet = doc_text[max(pos - 40, 0):pos + 60] if pos >= 0 else doc_text[:100]
+        rows.append({"kind": key[0], "ref": key[1], "customer_id": doc["customer_id"], "label": doc["label"],
+                     "snippet": snippet, "score": score})
+    return pd.DataFrame(rows, columns=["kind", "ref", "customer_id", "label", "snippet", "score"])
+
+# Customer deduplication: normalized blocking keys, pairs only generated inside each block
+DEDUP_NAME_TITLES = ['เด็กชาย', 'เด็กหญิง', 'นางสาว', 'ด.ช.', 'ด.ญ.', 'น.ส.', 'นาง', 'นาย', 'คุณ', 'mrs.', 'mr.', 'ms.', 'miss', 'dr.']
+DEDUP_KEYS = {  # key -> (weight, label)
+    'phone_key': (0.6, 'เบอร์โทร'),
+    'line_key': (0.5, 'LINE'),
+    'name_key': (0.4, 'ชื่อ'),
+    'name_sig': (0.2, 'ชื่อใกล้เคียง'),
+}
+DEDUP_MAX_BLOCK = 50  # larger blocks (e.g. a placeholder phone) are too generic to compare
+# Tables whose rows follow the surviving customer on merge
+CUSTOMER_REF_TABLES = ['bills', 'course_credits', 'contact_logs', 'customer_tags', 'customer_feedback',
+                       'refund_requests', 'sales_history', 'credit_alerts']
+
+def dedup_keys(df):
+    """Vectorized blocking keys for a customers frame: phone, LINE id, name and a tone/vowel-mark-free name."""
+    phone = df['phone'].fillna('').astype(str).map(normalize_phone)
+    
+    line = df['line_id'].fillna('').astype(str).str.lower().str.replace(r'[\s@]', '', regex=True)
+    
+    titles = '|'.join(re.escape(t) for t in DEDUP_NAME_TITLES)
+    name = df['full_name'].fillna('').astype(str).map(lambda x: unicodedata.normalize('NFC', x)).str.lower().str.strip()
+    name = name.str.replace(rf'^(?:{titles})\s*', '', regex=True)
+    name = name.str.replace(r'[\s.\-_\u200b\u200c\u200d\ufeff]', '', regex=True)
+    
+    return pd.DataFrame({
+        'customer_id': df['customer_id'],
+        'phone_key': phone,
+        'line_key': line,
+        'name_key': name,
+        'name_sig': name.str.replace(r'[\u0e31\u0e34-\u0e3a\u0e47-\u0e4e]', '', regex=True),
+    })
+
+def find_duplicate_candidates(df):
+    """Candidate duplicate pairs (id_a < id_b) scored by which blocking keys they share."""
+    keys = dedup_keys(df)
+    pairs = []
+    for key, (weight, label) in DEDUP_KEYS.items():
+        block = keys.loc[keys[key] != '', ['customer_id', key]]
+        sizes = block.groupby(key)['customer_id'].transform('size')
+        block = block[(sizes > 1) & (sizes <= DEDUP_MAX_BLOCK)]
+        m = block.merge(block, on=key, suffixes=('_a', '_b'))
+        m = m[m['customer_id_a'] < m['customer_id_b']]
+        pairs.append(m[['customer_id_a', 'customer_id_b']].assign(weight=weight, reason=label))
+    if not pairs or all(p.empty for p in pairs):
+        return pd.DataFrame(columns=['customer_id_a', 'customer_id_b', 'score', 'reasons'])
+    cand = pd.concat(pairs).groupby(['customer_id_a', 'customer_id_b']).agg(
+        score=('weight', 'sum'), reasons=('reason', ', '.join)).reset_index()
+    cand['score'] = cand['score'].clip(upper=1.0)
+    return cand.sort_values('score', ascending=False)
+
+def find_customer_matches(df, name, phone, line):
+    """Existing customers sharing any blocking key with a new registration."""
+    if df.empty:
+        return df
+    new = dedup_keys(pd.DataFrame({'customer_id': [0], 'full_name': [name], 'phone': [phone], 'line_id': [line]})).iloc[0]
+    keys = dedup_keys(df)
+    hit = pd.Series(False, index=keys.index)
+    for key in DEDUP_KEYS:
+        if new[key]:
+            hit |= keys[key] == new[key]
+    return df[hit.values]
+
+def merge_customers(keep_id, drop_id):
+    """Merge `drop_id` into `keep_id` in one transaction: fill blank fields, move every referencing row, delete the duplicate."""
+    params = {"keep": keep_id, "drop": drop_id}
+    fill_cols = ['nickname', 'phone', 'line_id', 'facebook', 'instagram', 'address_detail', 'province',
+                 'district', 'sub_district', 'zipcode', 'gender', 'marital_status', 'has_children']
+    statements = [(f"""
+        UPDATE customers k SET
+            {', '.join(f"{c} = COALESCE(NULLIF(k.{c}, ''), d.{c})" for c in fill_cols)},
+            birth_date = COALESCE(k.birth_date, d.birth_date),
+            assigned_sales_id = COALESCE(k.assigned_sales_id, d.assigned_sales_id),
+            cust_note = CASE WHEN COALESCE(d.cust_note, '') IN ('', COALESCE(k.cust_note, '')) THEN k.cust_note
+                             ELSE CONCAT_WS(E'\n', NULLIF(k.cust_note, ''), d.cust_note) END
+        FROM customers d
+        WHERE k.customer_id = :keep AND d.customer_id = :drop
+    """, params)]
+    statements += [(f"UPDATE {t} SET customer_id = :keep WHERE customer_id = :drop", params) for t in CUSTOMER_REF_TABLES]
+    statements += [
+        ("""DELETE FROM customer_tags a USING customer_tags b
+            WHERE a.customer_id = :keep AND b.customer_id = :keep AND a.tag_name = b.tag_name AND a.tag_id > b.tag_id""", params),
+        # Derived per-customer rows are rebuilt by the nightly jobs
+        ("DELETE FROM churn_scores WHERE customer_id = :drop", params),
+        ("DELETE FROM customer_actions WHERE customer_id = :drop", params),
+        ("DELETE FROM customers WHERE customer_id = :drop", params),
+    ]
+    run_transaction(statements)
+    for kind in ('customer', 'contact', 'feedback'):
+        invalidate_search_source(kind)
+
+# Bulk customer import (streamed in chunks, validated vectorized, loaded with COPY)
+IMPORT_CHUNK_ROWS = 5000
+IMPORT_COLUMNS = ['full_name', 'nickname', 'phone', 'line_id', 'birth_date', 'gender', 'address_detail',
+                  'province', 'district', 'sub_district', 'zipcode', 'cust_note']
+IMPORT_HEADER_ALIASES = {
+    'ชื่อ-นามสกุล': 'full_name', 'ชื่อ': 'full_name', 'name': 'full_name', 'ชื่อเล่น': 'nickname',
+    'เบอร์โทร': 'phone', 'เบอร์โทรศัพท์': 'phone', 'โทรศัพท์': 'phone', 'tel': 'phone', 'line': 'line_id', 'line id': 'line_id',
+    'วันเกิด': 'birth_date', 'เพศ': 'gender', 'ที่อยู่': 'address_detail', 'จังหวัด': 'province',
+    'อำเภอ': 'district', 'เขต/อำเภอ': 'district', 'ตำบล': 'sub_district', 'แขวง/ตำบล': 'sub_district',
+    'รหัสไปรษณีย์': 'zipcode', 'zip': 'zipcode', 'หมายเหตุ': 'cust_note', 'note': 'cust_note',
+}
+
+def iter_import_chunks(uploaded, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Yield the uploaded CSV/Excel file as string DataFrames of at most `chunk_rows` rows."""
+    if uploaded.name.lower().endswith(('.xlsx', '.xlsm')):
+        from openpyxl import load_workbook
+        ws = load_workbook(uploaded, read_only=True, data_only=True).active
+        rows = ws.iter_rows(values_only=True)
+        header = [str(h or '').strip() for h in next(rows, [])]
+        # Numeric cells (phone 812345678.0, zipcode 10200) are read back as the text that was typed
+        batch = []
+        for row in rows:
+            batch.append([excel_cell_text(v) for v in row])
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    else:
+        yield from pd.read_csv(uploaded, dtype=str, chunksize=chunk_rows, keep_default_na=False, encoding='utf-8-sig')
+
+def validate_import_chunk(chunk, seen):
+    """Normalize one chunk; return (accepted rows, rejected rows with a reason). `seen` holds dedup keys and grows."""
+    df = chunk.rename(columns=lambda c: IMPORT_HEADER_ALIASES.get(str(c).strip().lower(), IMPORT_HEADER_ALIASES.get(str(c).strip(), str(c).strip())))
+    df = df.reindex(columns=IMPORT_COLUMNS).fillna('').astype(str).apply(lambda col: col.str.strip())
+    df = df.replace({'None': '', 'nan': ''})
+    reason = pd.Series('', index=df.index)
+    
+    def reject(mask, msg):
+        reason.loc[mask & (reason == '')] = msg
+    
+    reject(df['full_name'] == '', 'ไม่มีชื่อ')
+    
+    keys = dedup_keys(df.assign(customer_id=0))
+    reject((df['phone'] != '') & (keys['phone_key'] == ''), 'เบอร์โทรไม่ถูกต้อง')
+    df['phone'] = keys['phone_key'].where(keys['phone_key'] != '', df['phone'])
+    
+    # Only exact spellings and aliases ('จ.เชียงใหม่', 'กทม') are rewritten; a fuzzy match is just suggested
+    # in the reject reason. Each distinct value is looked up once.
+    exact = {v: canonical_province(v) or v for v in df['province'].unique() if v}
+    df['province'] = df['province'].map(exact).fillna('')
+    for v in df.loc[(df['province'] != '') & ~df['province'].isin(LOCATION_DATA.keys()), 'province'].unique():
+        guess = normalize_province(v)
+        reject(df['province'] == v, f'จังหวัดไม่ถูกต้อง (หมายถึง {guess}?)' if guess else 'จังหวัดไม่ถูกต้อง')
+    
+    loc = pd.DataFrame([(p, d, z) for p, ds in LOCATION_DATA.items() for d, z in ds.items()], columns=['province', 'district', 'zipcode'])
+    reject((df['district'] != '') & (df['province'] != '') &
+           ~pd.MultiIndex.from_frame(df[['province', 'district']]).isin(pd.MultiIndex.from_frame(loc[['province', 'district']])),
+           'อำเภอไม่อยู่ในจังหวัดนี้')
+    reject((df['zipcode'] != '') & ~df['zipcode'].str.fullmatch(r'\d{5}'), 'รหัสไปรษณีย์ไม่ถูกต้อง')
+    reject((df['zipcode'] != '') & (df['province'] != '') &
+           ~pd.MultiIndex.from_frame(df[['province', 'zipcode']]).isin(pd.MultiIndex.from_frame(loc[['province', 'zipcode']])),
+           'รหัสไปรษณีย์ไม่ตรงกับจังหวัด')
+    # Fill a missing zipcode from a known district
+    fill_zip = df[['province', 'district']].merge(loc, on=['province', 'district'], how='left')['zipcode'].fillna('')
+    df['zipcode'] = df['zipcode'].where(df['zipcode'] != '', fill_zip.values)
+    
+    # Buddhist-era years (e.g. 2530) are converted before parsing
+    births = df['birth_date'].str.replace(r'\b(2[45]\d\d)\b', lambda m: str(int(m.group(1)) - 543), regex=True)
+    # format='mixed': pandas 2 otherwise infers one format from the first value and rejects the rest
+    births = pd.to_datetime(births, errors='coerce', dayfirst=True, format='mixed')
+    reject((df['birth_date'] != '') & births.isna(), 'วันเกิดไม่ถูกต้อง')
+    df['birth_date'] = births.dt.strftime('%Y-%m-%d').fillna('')
+    
+    # Duplicates against existing customers and earlier rows of the file that are still accepted
+    for key in ('phone_key', 'line_key', 'name_key'):
+        k = keys[key]
+        live = k[(k != '') & (reason == '')]
+        dup_in_file = live.duplicated().reindex(k.index, fill_value=False)
+        reject((k != '') & (k.isin(seen[key]) | dup_in_file), 'ซ้ำกับลูกค้าเดิม')
+    ok = reason == ''
+    for key in ('phone_key', 'line_key', 'name_key'):
+        seen[key].update(keys.loc[ok & (keys[key] != ''), key])
+    
+    rejected = chunk.loc[~ok].copy()
+    rejected['reject_reason'] = reason[~ok]
+    return df.loc[ok], rejected
+
+def province_fix_suggestions():
+    """Distinct non-canonical customers.province values with the closest province and how many customers use them."""
+    df = run_query("""
+        SELECT province AS raw, COUNT(*) AS customers FROM customers
+        WHERE COALESCE(TRIM(province), '') <> '' AND NOT (province = ANY(CAST(:known AS TEXT[])))
+        GROUP BY province ORDER BY customers DESC
+    """, {"known": list(LOCATION_DATA.keys())})
+    if df.empty:
+        return df.assign(suggestion=pd.Series(dtype=str))
+    df['suggestion'] = df['raw'].map(lambda v: normalize_province(v) or '')
+    return df
+
+def apply_province_fixes(fixes):
+    """Rewrite customers.province in one statement; `fixes` maps raw value -> canonical province."""
+    fixes = {k: v for k, v in fixes.items() if v and v in LOCATION_DATA and k != v}
+    if not fixes:
+        return 0
+    updated = run_query("""
+        UPDATE customers c SET province = f.fixed
+        FROM unnest(CAST(:raw AS TEXT[]), CAST(:fixed AS TEXT[])) AS f(raw, fixed)
+        WHERE c.province = f.raw
+        RETURNING c.customer_id
+    """, {"raw": list(fixes), "fixed": list(fixes.values())})
+    invalidate_search_source('customer')
+    refresh_geo_rollup()
+    _sales_version()["v"] += 1
+    return len(updated)
+
+def backfill_customer_addresses():
+    """Fill blank zipcodes from province + district, and blank province/district from an unambiguous zipcode."""
+    rows = [(p, d, z) for p, ds in LOCATION_DATA.items() for d, z in ds.items()]
+    if not rows:
+        return 0
+    filled = run_query("""
+        WITH loc AS (
+            SELECT * FROM unnest(CAST(:p AS TEXT[]), CAST(:d AS TEXT[]), CAST(:z AS TEXT[])) AS l(province, district, zipcode)
+        ), by_zip AS (
+            SELECT zipcode, MIN(province) AS province, MIN(district) AS district
+            FROM loc GROUP BY zipcode HAVING COUNT(*) = 1
+        )
+        UPDATE customers c SET
+            zipcode = COALESCE(NULLIF(c.zipcode, ''), l.zipcode),
+            province = COALESCE(NULLIF(c.province, ''), z.province),
+            district = COALESCE(NULLIF(c.district, ''), z.district)
+        FROM customers c2
+        LEFT JOIN loc l ON l.province = c2.province AND l.district = c2.district
+        LEFT JOIN by_zip z ON z.zipcode = c2.zipcode
+        WHERE c2.customer_id = c.customer_id
+          AND ((COALESCE(c.zipcode, '') = '' AND l.zipcode IS NOT NULL)
+               OR ((COALESCE(c.province, '') = '' OR COALESCE(c.district, '') = '') AND z.zipcode IS NOT NULL))
+        RETURNING c.customer_id
+    """, {"p": [r[0] for r in rows], "d": [r[1] for r in rows], "z": [r[2] for r in rows]})
+    if len(filled):
+        refresh_geo_rollup()
+        _sales_version()["v"] += 1
+    return len(filled)
+
+def copy_customers(conn, df):
+    """Bulk-load accepted rows with COPY on an open psycopg2 connection."""
+    buf = io.StringIO()
+    df[IMPORT_COLUMNS].to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    with conn.cursor() as cur:
+        cur.copy_expert(f"COPY customers ({', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '')", buf)
+    conn.commit()
+
+def import_customers(uploaded, on_progress=None):
+    """Stream, validate, dedupe and COPY a customer file; returns (imported count, rejected DataFrame)."""
+    existing = dedup_keys(run_query("SELECT customer_id, full_name, phone, line_id FROM customers"))
+    seen = {key: set(existing.loc[existing[key] != '', key]) for key in ('phone_key', 'line_key', 'name_key')}
+    imported, rejects = 0, []
+    conn = get_engine().raw_connection()
+    try:
+        for i, chunk in enumerate(iter_import_chunks(uploaded)):
+            accepted, rejected = validate_import_chunk(chunk, seen)
+            if not accepted.empty:
+                copy_customers(conn, accepted)
+            imported += len(accepted)
+            rejects.append(rejected)
+            if on_progress:
+                on_progress(i + 1, imported, sum(len(r) for r in rejects))
+    finally:
+        conn.close()
+    return imported, (pd.concat(rejects, ignore_index=True) if rejects else pd.DataFrame())
+
+# Accounting export: bills x items with refunds, streamed from a server-side cursor
+EXPORT_BATCH_ROWS = 10000
+ACCOUNTING_EXPORT_SQL = """
+    SELECT b.bill_id, b.sale_date, b.customer_id, c.full_name AS customer_name, e.emp_name AS seller,
+           b.payment_method, b.sale_channel, b.total_amount, b.discount, b.final_amount,
+           bi.item_id, bi.product_id, bi.product_name, bi.qty, bi.unit_price, bi.subtotal,
+           r.refund_approved, r.refund_status
+    FROM bills b
+    LEFT JOIN customers c ON c.customer_id = b.customer_id
+    LEFT JOIN employees e ON e.emp_id = b.seller_id
+    LEFT JOIN bill_items bi ON bi.bill_id = b.bill_id
+    LEFT JOIN (
+        SELECT bill_id, SUM(refund_amount) FILTER (WHERE status = 'approved') AS refund_approved,
+               STRING_AGG(DISTINCT status, ',') AS refund_status
+        FROM refund_requests
+        WHERE bill_id IN (SELECT bill_id FROM bills WHERE sale_date >= :s AND sale_date < :e)
+        GROUP BY bill_id
+    ) r ON r.bill_id = b.bill_id
+    WHERE b.sale_date >= :s AND b.sale_date < :e
+    ORDER BY b.sale_date, b.bill_id, bi.item_id
+"""
+
+def _export_parquet_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("bill_id", pa.string()), ("sale_date", pa.timestamp('us')), ("customer_id", pa.int64()),
+        ("customer_name", pa.string()), ("seller", pa.string()), ("payment_method", pa.string()),
+        ("sale_channel", pa.string()), ("total_amount", pa.float64()), ("discount", pa.float64()),
+        ("final_amount", pa.float64()), ("item_id", pa.int64()), ("product_id", pa.int64()),
+        ("product_name", pa.string()), ("qty", pa.int64()), ("unit_price", pa.float64()),
+        ("subtotal", pa.float64()), ("refund_approved", pa.float64()), ("refund_status", pa.string()),
+    ])
+
+def export_accounting(start, end, fmt='csv'):
+    """Write the accounting extract for [start, end) to a temp file batch by batch; returns (path, rows).
+    
+    Rows come from a server-side cursor EXPORT_BATCH_ROWS at a time, so memory stays flat for any period.
+    """
+    fd, path = tempfile.mkstemp(suffix='.parquet' if fmt == 'parquet' else '.csv', prefix='accounting_')
+    os.close(fd)
+    rows, writer = 0, None
+    try:
+        with get_engine().connect() as conn:
+            result = conn.execution_options(stream_results=True, max_row_buffer=EXPORT_BATCH_ROWS).execute(
+                text(ACCOUNTING_EXPORT_SQL), {"s": start, "e": end})
+            cols = list(result.keys())
+            for part in result.partitions(EXPORT_BATCH_ROWS):
+                batch = pd.DataFrame(part, columns=cols)
+                if fmt == 'parquet':
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                    if writer is None:
+                        writer = pq.ParquetWriter(path, _export_parquet_schema())
+                    writer.write_table(pa.Table.from_pandas(batch, schema=writer.schema, preserve_index=False))
+                else:
+                    # BOM on the first batch so Excel opens Thai text correctly
+                    batch.to_csv(path, mode='w' if rows == 0 else 'a', header=rows == 0, index=False,
+                                 encoding='utf-8-sig' if rows == 0 else 'utf-8')
+                rows += len(batch)
+        if rows == 0:
+            if fmt == 'parquet':
+                import pyarrow.parquet as pq
+                pq.write_table(_export_parquet_schema().empty_table(), path)
+            else:
+                pd.DataFrame(columns=cols).to_csv(path, index=False, encoding='utf-8-sig')
+    finally:
+        if writer is not None:
+            writer.close()
+    return path, rows
+
+# Products in categories of this group are courses: selling one issues course credits
+COURSE_GROUP = 'Cooking Course'
+
+# Checkout: one stored-function call does every write (bill, items, credits, legacy sales_history).
+# payload: {customer_id, seller_id, payment_method, sale_channel, event_id, discount_pct, sale_date,
+#           items: [{id, name, price, qty, total, is_course}]}
+# sale_date is when the cashier rang the sale up, so a sale replayed later by the checkout queue keeps
+# its date, bill-number prefix and credit expiry.
+# Returns the receipt data (bill_id, sale_date, customer, seller, payment_method, items, subtotal, discount, final).
+POS_CHECKOUT_FUNCTION = """
+CREATE OR REPLACE FUNCTION pos_checkout(payload JSONB, idem_key TEXT) RETURNS JSONB
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_now TIMESTAMP := COALESCE((payload->>'sale_date')::TIMESTAMP, LOCALTIMESTAMP);
+    v_prefix TEXT := 'B-' || to_char(v_now, 'YYYYMMDD');
+    v_bill TEXT;
+    v_cid INTEGER := (payload->>'customer_id')::INTEGER;
+    v_sid INTEGER := (payload->>'seller_id')::INTEGER;
+    v_subtotal REAL;
+    v_discount REAL;
+    v_result JSONB;
+BEGIN
+    -- Claim the key; a concurrent call with the same key waits here, then gets the stored result
+    INSERT INTO checkout_requests (idempotency_key) VALUES (idem_key) ON CONFLICT DO NOTHING;
+    IF NOT FOUND THEN
+        SELECT result INTO v_result FROM checkout_requests WHERE idempotency_key = idem_key;
+        RETURN v_result;
+    END IF;
+
+    -- Bill numbers are per day; serialize numbering across concurrent checkouts
+    PERFORM pg_advisory_xact_lock(hashtext('pos_checkout'));
+    SELECT v_prefix || '-' || lpad((COALESCE(MAX(split_part(bill_id, '-', 3)::INTEGER), 0) + 1)::TEXT, 4, '0')
+    INTO v_bill FROM bills WHERE bill_id LIKE v_prefix || '-%';
+
+    CREATE TEMP TABLE IF NOT EXISTS _checkout_items (
+        id INTEGER, name TEXT, price REAL, qty INTEGER, total REAL, is_course BOOLEAN
+    ) ON COMMIT DROP;
+    DELETE FROM _checkout_items;
+    INSERT INTO _checkout_items
+    SELECT * FROM jsonb_to_recordset(payload->'items')
+        AS t(id INTEGER, name TEXT, price REAL, qty INTEGER, total REAL, is_course BOOLEAN);
+
+    SELECT COALESCE(SUM(total), 0) INTO v_subtotal FROM _checkout_items;
+    v_discount := v_subtotal * COALESCE((payload->>'discount_pct')::REAL, 0) / 100;
+
+    INSERT INTO bills (bill_id, customer_id, seller_id, total_amount, discount, final_amount, payment_method, sale_channel, event_id, sale_date)
+    VALUES (v_bill, v_cid, v_sid, v_subtotal, v_discount, v_subtotal - v_discount, payload->>'payment_method',
+            payload->>'sale_channel', (payload->>'event_id')::INTEGER, v_now);
+
+    INSERT INTO bill_items (bill_id, product_id, product_name, qty, unit_price, subtotal)
+    SELECT v_bill, id, name, qty, price, total FROM _checkout_items;
+
+    -- One credit per course seat, valid about two years
+    INSERT INTO course_credits (customer_id, bill_id, product_id, expiry_date)
+    SELECT v_cid, v_bill, i.id, (v_now + INTERVAL '730 days')::DATE
+    FROM _checkout_items i, generate_series(1, GREATEST(i.qty, 0))
+    WHERE i.is_course AND i.id > 0;
+
+    -- Legacy support
+    INSERT INTO sales_history (customer_id, product_id, amount, payment_method, sale_channel, closed_by_emp_id, sale_date)
+    SELECT v_cid, id, total, payload->>'payment_method', payload->>'sale_channel', v_sid, v_now::DATE FROM _checkout_items;
+
+    SELECT jsonb_build_object(
+        'bill_id', v_bill, 'sale_date', v_now,
+        'customer', COALESCE((SELECT full_name || ' (' || COALESCE(nickname, '-') || ')' FROM customers WHERE customer_id = v_cid), '-'),
+        'seller', COALESCE((SELECT COALESCE(emp_nickname, emp_name) FROM employees WHERE emp_id = v_sid), '-'),
+        'payment_method', payload->>'payment_method',
+        'items', COALESCE((SELECT jsonb_agg(jsonb_build_object('name', name, 'qty', qty, 'total', total)) FROM _checkout_items), '[]'::JSONB),
+        'subtotal', v_subtotal, 'discount', v_discount, 'final', v_subtotal - v_discount
+    ) INTO v_result;
+
+    UPDATE checkout_requests SET bill_id = v_bill, result = v_result WHERE idempotency_key = idem_key;
+    RETURN v_result;
+END;
+$$
+"""
+
+def checkout(payload, idempotency_key):
+    """Write a whole sale in one round trip; calling again with the same key returns the original result.
+
+    Returns the receipt dict for receipts.render_receipt_html (sale_date parsed back to a datetime).
+    """
+    with get_engine().begin() as conn:
+        result = conn.execute(text("SELECT pos_checkout(CAST(:payload AS JSONB), :key)"),
+                              {"payload": json.dumps(payload, ensure_ascii=False), "key": idempotency_key}).scalar()
+    return {**result, "sale_date": datetime.fromisoformat(result['sale_date'])}
+
+CHECKOUT_KEY_RETENTION_DAYS = 7
+
+# Optional write-behind checkout for when the hosted database is slow. Enable with
+#   [checkout_queue]
+#   path = "/var/lib/crm/checkout_queue.db"
+# in secrets.toml; every sale then goes through the local queue so replay order matches sale order.
+def _after_queued_checkout(receipt):
+    store_receipt(receipt['bill_id'], render_receipt_html(receipt))
+
+def _after_queue_drain(receipts):
+    apply_sales_to_rollups([r['bill_id'] for r in receipts])
+    attribute_campaign_bills(bill_ids=[r['bill_id'] for r in receipts])
+    events = run_query("SELECT DISTINCT event_id FROM bills WHERE bill_id = ANY(CAST(:ids AS TEXT[])) AND event_id IS NOT NULL",
+                       {"ids": [r['bill_id'] for r in receipts]})
+    refresh_event_stats(events['event_id'].tolist())
+    update_copurchase_index()
+
+@st.cache_resource
+def get_checkout_queue():
+    """Process-wide queue + replay worker, or None when not configured."""
+    path = st.secrets.get("checkout_queue", {}).get("path")
+    if not path:
+        return None
+    # Connection-level failures are retried until the database is back; anything else is parked after a few tries
+    return CheckoutQueue(path, submit=checkout, on_done=_after_queued_checkout, on_drain=_after_queue_drain,
+                         transient=(OperationalError,), max_attempts=5).start()
+
+def purge_checkout_requests():
+    """Daily job: idempotency keys only need to outlive a retry, so old ones are dropped."""
+    run_query("DELETE FROM checkout_requests WHERE created_at < CURRENT_TIMESTAMP - make_interval(days => :d)",
+              {"d": CHECKOUT_KEY_RETENTION_DAYS})
+    if get_checkout_queue():
+        get_checkout_queue().purge_done(CHECKOUT_KEY_RETENTION_DAYS)
+
+# Receipts: rendered once from the compiled template (receipts.py) and stored per bill for reprints
+RECEIPT_DATA_SQL = """
+    SELECT b.bill_id, b.sale_date, COALESCE(b.total_amount, 0) AS subtotal, COALESCE(b.discount, 0) AS discount,
+           COALESCE(b.final_amount, 0) AS final, COALESCE(b.payment_method, '-') AS payment_method,
+           COALESCE(c.full_name || ' (' || COALESCE(c.nickname, '-') || ')', '-') AS customer,
+           COALESCE(e.emp_nickname, e.emp_name, '-') AS seller,
+           COALESCE(json_agg(json_build_object('name', COALESCE(bi.product_name, '-'), 'qty', COALESCE(bi.qty, 0),
+                                               'total', COALESCE(bi.subtotal, 0)) ORDER BY bi.item_id)
+                    FILTER (WHERE bi.item_id IS NOT NULL), '[]') AS items
+    FROM bills b
+    LEFT JOIN customers c ON c.customer_id = b.customer_id
+    LEFT JOIN employees e ON e.emp_id = b.seller_id
+    LEFT JOIN bill_items bi ON bi.bill_id = b.bill_id
+    WHERE {where}
+    GROUP BY b.bill_id, c.full_name, c.nickname, e.emp_nickname, e.emp_name
+    ORDER BY b.sale_date, b.bill_id
+"""
+
+def load_receipts(where, params):
+    """Receipt dicts (see receipts.py) for the bills matching `where` (a SQL condition on `b`), in one query."""
+    return run_query(RECEIPT_DATA_SQL.format(where=where), params).to_dict('records')
+
+def store_receipt(bill_id, receipt_html):
+    """Keep the receipt exactly as issued; later reprints return this copy."""
+    run_query("""
+        INSERT INTO bill_receipts (bill_id, receipt_html) VALUES (:b, :h)
+        ON CONFLICT (bill_id) DO NOTHING
+    """, {"b": bill_id, "h": receipt_html})
+
+def get_receipt_html(bill_id):
+    """Stored receipt of a bill; bills issued before receipts were stored are rendered and stored on first request."""
+    df = run_query("SELECT receipt_html FROM bill_receipts WHERE bill_id = :b", {"b": bill_id})
+    if not df.empty:
+        return df['receipt_html'][0]
+    rows = load_receipts("b.bill_id = :b", {"b": bill_id})
+    if not rows:
+        return None
+    receipt_html = render_receipt_html(rows[0])
+    store_receipt(bill_id, receipt_html)
+    return receipt_html
+
+def export_receipts_pdf(start, end):
+    """ZIP of one PDF per bill sold between `start` and `end` (dates, inclusive); returns (zip bytes, bill count)."""
+    rows = load_receipts("b.sale_date >= :s AND b.sale_date < :e", {"s": start, "e": end + timedelta(days=1)})
+    return render_receipts_zip(rows), len(rows)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_package_index():
+    """Every package with its products, in one query: {package_id: package dict for Cart.load_package}.
+
+    Cleared whenever a package or a product changes, so loading a package at the POS needs no query.
+    """
+    df = run_query("""
+        SELECT pk.package_id, pk.package_name, pk.discounted_price, p.product_id, p.product_name, p.price
+        FROM packages pk
+        LEFT JOIN package_products pp ON pp.package_id = pk.package_id
+        LEFT JOIN products p ON p.product_id = pp.product_id
+        ORDER BY pk.package_id, p.product_id
+    """)
+    index = {}
+    for r in df.itertuples(index=False):
+        pkg = index.setdefault(int(r.package_id), {
+            "package_id": int(r.package_id), "name": r.package_name,
+            "price": float(r.discounted_price or 0), "items": [],
+        })
+        if pd.notna(r.product_id):
+            pkg["items"].append((int(r.product_id), r.product_name, float(r.price)))
+    return index
+
+# Jobs run at most once per day, in this order
+DAILY_JOBS = {
+    "credit_alerts": refresh_credit_alerts,
+    "churn_scores": refresh_churn_scores,
+    "marketing_rollups": refresh_recent_rollups,
+    "campaign_attribution": attribute_campaign_bills,
+    "event_stats": refresh_event_stats,
+    "next_best_actions": refresh_next_best_actions,
+    "checkout_keys": purge_checkout_requests,
+}
+
+def mark_job_run(job_name):
+    run_query("""
+        INSERT INTO job_runs (job_name, last_run) VALUES (:j, CURRENT_TIMESTAMP)
+        ON CONFLICT (job_name) DO UPDATE SET last_run = EXCLUDED.last_run
+    """, {"j": job_name})
+
+def run_daily_job(job_name):
+    """Run a registered job unless job_runs shows it already ran today."""
+    last = run_query("SELECT last_run FROM job_runs WHERE job_name = :j", {"j": job_name})
+    if not last.empty and pd.notnull(last['last_run'][0]) and pd.to_datetime(last['last_run'][0]).date() >= datetime.now().date():
+        return False
+    DAILY_JOBS[job_name]()
+    mark_job_run(job_name)
+    return True
+
+DAILY_JOB_RETRY_SECONDS = 600
+
+@st.cache_resource
+def _daily_job_state():
+    return {"checked_day": None, "retry_at": 0.0}
+
+def ensure_daily_jobs():
+    """Check due jobs once per process per day instead of on every rerun.
+    
+    The day only counts as checked once every job has succeeded; after a failure the remaining due
+    jobs are retried on a rerun at least DAILY_JOB_RETRY_SECONDS later (jobs that already ran today are skipped).
+    """
+    state = _daily_job_state()
+    today = datetime.now().date()
+    if state["checked_day"] == today or time.time() < state["retry_at"]:
+        return
+    failed = False
+    for job_name in DAILY_JOBS:
+        try:
+            run_daily_job(job_name)
+        except Exception as e:
+            failed = True
+            st.error(f"⚠️ Job '{job_name}' ล้มเหลว: {e}")
+    if failed:
+        state["retry_at"] = time.time() + DAILY_JOB_RETRY_SECONDS
+    else:
+        state["checked_day"] = today
+
+
 # --- 2. ข้อมูลที่ตั้ง (77 จังหวัด) ---
 try:
-    from thai_locations import LOCATION_DATA
+    # Loaded lazily: nothing is decoded until a page actually touches an address
+    from thai_locations import (LOCATION_DATA, REGIONS, provinces, districts_of, lookup_zipcode,
+                                fuzzy_search, canonical_province, normalize_province, region_of)
 except ImportError:
     st.error("❌ ไม่พบไฟล์ thai_locations.py")
-    LOCATION_DATA = {}
+    LOCATION_DATA, REGIONS = {}, {}
+    provinces = districts_of = lookup_zipcode = fuzzy_search = lambda *a, **k: []
+    canonical_province = normalize_province = region_of = lambda *a, **k: None
+
+ADDRESS_PLACEHOLDER = "-- โปรดเลือก --"
+
+def _address_sync(key, changed):
+    """on_change for address_picker: keep province → district → zipcode consistent, purely in memory."""
+    ss = st.session_state
+    prov, dist, zipc = f"{key}_prov", f"{key}_dist", f"{key}_zip"
+    if changed == 'zip':
+        matches = lookup_zipcode(ss[zipc])
+        if matches:
+            ss[prov], ss[dist] = matches[0]
+    elif changed == 'prov':
+        ss[dist] = ADDRESS_PLACEHOLDER
+        ss[zipc] = ""
+    elif changed == 'dist':
+        ss[zipc] = LOCATION_DATA.get(ss[prov], {}).get(ss[dist], ss[zipc])
+
+def address_picker(key, province=None, district=None, sub_district=None, zipcode=None):
+    """Cascading province → district → zipcode inputs (render outside st.form so each change reruns).
+
+    Typing a zipcode fills province and district; picking a district fills the zipcode.
+    Sub-district is free text (the location data stops at district level).
+    Values not in the location data (older records) stay selectable so saving does not erase them.
+    """
+    ss = st.session_state
+    if f"{key}_prov" not in ss:
+        text_or = lambda v, default: v.strip() if isinstance(v, str) and v.strip() else default
+        ss[f"{key}_prov"] = text_or(province, ADDRESS_PLACEHOLDER)
+        ss[f"{key}_dist"] = text_or(district, ADDRESS_PLACEHOLDER)
+        ss[f"{key}_sub"] = text_or(sub_district, "")
+        ss[f"{key}_zip"] = text_or(zipcode, "")
+    
+    def options(known, current):
+        return [ADDRESS_PLACEHOLDER] + known + ([current] if current not in known and current != ADDRESS_PLACEHOLDER else [])
+    
+    a1, a2, a3, a4 = st.columns(4)
+    prov = a1.selectbox("จังหวัด", options(provinces(), ss[f"{key}_prov"]), key=f"{key}_prov",
+                        on_change=_address_sync, args=(key, 'prov'))
+    dist = a2.selectbox("อำเภอ/เขต", options(districts_of(prov), ss[f"{key}_dist"]), key=f"{key}_dist",
+                        on_change=_address_sync, args=(key, 'dist'))
+    sub = a3.text_input("ตำบล/แขวง", key=f"{key}_sub")
+    zipc = a4.text_input("รหัสไปรษณีย์", max_chars=5, placeholder="เช่น 10200", key=f"{key}_zip",
+                         on_change=_address_sync, args=(key, 'zip'))
+    matches = lookup_zipcode(zipc)
+    if zipc and not matches:
+        a4.caption("⚠️ ไม่พบรหัสไปรษณีย์นี้")
+    elif len(matches) > 1:
+        a4.caption("ใช้ร่วมกับ: " + ", ".join(d for p, d in matches if d != dist))
+    return {"province": None if prov == ADDRESS_PLACEHOLDER else prov,
+            "district": None if dist == ADDRESS_PLACEHOLDER else dist,
+            "sub_district": sub.strip() or None, "zipcode": zipc.strip() or None}
+
+def reset_address_picker(key):
+    for part in ('prov', 'dist', 'sub', 'zip'):
+        st.session_state.pop(f"{key}_{part}", None)
 
-ALL_PROVINCES = sorted(list(LOCATION_DATA.keys()))
 
 
+@st.cache_resource
+def ensure_schema():
+    """Run init_db once per process instead of on every rerun."""
+    init_db()
+    return True
 
-init_db()
+ensure_schema()
 
 # --- 3. UI/UX Aesthetics (Premium Glassmorphism & Modern Color Palette) ---
 st.set_page_config(page_title="CRM Smart Pro", layout="wide", initial_sidebar_state="expanded")
+ensure_daily_jobs()
 
 if 'theme' not in st.session_state:
     st.session_state.theme = 'Light'
@@ -377,9 +2322,29 @@ with st.sidebar:
     
     st.markdown("---")
     
+    # Write-behind checkout queue health (only when enabled)
+    checkout_q = get_checkout_queue()
+    if checkout_q:
+        q_stats = checkout_q.stats()
+        qc1, qc2 = st.columns(2)
+        qc1.metric("🧾 บิลรอส่ง", q_stats['depth'])
+        qc2.metric("⏱️ ล่าช้า", f"{q_stats['lag']:.0f} วิ")
+        if not q_stats['running']:
+            st.error("ตัวส่งบิลหยุดทำงาน")
+        if q_stats['failed']:
+            st.error(f"ส่งไม่สำเร็จ {q_stats['failed']} บิล: {q_stats['last_error']}")
+            if st.button("🔁 ส่งบิลที่ค้างอีกครั้ง", use_container_width=True):
+                checkout_q.retry_failed()
+        elif q_stats['depth'] and q_stats['last_error']:
+            st.caption(f"⚠️ {q_stats['last_error']}")
+        if q_stats['callback_error']:
+            st.warning(f"บิลส่งแล้ว แต่งานต่อเนื่องล้มเหลว: {q_stats['callback_error']}")
+        st.markdown("---")
+    
     if 'menu_option' not in st.session_state: st.session_state.menu_option = "📊 Dashboard"
     def set_menu(option): st.session_state.menu_option = option
     st.button("📊 Dashboard", on_click=set_menu, args=("📊 Dashboard",), use_container_width=True)
+    st.button("🔎 ค้นหา", on_click=set_menu, args=("🔎 ค้นหา",), use_container_width=True)
     st.button("💰 บันทึกการขาย", on_click=set_menu, args=("💰 บันทึกการขาย",), use_container_width=True)
     st.button("👥 จัดการลูกค้า", on_click=set_menu, args=("👥 จัดการลูกค้า",), use_container_width=True)
     st.button("👔 จัดการพนักงาน", on_click=set_menu, args=("👔 จัดการพนักงาน",), use_container_width=True)
@@ -391,11 +2356,15 @@ with st.sidebar:
     st.button("🏆 ABC Analysis", on_click=set_menu, args=("🏆 ABC Analysis",), use_container_width=True)
     st.button("💵 P&L Dashboard", on_click=set_menu, args=("💵 P&L Dashboard",), use_container_width=True)
     st.button("📊 Lead Funnel", on_click=set_menu, args=("📊 Lead Funnel",), use_container_width=True)
-    st.button("🔔 Follow-up System", on_click=set_menu, args=("🔔 Follow-up System",), use_container_width=True)
+    urgent_alerts = get_credit_alert_badge()
+    st.button(f"🔔 Follow-up System ({urgent_alerts})" if urgent_alerts else "🔔 Follow-up System",
+              on_click=set_menu, args=("🔔 Follow-up System",), use_container_width=True)
     st.button("💰 Channel ROI", on_click=set_menu, args=("💰 Channel ROI",), use_container_width=True)
+    st.button("🏁 Goal Tracker", on_click=set_menu, args=("🏁 Goal Tracker",), use_container_width=True)
     st.button("🎯 Campaign Tracker", on_click=set_menu, args=("🎯 Campaign Tracker",), use_container_width=True)
     st.button("🧩 Customer Segments", on_click=set_menu, args=("🧩 Customer Segments",), use_container_width=True)
     st.button("📅 Event Calendar", on_click=set_menu, args=("📅 Event Calendar",), use_container_width=True)
+    st.button("🗺️ Geo Sales", on_click=set_menu, args=("🗺️ Geo Sales",), use_container_width=True)
     st.button("👤 Customer Analytics", on_click=set_menu, args=("👤 Customer Analytics",), use_container_width=True)
     st.button("🎯 Customer 360", on_click=set_menu, args=("🎯 Customer 360",), use_container_width=True)
     
@@ -475,6 +2444,30 @@ if choice == "📊 Dashboard":
             st.area_chart(daily_trend.set_index('date'), use_container_width=True, color="#38bdf8")
         else:
             st.info("ไม่มีข้อมูลยอดขายเดือนนี้")
+        
+        # Forecast panel (model params cached per day; projecting is a few vector ops)
+        st.markdown("### 🔮 คาดการณ์ยอดขาย")
+        fc_model = fit_revenue_forecast(today)
+        if fc_model is None:
+            st.caption("ยังไม่มีข้อมูลย้อนหลังพอสำหรับคาดการณ์")
+        else:
+            month_end = (today.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            df_fc = forecast_revenue(fc_model, max((month_end - today).days + 1, 30) + 1)
+            fc_today = df_fc['forecast'].iloc[0]
+            rest_of_month = df_fc[(df_fc['date'] > today) & (df_fc['date'] <= month_end)]['forecast'].sum() + max(fc_today - sales_today, 0)
+            next_30 = df_fc[(df_fc['date'] > today) & (df_fc['date'] <= today + timedelta(days=30))]['forecast'].sum()
+            
+            f1, f2, f3 = st.columns(3)
+            f1.metric("คาดการณ์ยอดทั้งเดือน", f"฿{sales_month + rest_of_month:,.0f}")
+            f2.metric("ที่เหลือของเดือนนี้", f"฿{rest_of_month:,.0f}")
+            f3.metric("30 วันข้างหน้า", f"฿{next_30:,.0f}")
+            
+            df_fc_chart = df_fc[df_fc['date'] <= today + timedelta(days=30)].set_index('date')[['forecast', 'low', 'high']]
+            if not df_bills.empty:
+                df_fc_chart = daily_trend.set_index('date').rename(columns={'final_amount': 'actual'}).join(df_fc_chart, how='outer')
+            st.line_chart(df_fc_chart.rename(columns={'actual': 'ยอดจริง', 'forecast': 'คาดการณ์', 'low': 'ต่ำ', 'high': 'สูง'}),
+                          use_container_width=True)
+            st.caption(f"โมเดล: {'Holt-Winters (รายสัปดาห์)' if fc_model['method'] == 'holt_winters' else 'Seasonal naive'} · ฝึกใหม่วันละครั้ง")
 
     with col_right:
         st.markdown("### 🥧 สัดส่วนสินค้า (Product Mix)")
@@ -542,6 +2535,34 @@ if choice == "📊 Dashboard":
                      "payment_method": "วิธีชำระเงิน"
                  })
 
+# --- 🔎 Full-text Search ---
+elif choice == "🔎 ค้นหา":
+    st.header("🔎 ค้นหาข้อมูลลูกค้า บันทึก และ Feedback")
+    st.caption("ค้นหาได้ทั้งชื่อ เบอร์โทร โน้ตลูกค้า บันทึกการติดต่อ และความคิดเห็น เช่น \"สนใจราเมง\" (พิมพ์ผิดเล็กน้อยก็ยังเจอ)")
+    
+    sq1, sq2 = st.columns([3, 2])
+    q = sq1.text_input("🔍 คำค้นหา", placeholder="เช่น: คนที่บอกว่าสนใจราเมง")
+    sel_kinds = sq2.multiselect("ค้นหาใน", list(SEARCH_KIND_LABELS.keys()), default=['customer', 'contact', 'feedback'],
+                                format_func=lambda k: SEARCH_KIND_LABELS[k])
+    
+    if q.strip():
+        t0 = time.perf_counter()
+        df_hits = search_text(q, kinds=set(sel_kinds) if sel_kinds else None)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        st.caption(f"พบ {len(df_hits)} รายการ ใน {elapsed_ms:.1f} ms")
+        if df_hits.empty:
+            st.info("ไม่พบข้อมูลที่ตรงกับคำค้นหา")
+        else:
+            df_hits['kind'] = df_hits['kind'].map(SEARCH_KIND_LABELS)
+            st.dataframe(df_hits[['kind', 'label', 'snippet', 'score', 'customer_id']], hide_index=True, use_container_width=True,
+                         column_config={
+                             "kind": "ประเภท",
+                             "label": "ชื่อ",
+                             "snippet": "ข้อความที่พบ",
+                             "score": st.column_config.ProgressColumn("ความตรง", min_value=0, max_value=1, format="%.2f"),
+                             "customer_id": st.column_config.NumberColumn("รหัสลูกค้า", format="%d")
+                         })
+
 # --- 🎁 ตั้งค่าแพ็กเกจ (Package Management) ---
 elif choice == "🎁 ตั้งค่าแพ็กเกจ":
     st.title("🎁 จัดการแพ็กเกจสินค้า (Package Settings)")
@@ -595,6 +2616,7 @@ elif choice == "🎁 ตั้งค่าแพ็กเกจ":
                     for s in sel_items_str:
                         pid = p_opts[s]
                         run_query("INSERT INTO package_products (package_id, product_id) VALUES (:pkg, :pid)", {"pkg": edit_id, "pid": pid})
+                    load_package_index.clear()
                     
                     st.success("บันทึกข้อมูลเรียบร้อย!")
                     st.rerun()
@@ -602,6 +2624,7 @@ elif choice == "🎁 ตั้งค่าแพ็กเกจ":
             if edit_mode and sub2.form_submit_button("🗑️ ลบแพ็กเกจ", use_container_width=True):
                 run_query("DELETE FROM packages WHERE package_id=:id", {"id": edit_id})
                 run_query("DELETE FROM package_products WHERE package_id=:id", {"id": edit_id})
+                load_package_index.clear()
                 st.success("ลบข้อมูลเรียบร้อย!")
                 st.rerun()
 
@@ -697,16 +2720,42 @@ elif choice == "💵 P&L Dashboard":
         st.dataframe(df_pl.sort_values('sale_date', ascending=False), hide_index=True, use_container_width=True)
     else:
         st.info("ระบบ P&L จะเริ่มแสดงผลเมื่อมีการสั่งซื้อผ่านระบบ 'บันทึกการขาย' ใหม่ครับ")
+    
+    st.divider()
+    st.subheader("📤 Export ข้อมูลสำหรับบัญชี")
+    st.caption("บิล + รายการสินค้า + วิธีชำระเงิน + ยอดรีฟันที่อนุมัติ (ยอดรีฟันเป็นระดับบิล แสดงซ้ำในทุกแถวสินค้าของบิลนั้น)")
+    today = datetime.now().date()
+    ex1, ex2, ex3 = st.columns(3)
+    ex_start = ex1.date_input("ตั้งแต่วันที่", value=(today.replace(day=1) - timedelta(days=1)).replace(day=1))
+    ex_end = ex2.date_input("ถึงวันที่ (รวมวันนี้)", value=today.replace(day=1) - timedelta(days=1))
+    ex_fmt = ex3.selectbox("รูปแบบไฟล์", ["csv", "parquet"])
+    if st.button("📦 สร้างไฟล์ Export", use_container_width=True):
+        old = st.session_state.get('accounting_export')
+        if old and os.path.exists(old['path']):
+            os.remove(old['path'])
+        try:
+            with st.spinner("กำลังดึงข้อมูล..."):
+                ex_path, ex_rows = export_accounting(ex_start, ex_end + timedelta(days=1), ex_fmt)
+            st.session_state.accounting_export = {"path": ex_path, "rows": ex_rows, "name": f"accounting_{ex_start:%Y%m%d}_{ex_end:%Y%m%d}.{ex_fmt}"}
+        except ImportError:
+            st.error("❌ การ Export เป็น Parquet ต้องติดตั้ง pyarrow")
+    ex_file = st.session_state.get('accounting_export')
+    if ex_file and os.path.exists(ex_file['path']):
+        with open(ex_file['path'], 'rb') as fh:
+            st.download_button(f"📥 ดาวน์โหลด {ex_file['name']} ({ex_file['rows']:,} แถว)", fh, file_name=ex_file['name'],
+                               mime="text/csv" if ex_file['name'].endswith('.csv') else "application/octet-stream")
 
 # --- 💰 บันทึกการขาย ---
 elif choice == "💰 บันทึกการขาย":
     st.header("🛒 ระบบบันทึกการขาย (ตระกร้าสินค้า)")
     
-    # Initialize Cart
-    if 'cart' not in st.session_state:
-        st.session_state.cart = []
+    # Initialize Cart (pricing lives in cart.py; the page only reads cart.totals)
+    if not isinstance(st.session_state.get('cart'), Cart):
+        st.session_state.cart = Cart()
+    cart = st.session_state.cart
     
-    df_p = run_query("SELECT p.product_id, p.product_name, p.price, p.cat_id, c.cat_name FROM products p LEFT JOIN categories c ON p.cat_id = c.cat_id")
+    df_p = run_query("SELECT p.product_id, p.product_name, p.price, p.cat_id, c.cat_name, c.group_name FROM products p LEFT JOIN categories c ON p.cat_id = c.cat_id")
+    df_p['is_course'] = df_p['group_name'] == COURSE_GROUP
     df_e = run_query("SELECT emp_id, emp_name, emp_nickname FROM employees")
     df_all_c = run_query("SELECT customer_id, full_name, nickname FROM customers")
     df_cat = run_query("SELECT * FROM categories")
@@ -726,47 +2775,15 @@ elif choice == "💰 บันทึกการขาย":
         st.divider()
         
         # 2. Package Selector
-        df_pkg = run_query("SELECT * FROM packages")
-        if not df_pkg.empty:
+        pkg_index = load_package_index()
+        if pkg_index:
             with st.expander("🎁 เลือกจากหลักสูตร/แพ็กเกจ (Bundles)", expanded=False):
-                pkg_opts = ["-- เลือกแพ็กเกจ --"] + [f"{r['package_id']} | {r['package_name']} ({r['discounted_price']:,.0f} บ.)" for _, r in df_pkg.iterrows()]
+                pkg_opts = ["-- เลือกแพ็กเกจ --"] + [f"{pid} | {pkg['name']} ({pkg['price']:,.0f} บ.)" for pid, pkg in pkg_index.items()]
                 sel_pkg_sale = st.selectbox("เลือกหลักสูตรที่ต้องการขาย", pkg_opts)
                 if sel_pkg_sale != "-- เลือกแพ็กเกจ --":
                     if st.button("🚀 โหลดรายการแพ็กเกจลงตระกร้า", use_container_width=True):
-                        pid = int(sel_pkg_sale.split(" | ")[0])
-                        pkg_info = df_pkg[df_pkg['package_id'] == pid].iloc[0]
-                        # Fetch items
-                        df_pkg_items = run_query("""
-                            SELECT p.product_id, p.product_name, p.price 
-                            FROM package_products pp
-                            JOIN products p ON pp.product_id = p.product_id
-                            WHERE pp.package_id = :id
-                        """, {"id": pid})
-                        
-                        # Clear and load
-                        st.session_state.cart = []
-                        it_total = 0
-                        for _, pit in df_pkg_items.iterrows():
-                            st.session_state.cart.append({
-                                "id": int(pit['product_id']),
-                                "name": pit['product_name'],
-                                "price": float(pit['price']),
-                                "qty": 1,
-                                "total": float(pit['price']),
-                                "is_course": True
-                            })
-                            it_total += pit['price']
-                        
-                        # Add adjustment to reach discounted price
-                        adj = float(pkg_info['discounted_price']) - it_total
-                        st.session_state.cart.append({
-                            "id": 0, # Virtual ID
-                            "name": f"ส่วนลดแพ็กเกจ: {pkg_info['package_name']}",
-                            "price": adj,
-                            "qty": 1,
-                            "total": adj,
-                            "is_course": False
-                        })
+                        # Replaces the cart; the bundle price holds while all package items stay in it
+                        cart.load_package(pkg_index[int(sel_pkg_sale.split(" | ")[0])])
                         st.rerun()
 
         # 3. Add to Cart Section
@@ -791,14 +2808,8 @@ elif choice == "💰 บันทึกการขาย":
                         if ac3.button("➕ เพิ่มลงตระกร้า", use_container_width=True, type="secondary"):
                             # Find the info back from the selected search string
                             p_info = df_p_filtered[df_p_filtered['search_str'] == prod_sel_str].iloc[0]
-                            st.session_state.cart.append({
-                                "id": int(p_info['product_id']),
-                                "name": p_info['product_name'],
-                                "price": float(p_info['price']),
-                                "qty": qty_to_add,
-                                "total": float(p_info['price'] * qty_to_add),
-                                "is_course": True # Courses by default
-                            })
+                            cart.add_product(int(p_info['product_id']), p_info['product_name'], p_info['price'],
+                                             qty_to_add, is_course=bool(p_info['is_course']))
                             st.rerun()
                 else:
                     st.info("❌ ไม่พบสินค้าในหมวดหมู่นี้")
@@ -806,12 +2817,11 @@ elif choice == "💰 บันทึกการขาย":
                 st.info("💡 โปรดเลือกหมวดหมู่สินค้าด้านบนเพื่อดูรายการสินค้า")
 
         # 3. Cart Display
-        if st.session_state.cart:
+        if cart:
             st.subheader("📋 รายการในตระกร้า")
-            df_cart = pd.DataFrame(st.session_state.cart)
             
             # Display items with remove buttons
-            for i, item in enumerate(st.session_state.cart):
+            for i, item in enumerate(cart.lines):
                 cols = st.columns([3, 1, 1, 1, 0.5])
                 cols[0].write(item['name'])
                 cols[1].write(f"{item['price']:,.2f}")
@@ -819,24 +2829,55 @@ elif choice == "💰 บันทึกการขาย":
                 cols[3].write(f"**{item['total']:,.2f}**")
                 # cols[4].checkbox("🎓", value=item.get('is_course', False), key=f"cr_{i}") # Credit toggle?
                 if cols[4].button("❌", key=f"del_{i}"):
-                    st.session_state.cart.pop(i)
+                    cart.remove(i)
                     st.rerun()
+            for adj in cart.totals['adjustments']:
+                cols = st.columns([3, 1, 1, 1, 0.5])
+                cols[0].write(f"🎁 {adj['name']}")
+                cols[3].write(f"**{adj['amount']:,.2f}**")
             
-            subtotal = sum(item['total'] for item in st.session_state.cart)
+            # Upsell suggestions from the co-purchase index
+            if _copurchase_index()["watermark"] == 0:
+                update_copurchase_index()
+            also_bought = get_also_bought(cart.product_ids())
+            if also_bought:
+                p_lookup = df_p.set_index('product_id')
+                st.markdown("**💡 ลูกค้าที่ซื้อรายการนี้ มักซื้อเพิ่ม:**")
+                up_cols = st.columns(len(also_bought))
+                for col, (up_pid, (together, confidence)) in zip(up_cols, also_bought):
+                    if up_pid not in p_lookup.index:
+                        continue
+                    up = p_lookup.loc[up_pid]
+                    if col.button(f"➕ {up['product_name']}", key=f"upsell_{up_pid}", help=f"ซื้อด้วยกัน {together} บิล ({confidence:.0%})", use_container_width=True):
+                        cart.add_product(int(up_pid), up['product_name'], up['price'], is_course=bool(up['is_course']))
+                        st.rerun()
             
             st.divider()
             
             # 4. Checkout
             cc1, cc2, cc3 = st.columns(3)
-            discount_pct = cc1.number_input("📉 ส่วนลด (%)", min_value=0.0, max_value=100.0, value=0.0)
+            # Reprices only when the value actually changes
+            cart.set_discount_pct(cc1.number_input("📉 ส่วนลด (%)", min_value=0.0, max_value=100.0, value=0.0))
             pay_method = cc2.selectbox("💳 วิธีชำระเงิน", ["โอนเงิน", "เงินสด"])
             
             # Updated to match Marketing Channels
-            mkt_channels = ["Facebook Ads", "Google Ads", "TikTok Ads", "Line OA", "Openhouse", "โรงเรียนอนุบาล", "ลูกค้าเก่า/Re-sale", "อื่นๆ"]
-            sel_mkt_channel = cc3.selectbox("📡 ช่องทางที่มา", mkt_channels)
+            sel_mkt_channel = cc3.selectbox("📡 ช่องทางที่มา", MKT_CHANNELS)
+            
+            # Openhouse sales are linked to the event they came from
+            sel_event_id = None
+            if sel_mkt_channel == "Openhouse":
+                df_ev = run_query("""
+                    SELECT event_id, event_name, event_date FROM events
+                    WHERE event_date BETWEEN CURRENT_DATE - 60 AND CURRENT_DATE + 7
+                    ORDER BY event_date DESC
+                """)
+                if not df_ev.empty:
+                    ev_opts = {f"{r['event_date']:%d/%m/%Y} | {r['event_name']}": int(r['event_id']) for _, r in df_ev.iterrows()}
+                    sel_ev = st.selectbox("📅 มาจากงาน (Event)", ["-- ไม่ระบุ --"] + list(ev_opts.keys()))
+                    sel_event_id = ev_opts.get(sel_ev)
             
-            discount_amt = (subtotal * discount_pct) / 100
-            final_total = subtotal - discount_amt
+            subtotal, discount_pct = cart.totals['subtotal'], cart.totals['discount_pct']
+            discount_amt, final_total = cart.totals['discount'], cart.totals['final']
             
             if discount_pct > 0:
                 st.markdown(f"💰 ส่วนลดที่ได้รับ ({discount_pct}%): **-{discount_amt:,.2f}** บาท")
@@ -845,107 +2886,100 @@ elif choice == "💰 บันทึกการขาย":
             
             if st.button("🏁 ยืนยันการสั่งซื้อและออกบิล", use_container_width=True, type="primary"):
                 if sel_cust != "-- เลือกรายชื่อลูกค้า --" and sel_emp != "-- เลือกพนักงาน --":
-                    # Generate Bill ID: B-YYYYMMDD-XXXX
-                    now = datetime.now()
-                    prefix = f"B-{now.strftime('%Y%m%d')}"
-                    last_bill = run_query("SELECT bill_id FROM bills WHERE bill_id LIKE :pref ORDER BY bill_id DESC LIMIT 1", {"pref": f"{prefix}%"})
-                    if not last_bill.empty:
-                        last_num = int(last_bill['bill_id'][0].split('-')[-1])
-                        new_bill_id = f"{prefix}-{str(last_num + 1).zfill(4)}"
+                    payload = {
+                        "customer_id": int(sel_cust.split(" | ")[0]),
+                        "seller_id": int(df_e[df_e['disp'] == sel_emp]['emp_id'].values[0]),
+                        "payment_method": pay_method, "sale_channel": sel_mkt_channel, "event_id": sel_event_id,
+                        "discount_pct": discount_pct, "items": cart.to_items(),
+                    }
+                    # Same sale submitted twice (double-click, interrupted rerun) -> same key -> same bill.
+                    # The sale token rotates after each success so an identical next sale gets a new key.
+                    if 'sale_token' not in st.session_state:
+                        st.session_state.sale_token = str(uuid.uuid4())
+                    idem_key = str(uuid.uuid5(uuid.NAMESPACE_OID, st.session_state.sale_token + json.dumps(payload, sort_keys=True, ensure_ascii=False)))
+                    # Stamped after the key: a resubmission is the same sale even a few seconds later
+                    sale_time = datetime.now().replace(microsecond=0)
+                    payload["sale_date"] = sale_time.isoformat()
+                    queue = get_checkout_queue()
+                    if queue:
+                        # Committed locally at once; the worker replays it and stores the real receipt
+                        new_bill_id = queue.enqueue(payload, idem_key, render_receipt=lambda pid: render_receipt_html({
+                            "bill_id": pid, "sale_date": sale_time, "customer": sel_cust.split(" | ")[1], "seller": sel_emp,
+                            "payment_method": pay_method, "items": payload['items'],
+                            "subtotal": subtotal, "discount": discount_amt, "final": final_total,
+                        }))
                     else:
-                        new_bill_id = f"{prefix}-0001"
-                    
-                    c_id = int(sel_cust.split(" | ")[0])
-                    e_id = int(df_e[df_e['disp'] == sel_emp]['emp_id'].values[0])
-                    
-                    # Save Bill header (Including sale_channel)
-                    run_query("""
-                        INSERT INTO bills (bill_id, customer_id, seller_id, total_amount, discount, final_amount, payment_method, sale_channel)
-                        VALUES (:bid, :cid, :sid, :total, :disc, :final, :pay, :chan)
-                    """, {"bid": new_bill_id, "cid": c_id, "sid": e_id, "total": subtotal, "disc": discount_amt, "final": final_total, "pay": pay_method, "chan": sel_mkt_channel})
-                    
-                    # Save Bill items
-                    for item in st.session_state.cart:
-                        run_query("""
-                            INSERT INTO bill_items (bill_id, product_id, product_name, qty, unit_price, subtotal)
-                            VALUES (:bid, :pid, :pname, :qty, :uprice, :sub)
-                        """, {"bid": new_bill_id, "pid": item['id'], "pname": item['name'], "qty": item['qty'], "uprice": item['price'], "sub": item['total']})
-                        
-                        # If it's a course item, generate Course Credits
-                        if item.get('is_course') and item['id'] > 0:
-                            import datetime as dt
-                            exp_date = (datetime.now() + dt.timedelta(days=730)).date() # 2 Years approx
-                            for _ in range(item['qty']):
-                                run_query("""
-                                    INSERT INTO course_credits (customer_id, bill_id, product_id, expiry_date)
-                                    VALUES (:cid, :bid, :pid, :exp)
-                                """, {"cid": c_id, "bid": new_bill_id, "pid": item['id'], "exp": exp_date})
-
-                        # Legacy support
-                        run_query("""
-                            INSERT INTO sales_history (customer_id, product_id, amount, payment_method, sale_channel, closed_by_emp_id, sale_date)
-                            VALUES (:cid, :pid, :amt, :pay, :ch, :eid, :dt)
-                        """, {"cid": c_id, "pid": item['id'], "amt": item['total'], "pay": pay_method, "ch": sel_mkt_channel, "eid": e_id, "dt": now.date()})
-                    
-                    st.success(f"✅ บันทึกบิล {new_bill_id} สำเร็จ!")
-                    
-                    # --- Receipt Generation ---
-                    c_name = sel_cust.split(" | ")[1]
-                    s_name = sel_emp
-                    
-                    receipt_html = f"""
-                    <div style="font-family: 'Courier New', Courier, monospace; border: 1px solid #ccc; padding: 20px; width: 300px; margin: auto; background: white; color: black;" id="receipt">
-                        <h3 style="text-align: center; margin-bottom: 5px;">RECEIPT</h3>
-                        <p style="text-align: center; font-size: 12px; margin-top: 0;">CRM Smart Pro System</p>
-                        <hr>
-                        <p style="font-size: 14px;"><b>Bill ID:</b> {new_bill_id}<br>
-                        <b>Date:</b> {now.strftime('%d/%m/%Y %H:%M')}<br>
-                        <b>Customer:</b> {c_name}<br>
-                        <b>Seller:</b> {s_name}</p>
-                        <hr>
-                        <table style="width: 100%; font-size: 14px;">
-                    """
-                    for item in st.session_state.cart:
-                        receipt_html += f"<tr><td>{item['name']} x{item['qty']}</td><td style='text-align: right;'>{item['total']:,.2f}</td></tr>"
-                    
-                    receipt_html += f"""
-                        </table>
-                        <hr>
-                        <table style="width: 100%; font-size: 14px;">
-                            <tr><td>Subtotal:</td><td style='text-align: right;'>{subtotal:,.2f}</td></tr>
-                            <tr><td>Discount ({discount_pct}%):</td><td style='text-align: right;'>-{discount_amt:,.2f}</td></tr>
-                            <tr style='font-weight: bold;'><td>TOTAL:</td><td style='text-align: right;'>{final_total:,.2f}</td></tr>
-                        </table>
-                        <p style="font-size: 14px;"><b>Method:</b> {pay_method}</p>
-                        <hr>
-                        <p style="text-align: center; font-size: 12px;">Thank you for your business!</p>
-                    </div>
-                    <br>
-                    <script>
-                        function printDiv() {{
-                            var content = document.getElementById('receipt').outerHTML;
-                            var win = window.open('', '', 'height=500,width=500');
-                            win.document.write('<html><head><title>Print Receipt</title></head><body>');
-                            win.document.write(content);
-                            win.document.write('</body></html>');
-                            win.document.close();
-                            win.print();
-                        }}
-                    </script>
-                    """
-                    
-                    st.markdown(receipt_html, unsafe_allow_html=True)
-                    if st.button("🖨️ พิมพ์ใบเสร็จ (Print)"):
-                        st.write("กรุณากด Ctrl+P เพื่อพิมพ์หน้าจอนี้ (หรือส่งข้อมูลไปที่เครื่องพิมพ์)")
-
-                    st.session_state.cart = [] # Clear cart after success
-                    if st.button("🔄 เริ่มบันทึกบิลใหม่"):
-                        st.rerun()
+                        receipt = checkout(payload, idem_key)
+                        new_bill_id = receipt['bill_id']
+                        apply_sales_to_rollups([new_bill_id])
+                        refresh_event_stats([sel_event_id])
+                        update_copurchase_index()
+                        store_receipt(new_bill_id, render_receipt_html(receipt))
+                    del st.session_state.sale_token
+                    reset_customer_timeline(payload['customer_id'])
+                    st.session_state.last_receipt_bill = new_bill_id
+                    cart.clear() # Clear cart after success
+                    st.rerun()
 
                 else:
                     st.error("⚠️ กรุณาเลือกทั้งลูกค้าและพนักงาน")
-        else:
+        elif not st.session_state.get('last_receipt_bill'):
             st.info("🛒 ตระกร้าว่างเปล่า: กรุณาเพิ่มสินค้าเพื่อเริ่มบันทึกการขาย")
+        
+        # Receipt of the bill just saved (survives the rerun that cleared the cart)
+        last_bill = st.session_state.get('last_receipt_bill')
+        last_html = None
+        if last_bill and not cart:
+            queued = get_checkout_queue().lookup(last_bill) if is_provisional(last_bill) and get_checkout_queue() else None
+            if queued and queued[0] == 'done':
+                # Replayed: switch to the real bill number
+                last_bill = st.session_state.last_receipt_bill = queued[1]
+                queued = None
+            last_html = queued[2] if queued else get_receipt_html(last_bill)
+        if last_html:
+            if is_provisional(last_bill):
+                st.warning(f"⏳ บิลชั่วคราว {last_bill}: บันทึกในเครื่องแล้ว กำลังส่งเข้าฐานข้อมูล (เลขบิลจริงจะแสดงเมื่อส่งสำเร็จ)")
+            else:
+                st.success(f"✅ บันทึกบิล {last_bill} สำเร็จ!")
+            st.markdown(last_html, unsafe_allow_html=True)
+            rc1, rc2 = st.columns(2)
+            rc1.download_button("🖨️ ดาวน์โหลดใบเสร็จ (พิมพ์ได้)", last_html.encode('utf-8'), file_name=f"{last_bill}.html",
+                                mime="text/html", use_container_width=True)
+            if rc2.button("🔄 เริ่มบันทึกบิลใหม่", use_container_width=True):
+                st.session_state.last_receipt_bill = None
+                st.rerun()
+    
+    # Reprints and month-end batches
+    with st.expander("🧾 ใบเสร็จย้อนหลัง (พิมพ์ซ้ำ / PDF รายช่วงวันที่)"):
+        rp1, rp2 = st.tabs(["🔁 พิมพ์ซ้ำรายบิล", "📦 PDF รายช่วงวันที่"])
+        with rp1:
+            re_bill = st.text_input("เลขที่บิล", placeholder="เช่น B-20240131-0001", key="reprint_bill").strip()
+            if re_bill:
+                re_html = get_receipt_html(re_bill)
+                if re_html:
+                    st.markdown(re_html, unsafe_allow_html=True)
+                    st.download_button("📥 ดาวน์โหลดใบเสร็จ", re_html.encode('utf-8'), file_name=f"{re_bill}.html", mime="text/html")
+                else:
+                    st.warning("ไม่พบบิลนี้")
+        with rp2:
+            today = datetime.now().date()
+            pc1, pc2 = st.columns(2)
+            pdf_start = pc1.date_input("ตั้งแต่วันที่", value=today.replace(day=1), key="rcpt_pdf_start")
+            pdf_end = pc2.date_input("ถึงวันที่", value=today, key="rcpt_pdf_end")
+            if st.button("📄 สร้าง PDF ใบเสร็จ", use_container_width=True):
+                try:
+                    with st.spinner("กำลังสร้าง PDF..."):
+                        st.session_state.receipt_zip = (*export_receipts_pdf(pdf_start, pdf_end), pdf_start, pdf_end)
+                except ThaiFontMissing as e:
+                    st.session_state.receipt_zip = None
+                    st.error(f"❌ สร้าง PDF ไม่ได้: ไม่พบฟอนต์ภาษาไทยในเครื่อง ({e})")
+            if st.session_state.get('receipt_zip'):
+                zip_bytes, n_bills, z_start, z_end = st.session_state.receipt_zip
+                if n_bills:
+                    st.download_button(f"📥 ดาวน์โหลด {n_bills:,} ใบเสร็จ (ZIP)", zip_bytes, mime="application/zip",
+                                       file_name=f"receipts_{z_start:%Y%m%d}_{z_end:%Y%m%d}.zip", use_container_width=True)
+                else:
+                    st.info("ไม่มีบิลในช่วงวันที่นี้")
 
 # --- 👥 จัดการลูกค้า (Customer 360) ---
 elif choice == "👥 จัดการลูกค้า":
@@ -966,9 +3000,94 @@ elif choice == "👥 จัดการลูกค้า":
         st.info("ยังไม่มีข้อมูลลูกค้า")
         sel_edit_c = "➕ ลงทะเบียนลูกค้าใหม่"
 
+    # Bulk import
+    with st.expander("📥 นำเข้าลูกค้าจากไฟล์ (CSV / Excel)"):
+        st.caption("คอลัมน์ที่รองรับ: " + ", ".join(IMPORT_COLUMNS) + " (หรือหัวคอลัมน์ภาษาไทย เช่น ชื่อ-นามสกุล, เบอร์โทร, จังหวัด, รหัสไปรษณีย์)")
+        up_file = st.file_uploader("เลือกไฟล์", type=["csv", "xlsx"], key="cust_import_file")
+        if up_file is not None and st.button("🚀 เริ่มนำเข้า", type="primary", use_container_width=True):
+            prog = st.empty()
+            t0 = time.perf_counter()
+            n_ok, df_rej = import_customers(up_file, on_progress=lambda n, ok, bad: prog.info(f"⏳ ชุดที่ {n}: นำเข้าแล้ว {ok:,} แถว, ไม่ผ่าน {bad:,} แถว"))
+            prog.success(f"✅ นำเข้า {n_ok:,} รายการ ใน {time.perf_counter() - t0:.1f} วินาที")
+            st.session_state.import_rejects = df_rej
+            st.session_state.dedup_candidates = None
+        df_rej = st.session_state.get('import_rejects')
+        if df_rej is not None and not df_rej.empty:
+            st.warning(f"⚠️ มี {len(df_rej):,} แถวที่ไม่ผ่านการตรวจสอบ")
+            st.dataframe(df_rej.head(100), hide_index=True, use_container_width=True)
+            st.download_button("📥 ดาวน์โหลดไฟล์แถวที่ไม่ผ่าน (CSV)", df_rej.to_csv(index=False).encode('utf-8-sig'),
+                               file_name="customer_import_rejects.csv", mime="text/csv")
+
+    # Province clean-up (typos, abbreviations, romanized names)
+    if not df_all_c.empty:
+        with st.expander("🧹 ปรับที่อยู่ให้เป็นมาตรฐาน"):
+            b1, b2 = st.columns(2)
+            if b1.button("🔍 ตรวจชื่อจังหวัดที่ไม่ตรงรายชื่อ", use_container_width=True):
+                st.session_state.province_fixes = province_fix_suggestions()
+            if b2.button("📮 เติมรหัสไปรษณีย์ / อำเภอที่ว่าง", use_container_width=True):
+                st.success(f"✅ เติมข้อมูลที่อยู่แล้ว {backfill_customer_addresses():,} รายการ")
+            fixes = st.session_state.get('province_fixes')
+            if fixes is not None:
+                if fixes.empty:
+                    st.success("✅ ชื่อจังหวัดของลูกค้าทุกคนถูกต้องแล้ว")
+                else:
+                    edited = st.data_editor(fixes, hide_index=True, use_container_width=True, key="province_fix_editor",
+                                            disabled=["raw", "customers"],
+                                            column_config={
+                                                "raw": "ค่าที่บันทึกไว้",
+                                                "customers": st.column_config.NumberColumn("จำนวนลูกค้า", format="%d"),
+                                                "suggestion": st.column_config.SelectboxColumn("แก้เป็น", options=[''] + provinces())
+                                            })
+                    if st.button("💾 บันทึกการแก้ไขทั้งหมด", type="primary", use_container_width=True):
+                        n = apply_province_fixes(dict(zip(edited['raw'], edited['suggestion'])))
+                        st.session_state.province_fixes = None
+                        st.success(f"✅ ปรับชื่อจังหวัดแล้ว {n:,} รายการ")
+                        st.rerun()
+
+    # Duplicate finder & merge
+    if not df_all_c.empty:
+        with st.expander("🧬 ตรวจหาลูกค้าซ้ำ (Dedup & Merge)"):
+            if st.button("🔍 สแกนหาลูกค้าซ้ำ", use_container_width=True):
+                st.session_state.dedup_candidates = find_duplicate_candidates(df_all_c)
+            cand = st.session_state.get('dedup_candidates')
+            if cand is not None:
+                if cand.empty:
+                    st.success("✅ ไม่พบลูกค้าที่น่าจะซ้ำกัน")
+                else:
+                    names = df_all_c.set_index('customer_id')['full_name']
+                    cand = cand[cand['customer_id_a'].isin(names.index) & cand['customer_id_b'].isin(names.index)]
+                    cand = cand.assign(name_a=cand['customer_id_a'].map(names), name_b=cand['customer_id_b'].map(names))
+                    st.dataframe(cand[['customer_id_a', 'name_a', 'customer_id_b', 'name_b', 'reasons', 'score']], hide_index=True, use_container_width=True,
+                                 column_config={
+                                     "customer_id_a": "ID A", "name_a": "ลูกค้า A",
+                                     "customer_id_b": "ID B", "name_b": "ลูกค้า B",
+                                     "reasons": "ตรงกันที่",
+                                     "score": st.column_config.ProgressColumn("ความน่าจะซ้ำ", min_value=0, max_value=1, format="%.1f")
+                                 })
+                    pair_opts = [f"{r['customer_id_a']} | {r['name_a']} ↔ {r['customer_id_b']} | {r['name_b']}" for _, r in cand.iterrows()]
+                    if pair_opts:
+                        sel_pair = st.selectbox("เลือกคู่ที่ต้องการรวม", pair_opts)
+                        id_a, id_b = int(sel_pair.split(" | ")[0]), int(sel_pair.split(" ↔ ")[1].split(" | ")[0])
+                        keep = st.radio("เก็บข้อมูลของ", [id_a, id_b], horizontal=True, format_func=lambda i: f"{i} | {names[i]}")
+                        drop = id_b if keep == id_a else id_a
+                        st.caption(f"บิล เครดิต บันทึกการติดต่อ Tags และ Feedback ของ {drop} จะย้ายไปที่ {keep} แล้วลบ {drop}")
+                        if st.button("🔗 รวมข้อมูลลูกค้า", type="primary", use_container_width=True):
+                            merge_customers(keep, drop)
+                            reset_customer_timeline(keep)
+                            reset_customer_timeline(drop)
+                            st.session_state.dedup_candidates = None
+                            st.session_state.last_selected_cust = None
+                            st.success(f"✅ รวมลูกค้า {drop} เข้ากับ {keep} แล้ว")
+                            st.rerun()
+
     # --- Mode: New Customer ---
     if sel_edit_c == "➕ ลงทะเบียนลูกค้าใหม่":
         st.subheader("📝 ลงทะเบียนลูกค้าใหม่")
+        
+        # Address sits outside the form so each dependent select updates immediately
+        st.markdown("**📍 ที่อยู่**")
+        reg_addr = address_picker("reg_addr")
+        
         with st.form("new_cust_form"):
             c1, c2 = st.columns(2)
             name = c1.text_input("ชื่อ-นามสกุลจริง *")
@@ -978,21 +3097,25 @@ elif choice == "👥 จัดการลูกค้า":
             birth = c1.date_input("วันเกิด (Birth Date)", value=None, min_value=datetime(1950, 1, 1), max_value=datetime.now())
             gender = c2.selectbox("เพศ", ["ชาย", "หญิง", "อื่นๆ", "ไม่ระบุ"])
             
-            addr = st.text_area("ที่อยู่จัดส่ง")
-            prov = st.selectbox("จังหวัด", ["-- โปรดเลือก --"] + sorted(list(LOCATION_DATA.keys())))
+            addr = st.text_area("ที่อยู่จัดส่ง (บ้านเลขที่ ถนน)")
             
+            force_new = st.checkbox("ยืนยันบันทึก แม้พบข้อมูลที่คล้ายลูกค้าเดิม")
             sub_btn = st.form_submit_button("💾 บันทึกข้อมูลลูกค้าใหม่", use_container_width=True, type="primary")
             if sub_btn and name:
-                check = run_query("SELECT COUNT(*) as cnt FROM customers WHERE full_name = :name", {"name": name})
-                if check['cnt'][0] == 0:
+                df_match = find_customer_matches(df_all_c, name, phone, line)
+                if df_match.empty or force_new:
                     run_query("""
-                        INSERT INTO customers (full_name, nickname, phone, line_id, birth_date, gender, address_detail, province)
-                        VALUES (:name, :nick, :phone, :line, :birth, :gender, :addr, :prov)
-                    """, {"name": name, "nick": nick, "phone": phone, "line": line, "birth": birth, "gender": gender, "addr": addr, "prov": prov})
+                        INSERT INTO customers (full_name, nickname, phone, line_id, birth_date, gender, address_detail,
+                                               province, district, sub_district, zipcode)
+                        VALUES (:name, :nick, :phone, :line, :birth, :gender, :addr, :province, :district, :sub_district, :zipcode)
+                    """, {"name": name, "nick": nick, "phone": phone, "line": line, "birth": birth, "gender": gender, "addr": addr,
+                          **reg_addr})
+                    reset_address_picker("reg_addr")
                     st.success("บันทึกเรียบร้อย!")
                     st.rerun()
                 else:
-                    st.error("ชื่อซ้ำในระบบ")
+                    st.error("⚠️ พบลูกค้าที่อาจซ้ำกัน (ชื่อ/เบอร์โทร/LINE ตรงกัน): " +
+                             ", ".join(f"{r['customer_id']} | {r['full_name']} ({r['phone'] or '-'})" for _, r in df_match.head(5).iterrows()))
 
     # --- Mode: Existing Customer (360 View) ---
     else:
@@ -1075,8 +3198,12 @@ elif choice == "👥 จัดการลูกค้า":
                             if row['status'] == 'Available':
                                 if sc2.button("เช็กอิน", key=f"chk_{row['credit_id']}"):
                                     run_query("UPDATE course_credits SET status='Used' WHERE credit_id=:id", {"id": row['credit_id']})
+                                    run_query("DELETE FROM credit_alerts WHERE credit_id=:id", {"id": row['credit_id']})
+                                    get_credit_alert_badge.clear()
                                     st.success("Check-in!")
                                     st.rerun()
+                            elif row['status'] == 'Expired':
+                                sc2.error("หมดอายุ")
                             else:
                                 sc2.success("ใช้แล้ว")
                 else:
@@ -1089,6 +3216,8 @@ elif choice == "👥 จัดการลูกค้า":
                              column_config={"final_amount": st.column_config.NumberColumn("ยอดเงิน", format="฿%,.2f"), "sale_date": st.column_config.DatetimeColumn("วันที่", format="DD/MM/YYYY")})
 
         with t_edit:
+            st.markdown("**📍 ที่อยู่**")
+            edit_addr = address_picker(f"edit_addr_{cid}", cust['province'], cust['district'], cust['sub_district'], cust['zipcode'])
             with st.form("edit_cust_form"):
                 ec1, ec2 = st.columns(2)
                 
@@ -1117,8 +3246,7 @@ elif choice == "👥 จัดการลูกค้า":
                 eig = ec2.text_input("Instagram", value=cust['instagram'] or "")
 
                 # Address Section
-                eaddr = st.text_area("ที่อยู่", value=cust['address_detail'] or "")
-                eprov = st.selectbox("จังหวัด", ["--"] + sorted(list(LOCATION_DATA.keys())), index=(sorted(list(LOCATION_DATA.keys())).index(cust['province']) + 1) if cust['province'] in LOCATION_DATA else 0)
+                eaddr = st.text_area("ที่อยู่ (บ้านเลขที่ ถนน)", value=cust['address_detail'] or "")
                 
                 # Family & Status
                 st.divider()
@@ -1133,20 +3261,24 @@ elif choice == "👥 จัดการลูกค้า":
                         UPDATE customers SET 
                         full_name=:n, nickname=:nn, birth_date=:b, gender=:g, 
                         phone=:p, line_id=:l, facebook=:fb, instagram=:ig,
-                        address_detail=:a, province=:pv, marital_status=:m, has_children=:c,
+                        address_detail=:a, province=:province, district=:district, sub_district=:sub_district, zipcode=:zipcode,
+                        marital_status=:m, has_children=:c,
                         cust_note=:nt 
                         WHERE customer_id=:cid
                     """,
                     {"n": ename, "nn": enick, "b": ebirth, "g": egender, 
                      "p": ephone, "l": eline, "fb": efb, "ig": eig,
-                     "a": eaddr, "pv": eprov, "m": emarital, "c": echildren,
+                     "a": eaddr, **edit_addr, "m": emarital, "c": echildren,
                      "nt": enote, "cid": cid})
+                    reset_address_picker(f"edit_addr_{cid}")
+                    invalidate_search_source('customer')
                     st.success("บันทึกข้อมูลเรียบร้อย!")
                     st.rerun()
                 
                 st.divider()
                 if st.form_submit_button("🗑️ ลบข้อมูลลูกค้านี้"):
                     run_query("DELETE FROM customers WHERE customer_id=:id", {"id": cid})
+                    invalidate_search_source('customer')
                     st.session_state.last_selected_cust = None
                     st.warning("ลบข้อมูลแล้ว")
                     st.rerun()
@@ -1157,7 +3289,7 @@ elif choice == "👥 จัดการลูกค้า":
 elif choice == "👔 จัดการพนักงาน":
     st.header("👔 การจัดการพนักงาน")
     
-    tab_list, tab_kpi, tab_new = st.tabs(["📋 รายชื่อพนักงาน", "🏆 Performance (KPI)", "➕ เพิ่มพนักงานใหม่"])
+    tab_list, tab_kpi, tab_comm, tab_new = st.tabs(["📋 รายชื่อพนักงาน", "🏆 Performance (KPI)", "💸 Commission", "➕ เพิ่มพนักงานใหม่"])
     
     # Tab 1: List (Existing Logic)
     with tab_list:
@@ -1167,8 +3299,8 @@ elif choice == "👔 จัดการพนักงาน":
         df_e = run_query("SELECT * FROM employees")
         if not df_e.empty:
             if search_e:
-                df_fe = df_e[df_e['emp_name'].str.contains(search_e, case=False, na=False) | 
-                             df_e['emp_nickname'].str.contains(search_e, case=False, na=False)]
+                df_fe = df_e[df_e['emp_name'].str.contains(search_e, case=False, na=False, regex=False) | 
+                             df_e['emp_nickname'].str.contains(search_e, case=False, na=False, regex=False)]
             else:
                 df_fe = df_e
             
@@ -1183,6 +3315,7 @@ elif choice == "👔 จัดการพนักงาน":
                     eid_sel = int(esel.split(" | ")[0])
                     if st.button("🗑️ ลบพนักงานคนนี้", key="del_emp"):
                         run_query("DELETE FROM employees WHERE emp_id=:id", {"id": eid_sel})
+                        invalidate_search_source('employee')
                         st.success("Deleted")
                         st.rerun()
 
@@ -1285,7 +3418,72 @@ elif choice == "👔 จัดการพนักงาน":
         else:
             st.warning("ไม่มีข้อมูลการขายในช่วงเวลานี้")
 
-    # Tab 3: Add New (Placeholder for future)
+    # Tab 3: Individual Goals & Commission
+    with tab_comm:
+        st.subheader("💸 เป้ารายบุคคล & ค่าคอมมิชชั่น")
+        
+        c_month = st.selectbox("📅 เดือน", recent_months(12), key="comm_month")
+        # Once a month is snapshotted its targets no longer feed the report, so they are read-only
+        snapshotted = not run_query("SELECT 1 FROM commission_snapshots WHERE month_year = :m LIMIT 1", {"m": c_month}).empty
+        
+        with st.expander("🎯 ตั้งเป้ารายบุคคล"):
+            if snapshotted:
+                st.warning(f"🔒 เดือน {c_month} ล็อกค่าคอมแล้ว — แก้ไขเป้าไม่ได้")
+            df_ig = run_query("""
+                SELECT e.emp_id, e.emp_name, e.emp_nickname, COALESCE(g.target_amount, 0) AS target_amount
+                FROM employees e
+                LEFT JOIN individual_goals g ON g.emp_id = e.emp_id AND g.month_year = :m
+                ORDER BY e.emp_name
+            """, {"m": c_month})
+            df_ig_edit = st.data_editor(df_ig, hide_index=True, use_container_width=True, key=f"ind_goals_{c_month}",
+                                        disabled=True if snapshotted else ['emp_id', 'emp_name', 'emp_nickname'],
+                                        column_config={
+                                            "emp_id": None,
+                                            "emp_name": "พนักงาน",
+                                            "emp_nickname": "ชื่อเล่น",
+                                            "target_amount": st.column_config.NumberColumn("เป้า (บาท)", min_value=0, format="฿%,.0f")
+                                        })
+            if st.button("💾 บันทึกเป้ารายบุคคล", use_container_width=True, disabled=snapshotted) and not df_ig_edit.empty:
+                run_query("""
+                    INSERT INTO individual_goals (month_year, emp_id, target_amount)
+                    SELECT :m, t.emp_id, t.target
+                    FROM unnest(CAST(:ids AS INTEGER[]), CAST(:targets AS REAL[])) AS t(emp_id, target)
+                    ON CONFLICT (month_year, emp_id) DO UPDATE SET target_amount = EXCLUDED.target_amount
+                """, {"m": c_month, "ids": df_ig_edit['emp_id'].astype(int).tolist(),
+                      "targets": df_ig_edit['target_amount'].fillna(0).astype(float).tolist()})
+                st.success("✅ บันทึกเป้าแล้ว")
+                st.rerun()
+        
+        st.caption("ขั้นค่าคอม (ตามเปอร์เซ็นต์ที่ทำได้ของเป้า): " + " · ".join(f"≥{m}% → {r:g}%" for m, r in COMMISSION_TIERS))
+        df_comm, is_frozen = get_commission_report(c_month)
+        if is_frozen:
+            st.info(f"🔒 เดือน {c_month} ปิดแล้ว — แสดงตัวเลขที่ล็อกไว้ (snapshot)")
+        
+        if df_comm.empty:
+            st.warning("ไม่มีข้อมูลยอดขายหรือเป้าในเดือนนี้")
+        else:
+            cm1, cm2, cm3 = st.columns(3)
+            cm1.metric("💰 ยอดขายสุทธิ", f"฿{df_comm['net_sales'].sum():,.0f}")
+            cm2.metric("↩️ หักคืน (Refund)", f"฿{df_comm['clawback'].sum():,.0f}")
+            cm3.metric("💸 ค่าคอมรวม", f"฿{df_comm['commission'].sum():,.0f}")
+            
+            comm_cols = ['emp_name', 'target', 'bill_count', 'gross_sales', 'clawback', 'net_sales', 'attainment', 'rate', 'commission']
+            st.dataframe(df_comm[comm_cols], hide_index=True, use_container_width=True,
+                         column_config={
+                             "emp_name": "พนักงาน",
+                             "target": st.column_config.NumberColumn("เป้า", format="฿%,.0f"),
+                             "bill_count": "บิล",
+                             "gross_sales": st.column_config.NumberColumn("ยอดขาย", format="฿%,.0f"),
+                             "clawback": st.column_config.NumberColumn("หักคืน", format="฿%,.0f"),
+                             "net_sales": st.column_config.NumberColumn("ยอดสุทธิ", format="฿%,.0f"),
+                             "attainment": st.column_config.NumberColumn("% เป้า", format="%.0f%%"),
+                             "rate": st.column_config.NumberColumn("อัตราคอม", format="%.1f%%"),
+                             "commission": st.column_config.NumberColumn("ค่าคอม", format="฿%,.0f")
+                         })
+            st.download_button("📥 ดาวน์โหลด CSV สำหรับ Payroll", df_comm[comm_cols].to_csv(index=False).encode('utf-8-sig'),
+                               file_name=f"commission_{c_month}.csv", mime="text/csv")
+
+    # Tab 4: Add New (Placeholder for future)
     with tab_new:
         st.info("ฟีเจอร์เพิ่มพนักงานใหม่อยู่ที่หน้านี้ (ยังไม่ได้ย้ายมาจากเวอร์ชั่นเก่า - ใช้ SQL Insert ชั่วคราวได้)")
         # We can add simple add form here if desired, but user focused on KPI.
@@ -1346,6 +3544,8 @@ elif choice == "📦 จัดการสินค้า":
                     if edit_mode:
                         run_query("UPDATE products SET product_name=:name, cat_id=:cat, price=:price WHERE product_id=:id", 
                                   {"name": pn, "cat": cat_id, "price": pr, "id": edit_id})
+                        invalidate_search_source('product')
+                        load_package_index.clear()
                         st.success(f"✅ อัปเดต {pn} สำเร็จ!")
                     else:
                         run_query("INSERT INTO products (product_name, cat_id, price) VALUES (:name, :cat, :price)", 
@@ -1357,6 +3557,8 @@ elif choice == "📦 จัดการสินค้า":
         if edit_mode:
             if bc2.button("🗑️ ลบสินค้านี้", use_container_width=True):
                 run_query("DELETE FROM products WHERE product_id = :id", {"id": edit_id})
+                invalidate_search_source('product')
+                load_package_index.clear()
                 st.warning(f"ลบสินค้า {pn} เรียบร้อย")
                 st.rerun()
 
@@ -1365,7 +3567,7 @@ elif choice == "📦 จัดการสินค้า":
     search_p = st.text_input("🔍 ค้นหาสินค้า", placeholder="พิมพ์ชื่อสินค้าที่นี่...")
     if not df_p.empty:
         if search_p:
-            df_fp = df_p[df_p['product_name'].str.contains(search_p, case=False, na=False)]
+            df_fp = df_p[df_p['product_name'].str.contains(search_p, case=False, na=False, regex=False)]
         else:
             df_fp = df_p
         
@@ -1430,14 +3632,14 @@ elif choice == "⚙️ ตั้งค่าระบบ":
             curr_pos_name = df_pos_set[df_pos_set['pos_id'] == edit_p_id].iloc[0]['pos_name']
             
         with st.form("pos_form", clear_on_submit=True):
-            np = st.text_input("ชื่อตำแหน่งงาน", value=curr_pos_name)
+            pos_name = st.text_input("ชื่อตำแหน่งงาน", value=curr_pos_name)
             pb1, pb2 = st.columns([1, 1])
             if pb1.form_submit_button("💾 บันทึก"):
-                if np:
+                if pos_name:
                     if edit_p_mode:
-                        run_query("UPDATE job_positions SET pos_name=:name WHERE pos_id=:id", {"name": np, "id": edit_p_id})
+                        run_query("UPDATE job_positions SET pos_name=:name WHERE pos_id=:id", {"name": pos_name, "id": edit_p_id})
                     else:
-                        run_query("INSERT INTO job_positions (pos_name) VALUES (:name)", {"name": np})
+                        run_query("INSERT INTO job_positions (pos_name) VALUES (:name)", {"name": pos_name})
                     st.rerun()
             if edit_p_mode:
                 if pb2.form_submit_button("🗑️ ลบ"):
@@ -1452,82 +3654,260 @@ elif choice == "⚙️ ตั้งค่าระบบ":
             st.info("ยังไม่มีตำแหน่งงาน")
 
 
-# --- 📊 Lead Funnel Dashboard (Mock) ---
+# --- 📊 Lead Funnel Dashboard ---
 elif choice == "📊 Lead Funnel":
     st.header("📊 Lead Funnel Dashboard")
-    st.caption("🚧 ตัวอย่างข้อมูล (Mock Data) สำหรับการพรีเซ้นต์")
+    st.caption("Lead → ลงทะเบียน → ชำระเงิน จาก daily_leads, daily_registers และบิลจริง (sale_channel)")
     
-    # Sample Funnel Data
-    funnel_data = pd.DataFrame({
-        "ขั้นตอน": ["Lead ทั้งหมด", "สนใจ (Interested)", "ลงทะเบียน (Registered)", "จ่ายเงิน (Paid)"],
-        "จำนวน": [500, 320, 150, 85],
-        "อัตรา (%)": [100, 64, 30, 17]
-    })
+    df_cat = run_query("SELECT cat_id, cat_name FROM categories ORDER BY cat_name")
     
-    # Metrics Row
-    m1, m2, m3, m4 = st.columns(4)
-    m1.metric("📥 Lead ทั้งหมด", "500 คน", "+12%")
-    m2.metric("📝 ลงทะเบียน", "150 คน", "+8%")
-    m3.metric("💰 ปิดการขาย", "85 คน", "+15%")
-    m4.metric("📈 Conversion Rate", "17%", "+3%")
+    # Bulk entry grid: one row per channel x category for the chosen day
+    with st.expander("📝 บันทึก Lead / ลงทะเบียน รายวัน (แบบตาราง)", expanded=False):
+        gc1, gc2 = st.columns([1, 2])
+        entry_date = gc1.date_input("วันที่", value=datetime.now().date(), key="funnel_entry_date")
+        entry_cats = gc2.multiselect("หมวดหมู่", df_cat['cat_name'].tolist(), default=df_cat['cat_name'].tolist())
+        
+        df_existing = run_query("""
+            SELECT COALESCE(l.channel, r.channel) AS channel, COALESCE(l.cat_id, r.cat_id) AS cat_id,
+                   l.lead_count, r.reg_count
+            FROM (SELECT channel, cat_id, lead_count FROM daily_leads WHERE lead_date = :d AND event_id = 0) l
+            FULL OUTER JOIN (SELECT channel, cat_id, reg_count FROM daily_registers WHERE reg_date = :d AND event_id = 0) r
+              ON l.channel = r.channel AND l.cat_id = r.cat_id
+        """, {"d": entry_date})
+        
+        df_grid = pd.MultiIndex.from_product([MKT_CHANNELS, df_cat[df_cat['cat_name'].isin(entry_cats)]['cat_id'].tolist()],
+                                             names=['channel', 'cat_id']).to_frame(index=False)
+        df_grid = df_grid.merge(df_existing, on=['channel', 'cat_id'], how='left')
+        df_grid['existed'] = df_grid['lead_count'].notna() | df_grid['reg_count'].notna()
+        df_grid[['lead_count', 'reg_count']] = df_grid[['lead_count', 'reg_count']].fillna(0).astype(int)
+        df_grid = df_grid.merge(df_cat, on='cat_id', how='left')
+        
+        df_edited = st.data_editor(df_grid[['channel', 'cat_name', 'lead_count', 'reg_count']], hide_index=True,
+                                   use_container_width=True, disabled=['channel', 'cat_name'], key="funnel_grid",
+                                   column_config={
+                                       "channel": "ช่องทาง",
+                                       "cat_name": "หมวดหมู่",
+                                       "lead_count": st.column_config.NumberColumn("Lead", min_value=0, step=1),
+                                       "reg_count": st.column_config.NumberColumn("ลงทะเบียน", min_value=0, step=1)
+                                   })
+        
+        if st.button("💾 บันทึกทั้งตาราง", type="primary", use_container_width=True):
+            df_save = df_grid[['channel', 'cat_id', 'existed']].assign(
+                lead_count=df_edited['lead_count'].fillna(0).astype(int).values,
+                reg_count=df_edited['reg_count'].fillna(0).astype(int).values)
+            # Only rows with a value or an existing row need writing
+            df_save = df_save[df_save['existed'] | (df_save['lead_count'] > 0) | (df_save['reg_count'] > 0)]
+            arrays = {"d": entry_date, "chs": df_save['channel'].tolist(),
+                      "cats": df_save['cat_id'].astype(int).tolist()}
+            run_transaction([
+                ("""
+                    INSERT INTO daily_leads (lead_date, channel, cat_id, lead_count)
+                    SELECT :d, t.channel, t.cat_id, t.cnt
+                    FROM unnest(CAST(:chs AS TEXT[]), CAST(:cats AS INTEGER[]), CAST(:cnts AS INTEGER[])) AS t(channel, cat_id, cnt)
+                    ON CONFLICT (lead_date, channel, cat_id, event_id) DO UPDATE SET lead_count = EXCLUDED.lead_count
+                """, {**arrays, "cnts": df_save['lead_count'].tolist()}),
+                ("""
+                    INSERT INTO daily_registers (reg_date, channel, cat_id, reg_count)
+                    SELECT :d, t.channel, t.cat_id, t.cnt
+                    FROM unnest(CAST(:chs AS TEXT[]), CAST(:cats AS INTEGER[]), CAST(:cnts AS INTEGER[])) AS t(channel, cat_id, cnt)
+                    ON CONFLICT (reg_date, channel, cat_id, event_id) DO UPDATE SET reg_count = EXCLUDED.reg_count
+                """, {**arrays, "cnts": df_save['reg_count'].tolist()}),
+            ])
+            refresh_funnel_rollup(since=entry_date)
+            load_funnel_rollup.clear()
+            get_channel_roi.clear()
+            st.success(f"✅ บันทึก {len(df_save)} แถวแล้ว")
+            st.rerun()
     
-    st.divider()
+    df_funnel = load_funnel_rollup()
     
-    # Funnel Visualization
-    c1, c2 = st.columns([2, 1])
-    with c1:
-        st.subheader("📈 Funnel Chart")
-        st.bar_chart(funnel_data.set_index("ขั้นตอน")["จำนวน"], color="#6366F1")
+    if df_funnel.empty:
+        st.info("ยังไม่มีข้อมูล Lead หรือยอดขายในระบบ")
+    else:
+        # Filters work on the cached rollup, so switching is instant
+        months = sorted(df_funnel['month_year'].unique(), reverse=True)
+        fc1, fc2, fc3 = st.columns(3)
+        sel_months = fc1.multiselect("📅 เดือน", months, default=months[:1])
+        sel_channels = fc2.multiselect("📡 ช่องทาง", sorted(df_funnel['channel'].unique()))
+        sel_cats = fc3.multiselect("📂 หมวดหมู่", sorted(df_funnel['cat_name'].unique()))
+        
+        df_f = df_funnel[df_funnel['month_year'].isin(sel_months or months)]
+        if sel_channels:
+            df_f = df_f[df_f['channel'].isin(sel_channels)]
+        if sel_cats:
+            df_f = df_f[df_f['cat_name'].isin(sel_cats)]
+        
+        # paid_bills is fractional per category (a bill is split over its categories)
+        leads, regs, paid = int(df_f['leads'].sum()), int(df_f['registers'].sum()), int(round(df_f['paid_bills'].sum()))
+        
+        # Metrics Row
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("📥 Lead ทั้งหมด", f"{leads:,} คน")
+        m2.metric("📝 ลงทะเบียน", f"{regs:,} คน", f"{regs / leads * 100:.0f}% ของ Lead" if leads else None)
+        m3.metric("💰 ปิดการขาย", f"{paid:,} บิล", f"฿{df_f['revenue'].sum():,.0f}")
+        m4.metric("📈 Conversion Rate", f"{paid / leads * 100:.1f}%" if leads else "-")
+        
+        st.divider()
+        
+        # Funnel Visualization
+        c1, c2 = st.columns([2, 1])
+        with c1:
+            st.subheader("📈 Funnel Chart")
+            funnel_data = pd.DataFrame({
+                "ขั้นตอน": ["1. Lead ทั้งหมด", "2. ลงทะเบียน (Registered)", "3. จ่ายเงิน (Paid)"],
+                "จำนวน": [leads, regs, paid]
+            })
+            st.bar_chart(funnel_data.set_index("ขั้นตอน")["จำนวน"], color="#6366F1")
+        
+        with c2:
+            st.subheader("📊 Conversion by Channel")
+            channel_conv = df_f.groupby('channel')[['leads', 'registers', 'paid_bills', 'revenue']].sum().reset_index()
+            channel_conv['conv'] = (channel_conv['paid_bills'] / channel_conv['leads'].where(channel_conv['leads'] > 0) * 100).round(1)
+            st.dataframe(channel_conv.sort_values('revenue', ascending=False), hide_index=True, use_container_width=True,
+                         column_config={
+                             "channel": "Channel",
+                             "leads": "Leads",
+                             "registers": "ลงทะเบียน",
+                             "paid_bills": st.column_config.NumberColumn("Paid", format="%.1f"),
+                             "revenue": st.column_config.NumberColumn("ยอดขาย", format="฿%,.0f"),
+                             "conv": st.column_config.NumberColumn("Conv %", format="%.1f%%")
+                         })
+        
+        st.subheader("📆 แนวโน้มรายเดือน")
+        df_trend = df_funnel
+        if sel_channels:
+            df_trend = df_trend[df_trend['channel'].isin(sel_channels)]
+        if sel_cats:
+            df_trend = df_trend[df_trend['cat_name'].isin(sel_cats)]
+        st.line_chart(df_trend.groupby('month_year')[['leads', 'registers', 'paid_bills']].sum())
     
-    with c2:
-        st.subheader("📊 Conversion by Channel")
-        channel_conv = pd.DataFrame({
-            "Channel": ["Facebook Ads", "TikTok Ads", "Line OA", "Google Ads"],
-            "Leads": [200, 150, 100, 50],
-            "Paid": [40, 25, 15, 5],
-            "Conv %": ["20%", "17%", "15%", "10%"]
-        })
-        st.dataframe(channel_conv, hide_index=True, use_container_width=True)
+    if st.button("🔄 คำนวณ Rollup ใหม่ทั้งหมด"):
+        refresh_marketing_rollups()
+        mark_job_run("marketing_rollups")
+        st.rerun()
 
 
-# --- 🔔 Follow-up System (Mock) ---
+# --- 🔔 Follow-up System ---
 elif choice == "🔔 Follow-up System":
     st.header("🔔 Customer Follow-up System")
-    st.caption("🚧 ตัวอย่างข้อมูล (Mock Data) สำหรับการพรีเซ้นต์")
+    
+    alert_days = st.slider("⏰ แสดงคอร์สที่จะหมดอายุภายใน (วัน)", min_value=7, max_value=CREDIT_ALERT_WINDOW_DAYS, value=30)
+    
+    # Read the precomputed alert table (rebuilt by the daily credit_alerts job)
+    df_alerts = run_query("""
+        SELECT a.customer_id, c.full_name, c.phone, COUNT(*) AS credits,
+               STRING_AGG(DISTINCT p.product_name, ', ') AS courses,
+               MIN(a.expiry_date) AS next_expiry, MIN(a.days_left) AS days_left
+        FROM credit_alerts a
+        LEFT JOIN customers c ON a.customer_id = c.customer_id
+        LEFT JOIN products p ON a.product_id = p.product_id
+        WHERE a.days_left <= :days
+        GROUP BY a.customer_id, c.full_name, c.phone
+        ORDER BY days_left, credits DESC
+    """, {"days": alert_days})
+    pending_followups = run_query("SELECT COUNT(*) AS cnt FROM contact_logs WHERE follow_up_date >= CURRENT_DATE")
+    churn_summary = run_query("""
+        SELECT COUNT(*) FILTER (WHERE days_since > 60) AS lapsed,
+               COUNT(*) FILTER (WHERE risk_level IN ('high', 'very_high')) AS high_risk
+        FROM churn_scores
+    """)
+    
+    if not df_alerts.empty:
+        df_alerts['bucket'] = df_alerts['days_left'].apply(credit_bucket)
     
     # Alert Summary
     a1, a2, a3 = st.columns(3)
-    a1.metric("⏰ คอร์สใกล้หมดอายุ", "12 คน", delta="-3 จากสัปดาห์ก่อน")
-    a2.metric("🔕 ลูกค้าห่างหาย (>60 วัน)", "28 คน", delta="+5")
-    a3.metric("📞 รอติดตาม", "15 รายการ")
+    a1.metric("⏰ คอร์สใกล้หมดอายุ", f"{len(df_alerts)} คน",
+              delta=f"{int((df_alerts['bucket'] == 'urgent').sum())} เร่งด่วน" if not df_alerts.empty else None,
+              delta_color="inverse")
+    a2.metric("🔕 ลูกค้าห่างหาย (>60 วัน)", f"{int(churn_summary['lapsed'][0])} คน",
+              delta=f"{int(churn_summary['high_risk'][0])} เสี่ยงสูง", delta_color="inverse")
+    a3.metric("📞 รอติดตาม", f"{int(pending_followups['cnt'][0])} รายการ")
     
     st.divider()
     
-    # Sample Alerts
     t1, t2 = st.tabs(["⏰ Course Credit Alert", "🔕 Churn Risk Alert"])
     
     with t1:
-        credit_alerts = pd.DataFrame({
-            "ลูกค้า": ["คุณสมศรี", "คุณวิชัย", "คุณแพร", "คุณเบล"],
-            "คอร์ส": ["V-School Dance", "V-School Sing", "V-School Art", "V-School Music"],
-            "หมดอายุ": ["2026-02-15", "2026-02-20", "2026-02-28", "2026-03-05"],
-            "เหลืออีก": ["14 วัน", "19 วัน", "27 วัน", "32 วัน"],
-            "สถานะ": ["🔴 เร่งด่วน", "🟡 เตือน", "🟢 ปกติ", "🟢 ปกติ"]
-        })
-        st.dataframe(credit_alerts, hide_index=True, use_container_width=True)
+        if not df_alerts.empty:
+            b1, b2, b3 = st.columns(3)
+            for col, bucket in zip([b1, b2, b3], ['urgent', 'warning', 'normal']):
+                col.metric(CREDIT_BUCKET_LABELS[bucket], f"{int((df_alerts['bucket'] == bucket).sum())} คน")
+            
+            df_alerts['สถานะ'] = df_alerts['bucket'].map(CREDIT_BUCKET_LABELS)
+            st.dataframe(df_alerts[['full_name', 'phone', 'courses', 'credits', 'next_expiry', 'days_left', 'สถานะ']],
+                         hide_index=True, use_container_width=True,
+                         column_config={
+                             "full_name": "ลูกค้า",
+                             "phone": "เบอร์โทร",
+                             "courses": "คอร์ส",
+                             "credits": "จำนวนสิทธิ์",
+                             "next_expiry": st.column_config.DateColumn("หมดอายุ", format="DD/MM/YYYY"),
+                             "days_left": st.column_config.NumberColumn("เหลืออีก", format="%d วัน")
+                         })
+        else:
+            st.success(f"✅ ไม่มีคอร์สที่จะหมดอายุภายใน {alert_days} วัน")
+        
+        last_run = run_query("SELECT last_run FROM job_runs WHERE job_name = 'credit_alerts'")
+        rc1, rc2 = st.columns([3, 1])
+        rc1.caption(f"🕒 คำนวณล่าสุด: {last_run['last_run'][0]:%d/%m/%Y %H:%M}" if not last_run.empty and pd.notnull(last_run['last_run'][0]) else "🕒 ยังไม่เคยคำนวณ")
+        if rc2.button("🔄 คำนวณใหม่ตอนนี้", use_container_width=True):
+            refresh_credit_alerts()
+            mark_job_run("credit_alerts")
+            get_credit_alert_badge.clear()
+            st.rerun()
     
     with t2:
-        churn_alerts = pd.DataFrame({
-            "ลูกค้า": ["คุณมานี", "คุณปิติ", "คุณชูใจ"],
-            "ซื้อล่าสุด": ["2025-11-15", "2025-10-20", "2025-09-01"],
-            "ห่างหาย": ["78 วัน", "103 วัน", "153 วัน"],
-            "ยอดใช้จ่ายรวม": ["฿45,000", "฿28,000", "฿120,000"],
-            "ความเสี่ยง": ["🟡 ปานกลาง", "🔴 สูง", "🔴 สูงมาก"]
-        })
-        st.dataframe(churn_alerts, hide_index=True, use_container_width=True)
+        fc1, fc2, fc3 = st.columns([2, 2, 1])
+        risk_filter = fc1.multiselect("ระดับความเสี่ยง", ['medium', 'high', 'very_high'], default=['high', 'very_high'],
+                                      format_func=lambda x: CHURN_RISK_LABELS[x])
+        sort_label = fc2.selectbox("เรียงตาม", list(CHURN_SORT_OPTIONS.keys()))
+        page_size = fc3.selectbox("ต่อหน้า", [25, 50, 100])
+        
+        # Sort column comes from a fixed whitelist, so it is safe to format into the query
+        sort_col = CHURN_SORT_OPTIONS[sort_label]
+        churn_total = run_query("SELECT COUNT(*) AS cnt FROM churn_scores WHERE risk_level = ANY(:levels)",
+                                {"levels": risk_filter})['cnt'][0]
+        
+        if churn_total > 0:
+            n_pages = (int(churn_total) - 1) // page_size + 1
+            # Back to page 1 whenever the filter, order or page count changes; a kept page could be past the end
+            page_sig = (tuple(risk_filter), sort_label, page_size, n_pages)
+            if st.session_state.get('churn_page_sig') != page_sig:
+                st.session_state.churn_page_sig = page_sig
+                st.session_state.churn_page = 1
+            page = st.number_input(f"หน้า (ทั้งหมด {n_pages} หน้า, {churn_total} คน)", min_value=1, max_value=n_pages, key="churn_page")
+            df_churn = run_query(f"""
+                SELECT cs.customer_id, c.full_name, c.phone, cs.last_bill, cs.days_since, cs.typical_interval,
+                       cs.lifetime_spend, cs.risk_ratio, cs.risk_level
+                FROM churn_scores cs
+                LEFT JOIN customers c ON cs.customer_id = c.customer_id
+                WHERE cs.risk_level = ANY(:levels)
+                ORDER BY cs.{sort_col} DESC, cs.customer_id
+                LIMIT :lim OFFSET :off
+            """, {"levels": risk_filter, "lim": page_size, "off": (page - 1) * page_size})
+            df_churn['ความเสี่ยง'] = df_churn['risk_level'].map(CHURN_RISK_LABELS)
+            st.dataframe(df_churn.drop(columns=['customer_id', 'risk_level']), hide_index=True, use_container_width=True,
+                         column_config={
+                             "full_name": "ลูกค้า",
+                             "phone": "เบอร์โทร",
+                             "last_bill": st.column_config.DateColumn("ซื้อล่าสุด", format="DD/MM/YYYY"),
+                             "days_since": st.column_config.NumberColumn("ห่างหาย", format="%d วัน"),
+                             "typical_interval": st.column_config.NumberColumn("รอบซื้อปกติ", format="%.0f วัน"),
+                             "lifetime_spend": st.column_config.NumberColumn("ยอดใช้จ่ายรวม", format="฿%,.0f"),
+                             "risk_ratio": st.column_config.NumberColumn("ห่างหาย/รอบซื้อ", format="%.1fx")
+                         })
+        else:
+            st.success("✅ ไม่มีลูกค้าในระดับความเสี่ยงที่เลือก")
+        
+        if st.button("🔄 คำนวณคะแนน Churn ใหม่", key="refresh_churn"):
+            refresh_churn_scores()
+            mark_job_run("churn_scores")
+            st.rerun()
     
     st.divider()
     st.subheader("✅ To-Do List (Sales)")
+    st.caption("🚧 ตัวอย่างข้อมูล (Mock Data) สำหรับการพรีเซ้นต์")
     todos = pd.DataFrame({
         "งาน": ["โทรติดตาม คุณสมศรี", "ส่ง LINE คุณมานี", "เสนอโปรใหม่ คุณชูใจ"],
         "ประเภท": ["Credit Expiry", "Churn Risk", "Upsell"],
@@ -1537,83 +3917,326 @@ elif choice == "🔔 Follow-up System":
     st.dataframe(todos, hide_index=True, use_container_width=True)
 
 
-# --- 💰 Channel ROI Tracker (Mock) ---
+# --- 💰 Channel ROI Tracker ---
 elif choice == "💰 Channel ROI":
     st.header("💰 Channel ROI Tracker")
-    st.caption("🚧 ตัวอย่างข้อมูล (Mock Data) สำหรับการพรีเซ้นต์")
+    st.caption("ROAS, ต้นทุนต่อการลงทะเบียน และยอดขายจริงต่อช่องทาง (sale_channel) เทียบค่าโฆษณาและเป้าจาก marketing_config")
     
-    # ROI Summary
-    roi_data = pd.DataFrame({
-        "Channel": ["Facebook Ads", "TikTok Ads", "Google Ads", "Line OA"],
-        "ค่าโฆษณา": [50000, 30000, 20000, 10000],
-        "ยอดขาย": [180000, 95000, 45000, 65000],
-        "ROAS": [3.6, 3.17, 2.25, 6.5],
-        "กำไร": [130000, 65000, 25000, 55000]
-    })
+    cur_month = datetime.now().strftime('%Y-%m')
+    month_opts = sorted(set(load_funnel_rollup()['month_year'].tolist()) | {cur_month}, reverse=True)
+    sel_month = st.selectbox("📅 เดือน", month_opts)
+    
+    # Ad spend entry for the selected month (one upsert statement)
+    with st.expander("💵 บันทึกค่าโฆษณาของเดือนนี้", expanded=False):
+        df_spend = run_query("SELECT channel, amount FROM ad_spend WHERE month_year = :m", {"m": sel_month})
+        df_spend_grid = pd.DataFrame({"channel": MKT_CHANNELS}).merge(df_spend, on='channel', how='left').fillna({'amount': 0.0})
+        df_spend_edit = st.data_editor(df_spend_grid, hide_index=True, use_container_width=True, disabled=['channel'],
+                                       key=f"spend_grid_{sel_month}",
+                                       column_config={
+                                           "channel": "ช่องทาง",
+                                           "amount": st.column_config.NumberColumn("ค่าโฆษณา (บาท)", min_value=0.0, format="฿%,.0f")
+                                       })
+        if st.button("💾 บันทึกค่าโฆษณา", type="primary", use_container_width=True):
+            run_transaction([
+                ("""
+                    INSERT INTO ad_spend (month_year, channel, amount)
+                    SELECT :m, t.channel, t.amount
+                    FROM unnest(CAST(:chs AS TEXT[]), CAST(:amts AS REAL[])) AS t(channel, amount)
+                    ON CONFLICT (month_year, channel) DO UPDATE SET amount = EXCLUDED.amount
+                """, {"m": sel_month, "chs": df_spend_edit['channel'].tolist(),
+                      "amts": df_spend_edit['amount'].fillna(0).astype(float).tolist()}),
+                ("DELETE FROM channel_roi_monthly WHERE month_year = :m", {"m": sel_month}),
+            ])
+            get_channel_roi.clear()
+            st.success("✅ บันทึกค่าโฆษณาแล้ว")
+            st.rerun()
     
-    # Metrics
-    total_spend = roi_data["ค่าโฆษณา"].sum()
-    total_revenue = roi_data["ยอดขาย"].sum()
-    total_roas = total_revenue / total_spend
+    roi_data = get_channel_roi(sel_month)
     
-    m1, m2, m3, m4 = st.columns(4)
-    m1.metric("💵 ค่าโฆษณารวม", f"฿{total_spend:,.0f}")
-    m2.metric("💰 ยอดขายรวม", f"฿{total_revenue:,.0f}")
-    m3.metric("📈 ROAS เฉลี่ย", f"{total_roas:.2f}x")
-    m4.metric("🏆 Channel ดีสุด", "Line OA", delta="6.5x ROAS")
+    if roi_data.empty:
+        st.info("ยังไม่มีข้อมูลค่าโฆษณาหรือยอดขายในเดือนนี้")
+    else:
+        # Metrics
+        total_spend = roi_data["ad_spend"].sum()
+        total_revenue = roi_data["revenue"].sum()
+        total_roas = total_revenue / total_spend if total_spend else None
+        best = roi_data.dropna(subset=['roas']).sort_values('roas', ascending=False).head(1)
+        
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("💵 ค่าโฆษณารวม", f"฿{total_spend:,.0f}")
+        m2.metric("💰 ยอดขายรวม", f"฿{total_revenue:,.0f}")
+        m3.metric("📈 ROAS เฉลี่ย", f"{total_roas:.2f}x" if total_roas else "-")
+        if not best.empty:
+            m4.metric("🏆 Channel ดีสุด", best['channel'].iloc[0], delta=f"{best['roas'].iloc[0]:.1f}x ROAS")
+        else:
+            m4.metric("🏆 Channel ดีสุด", "-")
+        
+        st.divider()
+        
+        roi_data['profit'] = roi_data['revenue'] - roi_data['ad_spend']
+        roi_data['forecast_pct'] = roi_data['revenue'] / roi_data['forecast_amount'].where(roi_data['forecast_amount'] > 0) * 100
+        
+        c1, c2 = st.columns(2)
+        with c1:
+            st.subheader("📊 ROAS by Channel")
+            st.bar_chart(roi_data.dropna(subset=['roas']).set_index("channel")["roas"], color="#10B981")
+        
+        with c2:
+            st.subheader("💵 Revenue vs Ad Spend")
+            st.dataframe(roi_data[['channel', 'ad_spend', 'revenue', 'roas', 'profit', 'registers', 'cost_per_register',
+                                   'forecast_amount', 'forecast_pct']].sort_values('revenue', ascending=False),
+                         hide_index=True, use_container_width=True,
+                         column_config={
+                             "channel": "Channel",
+                             "ad_spend": st.column_config.NumberColumn("ค่าโฆษณา", format="฿%,.0f"),
+                             "revenue": st.column_config.NumberColumn("ยอดขาย", format="฿%,.0f"),
+                             "roas": st.column_config.NumberColumn("ROAS", format="%.2fx"),
+                             "profit": st.column_config.NumberColumn("กำไร", format="฿%,.0f"),
+                             "registers": "ลงทะเบียน",
+                             "cost_per_register": st.column_config.NumberColumn("ต้นทุน/ลงทะเบียน", format="฿%,.0f"),
+                             "forecast_amount": st.column_config.NumberColumn("เป้า (Forecast)", format="฿%,.0f"),
+                             "forecast_pct": st.column_config.NumberColumn("% ถึงเป้า", format="%.0f%%")
+                         })
+        
+        if sel_month < cur_month and 'frozen_at' in roi_data:
+            st.caption(f"🔒 เดือนที่ปิดแล้ว: คำนวณและเก็บไว้เมื่อ {pd.to_datetime(roi_data['frozen_at']).max():%d/%m/%Y %H:%M}")
+
+
+# --- 🏁 Monthly Goal Tracker ---
+elif choice == "🏁 Goal Tracker":
+    st.header("🏁 Monthly Goal Tracker")
+    st.caption("ยอดขายสะสมเดือนนี้เทียบเป้า High / Mid / Low พร้อมคาดการณ์ยอดสิ้นเดือนจากอัตราการขายปัจจุบัน")
+    
+    today = datetime.now().date()
+    sel_month = st.selectbox("📅 เดือน", recent_months(12, today))
+    
+    # Goal settings
+    with st.expander("⚙️ ตั้งค่าเป้าหมายเดือนนี้", expanded=False):
+        df_goal = run_query("SELECT * FROM monthly_goals WHERE month_year = :m", {"m": sel_month})
+        g = df_goal.iloc[0] if not df_goal.empty else None
+        with st.form("goal_form"):
+            gc1, gc2, gc3 = st.columns(3)
+            high_t = gc1.number_input("🥇 เป้า High (บาท)", min_value=0.0, value=float(g['high_target'] or 0) if g is not None else 0.0, step=10000.0)
+            mid_pct = gc2.number_input("🥈 Mid (% ของ High)", min_value=0.0, max_value=100.0, value=float(g['mid_pct'] or 75) if g is not None else 75.0)
+            low_pct = gc3.number_input("🥉 Low (% ของ High)", min_value=0.0, max_value=100.0, value=float(g['low_pct'] or 50) if g is not None else 50.0)
+            if st.form_submit_button("💾 บันทึกเป้าหมาย", type="primary", use_container_width=True):
+                run_query("""
+                    INSERT INTO monthly_goals (month_year, high_target, mid_target, low_target, mid_pct, low_pct)
+                    VALUES (:m, :h, :h * :mp / 100, :h * :lp / 100, :mp, :lp)
+                    ON CONFLICT (month_year) DO UPDATE SET
+                        high_target = EXCLUDED.high_target, mid_target = EXCLUDED.mid_target, low_target = EXCLUDED.low_target,
+                        mid_pct = EXCLUDED.mid_pct, low_pct = EXCLUDED.low_pct
+                """, {"m": sel_month, "h": high_t, "mp": mid_pct, "lp": low_pct})
+                compute_goal_progress.clear()
+                st.success("✅ บันทึกเป้าหมายแล้ว")
+                st.rerun()
+        
+        st.markdown("**⚖️ สัดส่วนเครดิตยอดขาย Marketing / Sales ต่อหมวดหมู่**")
+        df_w = run_query("""
+            SELECT c.cat_id, c.cat_name, COALESCE(w.mkt_weight, 70) AS mkt_weight, COALESCE(w.sale_weight, 30) AS sale_weight
+            FROM categories c
+            LEFT JOIN category_team_weights w ON w.cat_id = c.cat_id AND w.month_year = :m
+            ORDER BY c.cat_name
+        """, {"m": sel_month})
+        df_w_edit = st.data_editor(df_w, hide_index=True, use_container_width=True, disabled=['cat_id', 'cat_name'],
+                                   key=f"team_weights_{sel_month}",
+                                   column_config={
+                                       "cat_id": None,
+                                       "cat_name": "หมวดหมู่",
+                                       "mkt_weight": st.column_config.NumberColumn("Marketing %", min_value=0, max_value=100),
+                                       "sale_weight": st.column_config.NumberColumn("Sales %", min_value=0, max_value=100)
+                                   })
+        if st.button("💾 บันทึกสัดส่วนทีม", use_container_width=True):
+            run_query("""
+                INSERT INTO category_team_weights (month_year, cat_id, mkt_weight, sale_weight)
+                SELECT :m, t.cat_id, t.mw, t.sw
+                FROM unnest(CAST(:cats AS INTEGER[]), CAST(:mws AS REAL[]), CAST(:sws AS REAL[])) AS t(cat_id, mw, sw)
+                ON CONFLICT (month_year, cat_id) DO UPDATE SET mkt_weight = EXCLUDED.mkt_weight, sale_weight = EXCLUDED.sale_weight
+            """, {"m": sel_month, "cats": df_w_edit['cat_id'].astype(int).tolist(),
+                  "mws": df_w_edit['mkt_weight'].astype(float).tolist(), "sws": df_w_edit['sale_weight'].astype(float).tolist()})
+            compute_goal_progress.clear()
+            st.success("✅ บันทึกสัดส่วนแล้ว")
+            st.rerun()
+    
+    as_of = today if sel_month == today.strftime('%Y-%m') else (dt.datetime.strptime(sel_month, '%Y-%m').date() + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    progress = compute_goal_progress(sel_month, as_of, get_sales_version())
+    
+    m1, m2, m3 = st.columns(3)
+    m1.metric("💰 ยอดขายสะสม (MTD)", f"฿{progress['actual']:,.0f}", f"วันที่ {progress['days_elapsed']}/{progress['days_in_month']}")
+    m2.metric("🔮 คาดการณ์สิ้นเดือน", f"฿{progress['projected']:,.0f}")
+    df_tiers = progress['tiers']
+    if not df_tiers.empty:
+        reached = df_tiers[df_tiers['on_pace']]
+        m3.metric("🎯 Tier ที่คาดว่าจะถึง", reached['tier'].iloc[0] if not reached.empty else "ยังไม่ถึง Low")
+    else:
+        m3.metric("🎯 Tier ที่คาดว่าจะถึง", "-")
     
     st.divider()
     
-    c1, c2 = st.columns(2)
-    with c1:
-        st.subheader("📊 ROAS by Channel")
-        st.bar_chart(roi_data.set_index("Channel")["ROAS"], color="#10B981")
+    if df_tiers.empty:
+        st.info("ยังไม่ได้ตั้งเป้าหมายของเดือนนี้ → เปิด '⚙️ ตั้งค่าเป้าหมายเดือนนี้' ด้านบน")
+    else:
+        st.subheader("📊 ความคืบหน้าต่อ Tier")
+        for _, t in df_tiers.iterrows():
+            pct = t['actual_pct'] or 0
+            st.progress(min(pct / 100, 1.0), text=f"{t['tier']}: ฿{progress['actual']:,.0f} / ฿{t['target']:,.0f} ({pct:.0f}%) · คาดการณ์ {t['projected_pct'] or 0:.0f}% {'✅' if t['on_pace'] else '⚠️'}")
+        df_tiers['สถานะ'] = df_tiers['on_pace'].map({True: "✅ ตามเป้า", False: "⚠️ ต่ำกว่าเป้า"})
+        st.dataframe(df_tiers.drop(columns=['on_pace']), hide_index=True, use_container_width=True,
+                     column_config={
+                         "tier": "Tier",
+                         "target": st.column_config.NumberColumn("เป้า", format="฿%,.0f"),
+                         "actual_pct": st.column_config.NumberColumn("ทำได้แล้ว", format="%.0f%%"),
+                         "projected_pct": st.column_config.NumberColumn("คาดการณ์สิ้นเดือน", format="%.0f%%"),
+                         "gap": st.column_config.NumberColumn("ยังขาด", format="฿%,.0f"),
+                         "need_per_day": st.column_config.NumberColumn("ต้องขาย/วัน", format="฿%,.0f")
+                     })
     
-    with c2:
-        st.subheader("💵 Revenue vs Ad Spend")
-        st.dataframe(roi_data, hide_index=True, use_container_width=True,
+    df_goal_cat = progress['categories']
+    if not df_goal_cat.empty:
+        st.subheader("📂 แยกตามหมวดหมู่และทีม")
+        st.dataframe(df_goal_cat[['cat_name', 'actual', 'projected', 'mkt_actual', 'sale_actual']], hide_index=True, use_container_width=True,
                      column_config={
-                         "ค่าโฆษณา": st.column_config.NumberColumn(format="฿%,.0f"),
-                         "ยอดขาย": st.column_config.NumberColumn(format="฿%,.0f"),
-                         "กำไร": st.column_config.NumberColumn(format="฿%,.0f"),
-                         "ROAS": st.column_config.NumberColumn(format="%.2fx")
+                         "cat_name": "หมวดหมู่",
+                         "actual": st.column_config.NumberColumn("ยอดสะสม", format="฿%,.0f"),
+                         "projected": st.column_config.NumberColumn("คาดการณ์สิ้นเดือน", format="฿%,.0f"),
+                         "mkt_actual": st.column_config.NumberColumn("เครดิต Marketing", format="฿%,.0f"),
+                         "sale_actual": st.column_config.NumberColumn("เครดิต Sales", format="฿%,.0f")
                      })
 
 
-# --- 🎯 Campaign Tracker (Mock) ---
+# --- 🎯 Campaign Tracker ---
 elif choice == "🎯 Campaign Tracker":
     st.header("🎯 Campaign Tracker")
-    st.caption("🚧 ตัวอย่างข้อมูล (Mock Data) สำหรับการพรีเซ้นต์")
-    
-    # Campaign Summary
-    m1, m2, m3 = st.columns(3)
-    m1.metric("🏷️ แคมเปญที่กำลังรัน", "3 แคมเปญ")
-    m2.metric("💰 ยอดขายจากแคมเปญ", "฿385,000", "+22%")
-    m3.metric("🎯 แคมเปญดีสุด", "Summer Sale 2026")
+    hc1, hc2 = st.columns([3, 1])
+    hc1.caption("บิลถูกนับเข้าแคมเปญตามช่วงวันที่ ช่องทาง (sale_channel) และหมวดหมู่ที่กำหนด (อัปเดตวันละครั้ง)")
+    # Attribution runs in the daily job; this picks up today's bills on demand (only new bills are scanned)
+    if hc2.button("🔄 อัปเดตยอดแคมเปญ", use_container_width=True):
+        attribute_campaign_bills()
+        st.rerun()
     
-    st.divider()
+    df_cat = run_query("SELECT cat_id, cat_name FROM categories ORDER BY cat_name")
+    cat_names = dict(zip(df_cat['cat_id'], df_cat['cat_name']))
+    df_camp = run_query("""
+        SELECT c.campaign_id, c.campaign_name, c.start_date, c.end_date, c.channels, c.cat_ids, c.budget, c.note,
+               COALESCE(s.revenue, 0) AS revenue, COALESCE(s.bills, 0) AS bills, COALESCE(s.customers, 0) AS customers,
+               COALESCE(s.leads, 0) AS leads, COALESCE(s.registers, 0) AS registers, s.conversion
+        FROM campaigns c
+        LEFT JOIN campaign_stats s ON s.campaign_id = c.campaign_id
+        ORDER BY c.start_date DESC
+    """)
     
-    # Campaign Table
-    st.subheader("📋 รายการแคมเปญ")
-    campaigns = pd.DataFrame({
-        "แคมเปญ": ["☀️ Summer Sale 2026", "🎒 Back to School", "🎄 New Year Promo", "💝 Valentine Special"],
-        "สถานะ": ["🟢 Active", "🟢 Active", "⚫ Ended", "🟡 Scheduled"],
-        "ระยะเวลา": ["01-28 Feb 2026", "15 Jan - 15 Feb", "15-31 Dec 2025", "10-14 Feb 2026"],
-        "ยอดขาย": [185000, 120000, 280000, 0],
-        "Leads": [89, 56, 120, 0],
-        "Conversion": ["21%", "18%", "25%", "-"]
-    })
-    st.dataframe(campaigns, hide_index=True, use_container_width=True,
-                 column_config={"ยอดขาย": st.column_config.NumberColumn(format="฿%,.0f")})
+    # Create / Edit Campaign
+    with st.expander("➕ สร้างหรือแก้ไขแคมเปญ", expanded=df_camp.empty):
+        camp_opts = ["-- สร้างแคมเปญใหม่ --"] + [f"{r['campaign_id']} | {r['campaign_name']}" for _, r in df_camp.iterrows()]
+        sel_camp = st.selectbox("เลือกแคมเปญเพื่อแก้ไข", camp_opts)
+        edit_mode = sel_camp != "-- สร้างแคมเปญใหม่ --"
+        edit_id = int(sel_camp.split(" | ")[0]) if edit_mode else None
+        curr = df_camp[df_camp['campaign_id'] == edit_id].iloc[0] if edit_mode else None
+        
+        with st.form("campaign_form"):
+            cname = st.text_input("ชื่อแคมเปญ", value=curr['campaign_name'] if edit_mode else "")
+            dc1, dc2, dc3 = st.columns(3)
+            cstart = dc1.date_input("เริ่ม", value=curr['start_date'] if edit_mode else datetime.now().date())
+            cend = dc2.date_input("สิ้นสุด", value=curr['end_date'] if edit_mode else datetime.now().date() + timedelta(days=30))
+            cbudget = dc3.number_input("งบประมาณ (บาท)", min_value=0.0, value=float(curr['budget'] or 0) if edit_mode else 0.0)
+            cchannels = st.multiselect("ช่องทาง (ว่าง = ทุกช่องทาง)", MKT_CHANNELS,
+                                       default=[c for c in (curr['channels'] or []) if c in MKT_CHANNELS] if edit_mode else [])
+            ccats = st.multiselect("หมวดหมู่ (ว่าง = ทุกหมวดหมู่)", list(cat_names.keys()), format_func=lambda x: cat_names[x],
+                                   default=[c for c in (curr['cat_ids'] or []) if c in cat_names] if edit_mode else [])
+            cnote = st.text_area("หมายเหตุ", value=(curr['note'] or "") if edit_mode else "")
+            
+            sub1, sub2 = st.columns(2)
+            if sub1.form_submit_button("💾 บันทึกแคมเปญ", use_container_width=True, type="primary"):
+                if cname and cend >= cstart:
+                    params = {"n": cname, "s": cstart, "e": cend, "chs": cchannels, "cats": [int(c) for c in ccats],
+                              "b": cbudget, "nt": cnote}
+                    try:
+                        if edit_mode:
+                            run_query("""
+                                UPDATE campaigns SET campaign_name=:n, start_date=:s, end_date=:e, channels=CAST(:chs AS TEXT[]),
+                                       cat_ids=CAST(:cats AS INTEGER[]), budget=:b, note=:nt
+                                WHERE campaign_id=:id
+                            """, {**params, "id": edit_id})
+                        else:
+                            edit_id = int(run_query("""
+                                INSERT INTO campaigns (campaign_name, start_date, end_date, channels, cat_ids, budget, note)
+                                VALUES (:n, :s, :e, CAST(:chs AS TEXT[]), CAST(:cats AS INTEGER[]), :b, :nt)
+                                RETURNING campaign_id
+                            """, params)['campaign_id'][0])
+                    except IntegrityError:
+                        st.error(f"❌ มีแคมเปญชื่อ '{cname}' อยู่แล้ว")
+                    else:
+                        attribute_campaign_bills(campaign_id=edit_id)
+                        st.success("✅ บันทึกแคมเปญและคำนวณยอดแล้ว")
+                        st.rerun()
+                else:
+                    st.error("⚠️ กรุณากรอกชื่อแคมเปญ และวันสิ้นสุดต้องไม่ก่อนวันเริ่ม")
+            
+            if edit_mode and sub2.form_submit_button("🗑️ ลบแคมเปญ", use_container_width=True):
+                run_transaction([
+                    ("DELETE FROM campaign_bills WHERE campaign_id=:id", {"id": edit_id}),
+                    ("DELETE FROM campaign_stats WHERE campaign_id=:id", {"id": edit_id}),
+                    ("DELETE FROM campaigns WHERE campaign_id=:id", {"id": edit_id}),
+                ])
+                st.success("ลบแคมเปญเรียบร้อย!")
+                st.rerun()
     
-    st.divider()
-    st.subheader("📊 A/B Comparison: Summer vs Back to School")
-    comp_c1, comp_c2 = st.columns(2)
-    with comp_c1:
-        st.metric("☀️ Summer Sale", "฿185,000", "21% Conv")
-    with comp_c2:
-        st.metric("🎒 Back to School", "฿120,000", "18% Conv")
-    st.success("✅ **Summer Sale** ทำผลได้ดีกว่า 54%")
+    if df_camp.empty:
+        st.info("ยังไม่มีแคมเปญ")
+    else:
+        today = datetime.now().date()
+        df_camp['status'] = df_camp.apply(
+            lambda r: "🟡 Scheduled" if r['start_date'] > today else ("⚫ Ended" if r['end_date'] < today else "🟢 Active"), axis=1)
+        active = df_camp[df_camp['status'] == "🟢 Active"]
+        best = df_camp.sort_values('revenue', ascending=False).iloc[0]
+        
+        # Campaign Summary
+        m1, m2, m3 = st.columns(3)
+        m1.metric("🏷️ แคมเปญที่กำลังรัน", f"{len(active)} แคมเปญ")
+        m2.metric("💰 ยอดขายจากแคมเปญที่รัน", f"฿{active['revenue'].sum():,.0f}")
+        m3.metric("🎯 แคมเปญดีสุด", best['campaign_name'], f"฿{best['revenue']:,.0f}")
+        
+        st.divider()
+        
+        # Campaign Table
+        st.subheader("📋 รายการแคมเปญ")
+        df_camp['period'] = df_camp['start_date'].map(lambda d: d.strftime('%d/%m/%Y')) + " - " + df_camp['end_date'].map(lambda d: d.strftime('%d/%m/%Y'))
+        df_camp['channel_str'] = df_camp['channels'].map(lambda x: ", ".join(x) if x else "ทุกช่องทาง")
+        df_camp['roi'] = df_camp['revenue'] / df_camp['budget'].where(df_camp['budget'] > 0)
+        df_camp['conv_pct'] = df_camp['conversion'] * 100
+        st.dataframe(df_camp[['campaign_name', 'status', 'period', 'channel_str', 'revenue', 'bills', 'leads', 'conv_pct', 'roi']],
+                     hide_index=True, use_container_width=True,
+                     column_config={
+                         "campaign_name": "แคมเปญ",
+                         "status": "สถานะ",
+                         "period": "ระยะเวลา",
+                         "channel_str": "ช่องทาง",
+                         "revenue": st.column_config.NumberColumn("ยอดขาย", format="฿%,.0f"),
+                         "bills": "บิล",
+                         "leads": "Leads",
+                         "conv_pct": st.column_config.NumberColumn("Conversion", format="%.1f%%"),
+                         "roi": st.column_config.NumberColumn("ยอดขาย/งบ", format="%.1fx")
+                     })
+        
+        # A/B comparison between any two campaigns (from campaign_stats)
+        if len(df_camp) >= 2:
+            st.divider()
+            st.subheader("📊 A/B Comparison")
+            names = df_camp['campaign_name'].tolist()
+            ab1, ab2 = st.columns(2)
+            name_a = ab1.selectbox("แคมเปญ A", names, index=0)
+            name_b = ab2.selectbox("แคมเปญ B", names, index=1)
+            ca = df_camp[df_camp['campaign_name'] == name_a].iloc[0]
+            cb = df_camp[df_camp['campaign_name'] == name_b].iloc[0]
+            
+            for col, c, other in [(ab1, ca, cb), (ab2, cb, ca)]:
+                col.metric("💰 ยอดขาย", f"฿{c['revenue']:,.0f}", f"{c['revenue'] - other['revenue']:+,.0f}")
+                col.metric("🧾 บิล / Leads", f"{c['bills']} / {c['leads']}")
+                col.metric("📈 Conversion", f"{c['conversion'] * 100:.1f}%" if pd.notnull(c['conversion']) else "-")
+            
+            if name_a != name_b and min(ca['revenue'], cb['revenue']) > 0:
+                winner, loser = (ca, cb) if ca['revenue'] >= cb['revenue'] else (cb, ca)
+                st.success(f"✅ **{winner['campaign_name']}** ทำยอดขายได้ดีกว่า {(winner['revenue'] / loser['revenue'] - 1) * 100:.0f}%")
 
 
 # --- 🧩 Customer Segments (RFM) (Mock) ---
@@ -1650,46 +4273,222 @@ elif choice == "🧩 Customer Segments":
                      column_config={"ยอดใช้จ่ายเฉลี่ย": st.column_config.NumberColumn(format="฿%,.0f")})
 
 
-# --- 📅 Event Calendar (Mock) ---
+# --- 📅 Event Calendar ---
 elif choice == "📅 Event Calendar":
     st.header("📅 Event / Openhouse Calendar")
-    st.caption("🚧 ตัวอย่างข้อมูล (Mock Data) สำหรับการพรีเซ้นต์")
-    
-    # Summary
-    m1, m2, m3 = st.columns(3)
-    m1.metric("📅 งานในเดือนนี้", "3 งาน")
-    m2.metric("👥 Lead จากงาน", "89 คน", "+25%")
-    m3.metric("💰 ยอดขายจากงาน", "฿245,000")
     
-    st.divider()
+    # event_stats is kept current by the daily job and after each sale, lead entry or save of an event
+    df_events = run_query("""
+        SELECT e.event_id, e.event_name, e.event_date, e.location, e.event_type, e.status, e.note,
+               COALESCE(s.leads, 0) AS leads, COALESCE(s.registers, 0) AS registers,
+               COALESCE(s.closes, 0) AS closes, COALESCE(s.revenue, 0) AS revenue
+        FROM events e
+        LEFT JOIN event_stats s ON s.event_id = e.event_id
+        ORDER BY e.event_date DESC
+    """)
+    today = datetime.now().date()
     
-    # Upcoming Events
-    st.subheader("📆 กิจกรรมที่กำลังจะมาถึง")
-    events = pd.DataFrame({
-        "งาน": ["🏫 Openhouse โรงเรียนอนุบาลสวนเด็ก", "🎪 V-School Fair 2026", "🤝 พบผู้ปกครอง Q1"],
-        "วันที่": ["08 Feb 2026", "15 Feb 2026", "28 Feb 2026"],
-        "สถานที่": ["โรงเรียนอนุบาลสวนเด็ก", "V-School สาขาใหญ่", "ห้องประชุม A"],
-        "สถานะ": ["🟢 Confirmed", "🟡 Preparing", "🔵 Planned"],
-        "Lead คาดการณ์": [35, 80, 25]
-    })
-    st.dataframe(events, hide_index=True, use_container_width=True)
+    # Create / Edit Event
+    with st.expander("➕ สร้างหรือแก้ไขกิจกรรม", expanded=df_events.empty):
+        ev_opts = ["-- สร้างกิจกรรมใหม่ --"] + [f"{r['event_id']} | {r['event_name']}" for _, r in df_events.iterrows()]
+        sel_ev = st.selectbox("เลือกกิจกรรมเพื่อแก้ไข", ev_opts)
+        edit_mode = sel_ev != "-- สร้างกิจกรรมใหม่ --"
+        edit_id = int(sel_ev.split(" | ")[0]) if edit_mode else None
+        curr = df_events[df_events['event_id'] == edit_id].iloc[0] if edit_mode else None
+        status_opts = ["Planned", "Preparing", "Confirmed", "Done", "Cancelled"]
+        
+        with st.form("event_form"):
+            ename = st.text_input("ชื่องาน", value=curr['event_name'] if edit_mode else "")
+            ec1, ec2, ec3 = st.columns(3)
+            edate = ec1.date_input("วันที่", value=curr['event_date'] if edit_mode else today)
+            etype = ec2.selectbox("ประเภท", EVENT_TYPES, index=EVENT_TYPES.index(curr['event_type']) if edit_mode and curr['event_type'] in EVENT_TYPES else 0)
+            estatus = ec3.selectbox("สถานะ", status_opts, index=status_opts.index(curr['status']) if edit_mode and curr['status'] in status_opts else 0)
+            eloc = st.text_input("สถานที่", value=(curr['location'] or "") if edit_mode else "")
+            enote = st.text_area("หมายเหตุ", value=(curr['note'] or "") if edit_mode else "")
+            
+            sub1, sub2 = st.columns(2)
+            if sub1.form_submit_button("💾 บันทึกกิจกรรม", use_container_width=True, type="primary") and ename:
+                params = {"n": ename, "d": edate, "t": etype, "s": estatus, "l": eloc, "nt": enote}
+                if edit_mode:
+                    run_transaction([
+                        ("UPDATE events SET event_name=:n, event_date=:d, event_type=:t, status=:s, location=:l, note=:nt WHERE event_id=:id",
+                         {**params, "id": edit_id}),
+                        ("UPDATE event_stats SET frozen = FALSE WHERE event_id=:id", {"id": edit_id}),
+                    ])
+                    saved_id = edit_id
+                else:
+                    saved_id = int(run_query("""
+                        INSERT INTO events (event_name, event_date, event_type, status, location, note)
+                        VALUES (:n, :d, :t, :s, :l, :nt) RETURNING event_id
+                    """, params).iloc[0]['event_id'])
+                # A new date can freeze or unfreeze the event; its stats row follows immediately
+                refresh_event_stats([saved_id])
+                st.success("บันทึกข้อมูลเรียบร้อย!")
+                st.rerun()
+            
+            if edit_mode and sub2.form_submit_button("🗑️ ลบกิจกรรม", use_container_width=True):
+                run_transaction([
+                    ("DELETE FROM event_stats WHERE event_id=:id", {"id": edit_id}),
+                    ("DELETE FROM events WHERE event_id=:id", {"id": edit_id}),
+                ])
+                st.success("ลบข้อมูลเรียบร้อย!")
+                st.rerun()
     
-    st.divider()
+    # Lead / registration capture per event (stored in daily_leads / daily_registers with event_id)
+    if not df_events.empty:
+        with st.expander("📝 บันทึก Lead / ลงทะเบียน จากงาน", expanded=False):
+            df_cat = run_query("SELECT cat_id, cat_name FROM categories ORDER BY cat_name")
+            with st.form("event_lead_form", clear_on_submit=True):
+                lc1, lc2 = st.columns(2)
+                lev = lc1.selectbox("งาน", [f"{r['event_id']} | {r['event_name']} ({r['event_date']:%d/%m/%Y})" for _, r in df_events.iterrows()])
+                lcat = lc2.selectbox("หมวดหมู่", df_cat['cat_name'].tolist())
+                lc3, lc4 = st.columns(2)
+                n_leads = lc3.number_input("จำนวน Lead", min_value=0, value=0)
+                n_regs = lc4.number_input("จำนวนลงทะเบียน", min_value=0, value=0)
+                
+                if st.form_submit_button("💾 บันทึก", type="primary", use_container_width=True):
+                    ev_id = int(lev.split(" | ")[0])
+                    ev_date = df_events[df_events['event_id'] == ev_id].iloc[0]['event_date']
+                    cat_id = int(df_cat[df_cat['cat_name'] == lcat]['cat_id'].values[0])
+                    params = {"d": ev_date, "cat": cat_id, "ev": ev_id}
+                    run_transaction([
+                        ("""
+                            INSERT INTO daily_leads (lead_date, channel, cat_id, event_id, lead_count) VALUES (:d, 'Openhouse', :cat, :ev, :n)
+                            ON CONFLICT (lead_date, channel, cat_id, event_id) DO UPDATE SET lead_count = EXCLUDED.lead_count
+                        """, {**params, "n": n_leads}),
+                        ("""
+                            INSERT INTO daily_registers (reg_date, channel, cat_id, event_id, reg_count) VALUES (:d, 'Openhouse', :cat, :ev, :n)
+                            ON CONFLICT (reg_date, channel, cat_id, event_id) DO UPDATE SET reg_count = EXCLUDED.reg_count
+                        """, {**params, "n": n_regs}),
+                        ("UPDATE event_stats SET frozen = FALSE WHERE event_id = :ev", {"ev": ev_id}),
+                    ])
+                    refresh_event_stats([ev_id])
+                    refresh_funnel_rollup(since=ev_date)
+                    load_funnel_rollup.clear()
+                    get_channel_roi.clear()
+                    st.success("✅ บันทึกแล้ว")
+                    st.rerun()
     
-    # Past Event Performance
-    st.subheader("📊 ผลงานกิจกรรมที่ผ่านมา")
-    past_events = pd.DataFrame({
-        "งาน": ["🎄 Christmas Fair", "🎃 Halloween Party", "🏫 Openhouse อนุบาลแสนสุข"],
-        "วันที่": ["20 Dec 2025", "31 Oct 2025", "15 Oct 2025"],
-        "Leads": [65, 45, 38],
-        "ลงทะเบียน": [28, 18, 22],
-        "ปิดการขาย": [15, 8, 12],
-        "ยอดขาย": [125000, 68000, 95000]
-    })
-    st.dataframe(past_events, hide_index=True, use_container_width=True,
-                 column_config={"ยอดขาย": st.column_config.NumberColumn(format="฿%,.0f")})
+    if df_events.empty:
+        st.info("ยังไม่มีกิจกรรม")
+    else:
+        this_month = df_events[pd.to_datetime(df_events['event_date']).dt.strftime('%Y-%m') == today.strftime('%Y-%m')]
+        
+        # Summary
+        m1, m2, m3 = st.columns(3)
+        m1.metric("📅 งานในเดือนนี้", f"{len(this_month)} งาน")
+        m2.metric("👥 Lead จากงาน (เดือนนี้)", f"{int(this_month['leads'].sum())} คน")
+        m3.metric("💰 ยอดขายจากงาน (เดือนนี้)", f"฿{this_month['revenue'].sum():,.0f}")
+        
+        st.divider()
+        
+        # Upcoming Events with forecasts from similar past events
+        st.subheader("📆 กิจกรรมที่กำลังจะมาถึง")
+        upcoming = forecast_events(df_events)
+        if not upcoming.empty:
+            st.dataframe(upcoming.sort_values('event_date')[['event_name', 'event_date', 'event_type', 'location', 'status',
+                                                             'f_leads', 'f_registers', 'f_closes', 'f_revenue']],
+                         hide_index=True, use_container_width=True,
+                         column_config={
+                             "event_name": "งาน",
+                             "event_date": st.column_config.DateColumn("วันที่", format="DD/MM/YYYY"),
+                             "event_type": "ประเภท",
+                             "location": "สถานที่",
+                             "status": "สถานะ",
+                             "f_leads": st.column_config.NumberColumn("Lead คาดการณ์", format="%d"),
+                             "f_registers": st.column_config.NumberColumn("ลงทะเบียน คาดการณ์", format="%d"),
+                             "f_closes": st.column_config.NumberColumn("ปิดการขาย คาดการณ์", format="%d"),
+                             "f_revenue": st.column_config.NumberColumn("ยอดขาย คาดการณ์", format="฿%,.0f")
+                         })
+            st.caption("🔮 คาดการณ์จากค่าเฉลี่ย Lead และอัตราการแปลงของงานประเภทเดียวกันที่ผ่านมา")
+        else:
+            st.info("ไม่มีกิจกรรมที่กำลังจะมาถึง")
+        
+        st.divider()
+        
+        # Past Event Performance
+        st.subheader("📊 ผลงานกิจกรรมที่ผ่านมา")
+        past_events = df_events[df_events['event_date'] < today]
+        if not past_events.empty:
+            st.dataframe(past_events[['event_name', 'event_date', 'event_type', 'leads', 'registers', 'closes', 'revenue']],
+                         hide_index=True, use_container_width=True,
+                         column_config={
+                             "event_name": "งาน",
+                             "event_date": st.column_config.DateColumn("วันที่", format="DD/MM/YYYY"),
+                             "event_type": "ประเภท",
+                             "leads": "Leads",
+                             "registers": "ลงทะเบียน",
+                             "closes": "ปิดการขาย",
+                             "revenue": st.column_config.NumberColumn("ยอดขาย", format="฿%,.0f")
+                         })
+        else:
+            st.info("ยังไม่มีกิจกรรมที่ผ่านมา")
 
 
+# --- 🗺️ Geo Sales ---
+elif choice == "🗺️ Geo Sales":
+    st.header("🗺️ ยอดขายตามพื้นที่ (จังหวัด / ภาค)")
+    st.caption("ยอดขายตามจังหวัดของลูกค้า (customers.province ที่ปรับชื่อแล้ว) สรุปรายเดือน ใช้เลือกพื้นที่จัด Openhouse")
+    
+    sv = get_sales_version()
+    df_geo = load_geo_rollup(sv)
+    if df_geo.empty:
+        st.info("ยังไม่มีข้อมูลสรุปยอดขายตามพื้นที่")
+        if st.button("🔄 สร้างข้อมูลย้อนหลังทั้งหมด", type="primary"):
+            refresh_marketing_rollups()
+            st.rerun()
+    else:
+        months = sorted(df_geo['month_year'].unique())
+        gc1, gc2 = st.columns(2)
+        m_from = gc1.selectbox("ตั้งแต่เดือน", months, index=max(len(months) - 12, 0))
+        m_to = gc2.selectbox("ถึงเดือน", months, index=len(months) - 1)
+        df_rng = df_geo[(df_geo['month_year'] >= m_from) & (df_geo['month_year'] <= m_to)]
+        df_rng = df_rng.assign(region=df_rng['region'].replace('-', 'ไม่ระบุ'), province=df_rng['province'].replace('-', 'ไม่ระบุ'))
+        df_base = load_customer_base_by_province(sv).replace('-', 'ไม่ระบุ')
+        total_rev = df_rng['revenue'].sum()
+        
+        def geo_summary(by):
+            out = df_rng.groupby(by, as_index=False)[['bill_count', 'revenue']].sum()
+            out = out.merge(df_base.groupby(by, as_index=False)['customers'].sum(), on=by, how='left').fillna({'customers': 0})
+            out['share'] = out['revenue'] / total_rev * 100 if total_rev else 0.0
+            out['avg_bill'] = out['revenue'] / out['bill_count'].where(out['bill_count'] > 0)
+            out['rev_per_customer'] = out['revenue'] / out['customers'].where(out['customers'] > 0)
+            return out.sort_values('revenue', ascending=False)
+        
+        geo_cols = {
+            "region": "ภาค", "province": "จังหวัด",
+            "bill_count": st.column_config.NumberColumn("บิล", format="%d"),
+            "revenue": st.column_config.NumberColumn("ยอดขาย", format="฿%,.0f"),
+            "customers": st.column_config.NumberColumn("ลูกค้าในพื้นที่", format="%d"),
+            "share": st.column_config.ProgressColumn("สัดส่วน", min_value=0, max_value=100, format="%.1f%%"),
+            "avg_bill": st.column_config.NumberColumn("เฉลี่ย/บิล", format="฿%,.0f"),
+            "rev_per_customer": st.column_config.NumberColumn("ยอด/ลูกค้าในพื้นที่", format="฿%,.0f"),
+        }
+        
+        k1, k2, k3 = st.columns(3)
+        k1.metric("💰 ยอดขายช่วงนี้", f"฿{total_rev:,.0f}")
+        k2.metric("🧾 จำนวนบิล", f"{int(df_rng['bill_count'].sum()):,}")
+        known = df_rng[df_rng['province'] != 'ไม่ระบุ']['revenue'].sum()
+        k3.metric("📍 ยอดที่ระบุจังหวัดได้", f"{known / total_rev * 100:.0f}%" if total_rev else "-")
+        
+        st.subheader("🧭 ตามภาค")
+        df_reg = geo_summary('region')
+        st.bar_chart(df_reg.set_index('region')['revenue'])
+        st.dataframe(df_reg, hide_index=True, use_container_width=True, column_config=geo_cols,
+                     column_order=['region', 'revenue', 'share', 'bill_count', 'avg_bill', 'customers', 'rev_per_customer'])
+        
+        st.subheader("📍 ตามจังหวัด")
+        sel_region = st.selectbox("ภาค", ["ทั้งหมด"] + list(REGIONS) + ["ไม่ระบุ"])
+        df_prov = geo_summary(['region', 'province'])
+        if sel_region != "ทั้งหมด":
+            df_prov = df_prov[df_prov['region'] == sel_region]
+        st.dataframe(df_prov, hide_index=True, use_container_width=True, column_config=geo_cols,
+                     column_order=['province', 'region', 'revenue', 'share', 'bill_count', 'avg_bill', 'customers', 'rev_per_customer'])
+        
+        st.subheader("📈 แนวโน้มรายเดือนตามภาค")
+        trend = df_rng.pivot_table(index='month_year', columns='region', values='revenue', aggfunc='sum', fill_value=0)
+        st.line_chart(trend)
+
 # --- 👤 Customer Analytics Dashboard ---
 elif choice == "👤 Customer Analytics":
     st.header("👤 Customer Analytics & Lifetime Value (CLV)")
@@ -2029,7 +4828,7 @@ elif choice == "🎯 Customer 360":
             st.caption(f"📞 {cust_info['phone'] or 'ไม่มีเบอร์'}")
             
             # Tabs for different sections
-            tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 สรุปภาพรวม", "🧾 ประวัติซื้อ", "📞 บันทึกการติดต่อ", "⭐ Feedback", "🏷️ Tags"])
+            tab1, tab_tl, tab2, tab3, tab4, tab5 = st.tabs(["📊 สรุปภาพรวม", "🕒 Timeline", "🧾 ประวัติซื้อ", "📞 บันทึกการติดต่อ", "⭐ Feedback", "🏷️ Tags"])
             
             with tab1:
                 # --- Overview ---
@@ -2055,6 +4854,26 @@ elif choice == "🎯 Customer 360":
                 
                 st.divider()
                 
+                # Next Best Actions (scored by the nightly batch)
+                st.subheader("🚀 Next Best Actions")
+                df_nba = run_query("""
+                    SELECT title, reason, score, due_date, refreshed_at
+                    FROM customer_actions WHERE customer_id = :cid
+                    ORDER BY score DESC
+                """, {"cid": sel_cust_id})
+                if not df_nba.empty:
+                    for _, a in df_nba.head(3).iterrows():
+                        st.markdown(f"**{a['title']}** — {a['reason']}  \n📅 ทำภายใน {a['due_date']:%d/%m/%Y}")
+                    if len(df_nba) > 3:
+                        with st.expander(f"ดูอีก {len(df_nba) - 3} รายการ"):
+                            st.dataframe(df_nba.iloc[3:][['title', 'reason', 'due_date']], hide_index=True, use_container_width=True,
+                                         column_config={"title": "Action", "reason": "เหตุผล", "due_date": st.column_config.DateColumn("ทำภายใน", format="DD/MM/YYYY")})
+                    st.caption(f"คำนวณล่าสุด: {df_nba['refreshed_at'].max():%d/%m/%Y %H:%M}")
+                else:
+                    st.caption("ยังไม่มี Action แนะนำสำหรับลูกค้ารายนี้")
+                
+                st.divider()
+                
                 # Tags Display
                 st.subheader("🏷️ Tags")
                 df_tags = run_query("SELECT tag_name FROM customer_tags WHERE customer_id = :cid", {"cid": sel_cust_id})
@@ -2064,20 +4883,15 @@ elif choice == "🎯 Customer 360":
                 else:
                     st.caption("ยังไม่มี Tags → ไปเพิ่มที่แท็บ 'Tags'")
             
+            with tab_tl:
+                # --- Unified Activity Timeline ---
+                st.subheader("🕒 กิจกรรมทั้งหมด")
+                render_customer_timeline(sel_cust_id)
+            
             with tab2:
                 # --- Purchase History ---
                 st.subheader("🧾 ประวัติการซื้อ")
-                df_purchases = run_query("""
-                    SELECT b.bill_id, b.sale_date, b.final_amount, b.payment_method, b.sale_channel
-                    FROM bills b WHERE b.customer_id = :cid
-                    ORDER BY b.sale_date DESC
-                """, {"cid": sel_cust_id})
-                
-                if not df_purchases.empty:
-                    st.dataframe(df_purchases, hide_index=True, use_container_width=True,
-                                 column_config={"final_amount": st.column_config.NumberColumn(format="฿%,.0f")})
-                else:
-                    st.info("ยังไม่มีประวัติการซื้อ")
+                render_customer_timeline(sel_cust_id, kinds=['bill'], key="bill")
             
             with tab3:
                 # --- Contact Logs ---
@@ -2101,24 +4915,14 @@ elif choice == "🎯 Customer 360":
                             INSERT INTO contact_logs (customer_id, contact_type, notes, emp_id, follow_up_date)
                             VALUES (:cid, :type, :notes, :eid, :fup)
                         """, {"cid": sel_cust_id, "type": contact_type, "notes": notes, "eid": emp_id, "fup": follow_up if follow_up else None})
+                        reset_customer_timeline(sel_cust_id)
                         st.success("✅ บันทึกแล้ว!")
                         st.rerun()
                 
                 st.divider()
                 
                 # Display Logs
-                df_logs = run_query("""
-                    SELECT cl.contact_type, cl.contact_date, cl.notes, e.emp_nickname, cl.follow_up_date
-                    FROM contact_logs cl
-                    LEFT JOIN employees e ON cl.emp_id = e.emp_id
-                    WHERE cl.customer_id = :cid
-                    ORDER BY cl.contact_date DESC
-                """, {"cid": sel_cust_id})
-                
-                if not df_logs.empty:
-                    st.dataframe(df_logs, hide_index=True, use_container_width=True)
-                else:
-                    st.info("ยังไม่มีบันทึกการติดต่อ")
+                render_customer_timeline(sel_cust_id, kinds=['contact'], key="contact")
             
             with tab4:
                 # --- Feedback ---
@@ -2135,25 +4939,17 @@ elif choice == "🎯 Customer 360":
                             INSERT INTO customer_feedback (customer_id, rating, comment)
                             VALUES (:cid, :rate, :com)
                         """, {"cid": sel_cust_id, "rate": rating, "com": comment})
+                        reset_customer_timeline(sel_cust_id)
                         st.success("✅ บันทึกแล้ว!")
                         st.rerun()
                 
                 st.divider()
                 
                 # Display Feedback
-                df_fb = run_query("""
-                    SELECT rating, comment, created_at
-                    FROM customer_feedback
-                    WHERE customer_id = :cid
-                    ORDER BY created_at DESC
-                """, {"cid": sel_cust_id})
-                
-                if not df_fb.empty:
-                    avg_rating = df_fb['rating'].mean()
-                    st.metric("⭐ Rating เฉลี่ย", f"{avg_rating:.1f}/5")
-                    st.dataframe(df_fb, hide_index=True, use_container_width=True)
-                else:
-                    st.info("ยังไม่มี Feedback")
+                df_fb = run_query("SELECT AVG(rating) AS avg_rating FROM customer_feedback WHERE customer_id = :cid", {"cid": sel_cust_id})
+                if pd.notnull(df_fb['avg_rating'][0]):
+                    st.metric("⭐ Rating เฉลี่ย", f"{df_fb['avg_rating'][0]:.1f}/5")
+                render_customer_timeline(sel_cust_id, kinds=['feedback'], key="feedback")
             
             with tab5:
                 # --- Tags ---
@@ -2169,6 +4965,7 @@ elif choice == "🎯 Customer 360":
                         c1.markdown(f"🏷️ {tag['tag_name']}")
                         if c2.button("❌", key=f"del_tag_{tag['tag_id']}"):
                             run_query("DELETE FROM customer_tags WHERE tag_id = :tid", {"tid": tag['tag_id']})
+                            reset_customer_timeline(sel_cust_id)
                             st.rerun()
                 
                 st.divider()
@@ -2187,6 +4984,7 @@ elif choice == "🎯 Customer 360":
                     if tag_to_add:
                         run_query("INSERT INTO customer_tags (customer_id, tag_name) VALUES (:cid, :tag)", 
                                  {"cid": sel_cust_id, "tag": tag_to_add})
+                        reset_customer_timeline(sel_cust_id)
                         st.success(f"✅ เพิ่ม Tag '{tag_to_add}' แล้ว!")
                         st.rerun()
 
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Cell and phone normalization for customer imports.
+
+Spreadsheets store phone numbers, zipcodes and LINE ids typed as numbers as
+int/float cells: 0812345678 arrives as 812345678 or 812345678.0. Cells are
+turned back into the text a person typed, and phones are normalized to the
+Thai local format (leading 0) or rejected. No pandas or Streamlit imports.
+"""
+import datetime
+import re
+
+MOBILE_PREFIXES = "689"  # 06x, 08x, 09x
+
+
+def excel_cell_text(value):
+    """Text of an openpyxl cell value: integral numbers without '.0', blanks as ''."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return ""
+        return str(int(value)) if value.is_integer() else repr(value)
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat() if value.time() == datetime.time() else value.isoformat(sep=" ")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)
+
+
+def normalize_phone(text):
+    """Local Thai phone number (9 or 10 digits starting with 0), or '' if it is not one.
+
+    +66 / 66 prefixes become 0, and a 9-digit mobile that lost its leading 0 in a
+    numeric cell (812345678) gets it back. Anything else that does not start with 0
+    (e.g. 8123456780) is rejected rather than guessed.
+    """
+    digits = re.sub(r"\D", "", str(text or ""))
+    if len(digits) in (11, 10) and digits.startswith("66") and not digits.startswith("660"):
+        digits = "0" + digits[2:]
+    if len(digits) == 9 and digits[0] in MOBILE_PREFIXES:
+        digits = "0" + digits
+    return digits if len(digits) in (9, 10) and digits.startswith("0") else ""
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Receipt rendering.
+
+The HTML layout is parsed once into string.Template objects and filled per bill;
+the app stores the rendered copy per bill_id so a reprint is a single lookup.
+
+PDFs (one page per bill, 80 mm wide) are drawn with matplotlib and, for a batch,
+rendered on a process pool and returned as one ZIP. This module has no Streamlit
+or database imports so pool workers can import it cheaply. PDFs need a font with
+Thai glyphs: one installed on the host or a .ttf/.otf dropped into fonts/.
+
+A receipt is a dict:
+    bill_id, sale_date (datetime), customer, seller, payment_method,
+    items [{name, qty, total}], subtotal, discount, final
+"""
+import functools
+import glob
+import html
+import io
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from string import Template
+
+SHOP_NAME = "CRM Smart Pro System"
+FOOTER = "Thank you for your business!"
+
+# Thai-capable fonts tried in order; the first one found is used for every PDF
+PDF_FONTS = ["Sarabun", "TH Sarabun New", "Noto Sans Thai", "Tahoma", "Loma", "Garuda", "Norasi"]
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+THAI_PROBE_CHAR = 0x0E01  # ก
+PDF_WIDTH_IN = 3.15  # 80 mm thermal paper
+PDF_LINE_IN = 0.2
+PDF_CHUNK = 50
+
+RECEIPT_HTML = Template("""<div style="font-family: 'Courier New', Courier, monospace; border: 1px solid #ccc; padding: 20px; width: 300px; margin: auto; background: white; color: black;" id="receipt">
+    <h3 style="text-align: center; margin-bottom: 5px;">RECEIPT</h3>
+    <p style="text-align: center; font-size: 12px; margin-top: 0;">$shop</p>
+    <hr>
+    <p style="font-size: 14px;"><b>Bill ID:</b> $bill_id<br>
+    <b>Date:</b> $date<br>
+    <b>Customer:</b> $customer<br>
+    <b>Seller:</b> $seller</p>
+    <hr>
+    <table style="width: 100%; font-size: 14px;">$rows</table>
+    <hr>
+    <table style="width: 100%; font-size: 14px;">
+        <tr><td>Subtotal:</td><td style='text-align: right;'>$subtotal</td></tr>
+        <tr><td>Discount ($discount_pct%):</td><td style='text-align: right;'>-$discount</td></tr>
+        <tr style='font-weight: bold;'><td>TOTAL:</td><td style='text-align: right;'>$final</td></tr>
+    </table>
+    <p style="font-size: 14px;"><b>Method:</b> $payment_method</p>
+    <hr>
+    <p style="text-align: center; font-size: 12px;">$footer</p>
+</div>""")
+RECEIPT_ROW_HTML = Template("<tr><td>$name x$qty</td><td style='text-align: right;'>$total</td></tr>")
+
+
+def discount_pct(receipt):
+    subtotal = receipt["subtotal"] or 0
+    return round(receipt["discount"] / subtotal * 100, 2) if subtotal else 0
+
+
+def render_receipt_html(receipt):
+    """Fill the compiled receipt template; every text value is HTML-escaped."""
+    esc = lambda v: html.escape(str(v if v is not None else "-"))
+    rows = "".join(RECEIPT_ROW_HTML.substitute(name=esc(i["name"]), qty=i["qty"], total=f"{i['total']:,.2f}")
+                   for i in receipt["items"])
+    return RECEIPT_HTML.substitute(
+        shop=esc(SHOP_NAME), footer=esc(FOOTER), bill_id=esc(receipt["bill_id"]),
+        date=receipt["sale_date"].strftime("%d/%m/%Y %H:%M"), customer=esc(receipt["customer"]),
+        seller=esc(receipt["seller"]), rows=rows, subtotal=f"{receipt['subtotal']:,.2f}",
+        discount_pct=discount_pct(receipt), discount=f"{receipt['discount']:,.2f}",
+        final=f"{receipt['final']:,.2f}", payment_method=esc(receipt["payment_method"]),
+    )
+
+
+class ThaiFontMissing(RuntimeError):
+    """No font with Thai glyphs is available for PDF receipts."""
+
+
+@functools.lru_cache(maxsize=None)
+def thai_font():
+    """Family name of the first available Thai-capable font, looked up once per process.
+
+    Fonts in FONT_DIR are registered with matplotlib first. Raises ThaiFontMissing
+    instead of letting matplotlib fall back to a font that renders Thai as boxes.
+    """
+    from matplotlib import font_manager
+    from matplotlib.ft2font import FT2Font
+
+    bundled = []
+    for path in sorted(glob.glob(os.path.join(FONT_DIR, "*.[ot]tf"))):
+        font_manager.fontManager.addfont(path)
+        bundled.append(font_manager.FontProperties(fname=path).get_name())
+    for family in bundled + PDF_FONTS:
+        try:
+            path = font_manager.findfont(font_manager.FontProperties(family=family), fallback_to_default=False)
+        except ValueError:
+            continue
+        if THAI_PROBE_CHAR in FT2Font(path).get_charmap():
+            return family
+    raise ThaiFontMissing(f"No Thai font found; install one of {', '.join(PDF_FONTS)} or add a .ttf to {FONT_DIR}")
+
+
+def render_receipt_pdf(receipt):
+    """One-page PDF of a receipt, as bytes."""
+    # Imported lazily: only PDF paths pay for matplotlib
+    from matplotlib.figure import Figure
+    from matplotlib.lines import Line2D
+
+    # (left text, right text, style) per line; style is None, "center", "bold" or "rule"
+    lines = [("RECEIPT", "", "center"), (SHOP_NAME, "", "center"), ("", "", "rule"),
+             (f"Bill ID: {receipt['bill_id']}", "", None),
+             (f"Date: {receipt['sale_date']:%d/%m/%Y %H:%M}", "", None),
+             (f"Customer: {receipt['customer']}", "", None),
+             (f"Seller: {receipt['seller']}", "", None), ("", "", "rule")]
+    lines += [(f"{i['name']} x{i['qty']}", f"{i['total']:,.2f}", None) for i in receipt["items"]]
+    lines += [("", "", "rule"), ("Subtotal:", f"{receipt['subtotal']:,.2f}", None),
+              (f"Discount ({discount_pct(receipt)}%):", f"-{receipt['discount']:,.2f}", None),
+              ("TOTAL:", f"{receipt['final']:,.2f}", "bold"),
+              (f"Method: {receipt['payment_method']}", "", None), ("", "", "rule"), (FOOTER, "", "center")]
+
+    height = PDF_LINE_IN * (len(lines) + 2)
+    fig = Figure(figsize=(PDF_WIDTH_IN, height))
+    font = {"family": thai_font(), "size": 8}
+    for n, (left, right, style) in enumerate(lines, 1):
+        y = 1 - n * PDF_LINE_IN / height
+        if style == "rule":
+            fig.add_artist(Line2D([0.06, 0.94], [y, y], linewidth=0.5, color="#999999"))
+        elif style == "center":
+            fig.text(0.5, y, left, ha="center", va="center", fontdict=font)
+        else:
+            weight = "bold" if style == "bold" else "normal"
+            fig.text(0.06, y, left, ha="left", va="center", fontdict=font, weight=weight)
+            if right:
+                fig.text(0.94, y, right, ha="right", va="center", fontdict=font, weight=weight)
+    buf = io.BytesIO()
+    fig.savefig(buf, format="pdf")
+    return buf.getvalue()
+
+
+def _render_pdf_chunk(receipts):
+    return [(r["bill_id"], render_receipt_pdf(r)) for r in receipts]
+
+
+def render_receipts_zip(receipts, workers=None, chunk=PDF_CHUNK):
+    """Render many receipts to PDFs (one file per bill) and return them as ZIP bytes.
+
+    Chunks of `chunk` receipts are rendered on a process pool (spawned, so it is
+    safe from a multi-threaded server); small batches render in-process.
+    Raises ThaiFontMissing before any rendering when no Thai font is available.
+    """
+    if receipts:
+        thai_font()
+    chunks = [receipts[i:i + chunk] for i in range(0, len(receipts), chunk)]
+    if len(chunks) <= 1:
+        results = [_render_pdf_chunk(c) for c in chunks]
+    else:
+        workers = workers or min(len(chunks), os.cpu_count() or 1, 4)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(_render_pdf_chunk, chunks))
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for part in results:
+            for bill_id, pdf in part:
+                zf.writestr(f"{bill_id}.pdf", pdf)
+    return buf.getvalue()
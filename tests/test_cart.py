@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cart import BUNDLE_LINE_PREFIX, Cart, percent_discount_rule
+
+PACKAGE = {"package_id": 7, "name": "คอร์สคู่", "price": 900,
+           "items": [(1, "คอร์ส A", 500), (2, "คอร์ส B", 500)]}
+
+
+def test_empty_cart():
+    cart = Cart()
+    assert not cart and len(cart) == 0
+    assert cart.totals["subtotal"] == 0 and cart.totals["final"] == 0
+    assert cart.to_items() == []
+
+
+def test_load_package_applies_bundle_price():
+    cart = Cart()
+    cart.load_package(PACKAGE)
+    assert cart.list_subtotal == 1000
+    assert cart.totals["adjustments"] == [{"package_id": 7, "name": BUNDLE_LINE_PREFIX + "คอร์สคู่", "amount": -100}]
+    assert cart.totals["subtotal"] == 900
+
+    items = cart.to_items()
+    assert [i["id"] for i in items] == [1, 2, 0]
+    adj = items[-1]
+    assert adj["total"] == adj["price"] == -100 and adj["qty"] == 1 and adj["is_course"] is False
+    assert sum(i["total"] for i in items) == cart.totals["subtotal"]
+
+
+def test_load_package_replaces_cart():
+    cart = Cart()
+    cart.add_product(9, "อื่น", 250)
+    cart.load_package(PACKAGE)
+    assert cart.product_ids() == [1, 2]
+
+
+def test_percent_discount_applies_after_bundle():
+    cart = Cart()
+    cart.load_package(PACKAGE)
+    cart.add_product(3, "คอร์ส C", 300)
+    cart.set_discount_pct(10)
+    assert cart.totals["subtotal"] == 1200
+    assert cart.totals["discount"] == pytest.approx(120)
+    assert cart.totals["final"] == pytest.approx(1080)
+
+
+def test_discount_reprices_only_on_change():
+    cart = Cart()
+    cart.add_product(1, "คอร์ส A", 500)
+    version = cart.version
+    cart.set_discount_pct(0)
+    assert cart.version == version
+    cart.set_discount_pct(5)
+    assert cart.version == version + 1
+
+
+def test_removing_package_line_drops_bundle():
+    cart = Cart()
+    cart.load_package(PACKAGE)
+    cart.remove(0)
+    assert cart.totals["adjustments"] == []
+    assert cart.totals["subtotal"] == 500
+    assert [i["id"] for i in cart.to_items()] == [2]
+
+
+def test_same_product_add_merges():
+    cart = Cart()
+    cart.add_product(1, "คอร์ส A", 500)
+    cart.add_product(1, "คอร์ส A", 500, qty=2)
+    assert len(cart) == 1
+    assert cart.lines[0]["qty"] == 3 and cart.lines[0]["total"] == 1500
+    assert cart.totals["subtotal"] == 1500
+
+
+def test_package_product_does_not_merge_with_single_add():
+    cart = Cart()
+    cart.load_package(PACKAGE)
+    cart.add_product(1, "คอร์ส A", 500)
+    assert len(cart) == 3
+    assert cart.totals["adjustments"][0]["amount"] == -100
+
+
+def test_float_subtotal_returns_to_zero_after_remove():
+    cart = Cart()
+    cart.add_product(1, "a", 0.1)
+    cart.add_product(2, "b", 0.2)
+    cart.remove(1)
+    cart.remove(0)
+    assert cart.list_subtotal == 0
+    assert cart.totals["subtotal"] == 0 and cart.totals["final"] == 0
+
+
+def test_clear_resets_everything():
+    cart = Cart()
+    cart.load_package(PACKAGE)
+    cart.set_discount_pct(10)
+    cart.clear()
+    assert not cart and cart.bundles == {} and cart.discount_pct == 0
+    assert cart.totals["final"] == 0
+
+
+def test_empty_rule_list_is_respected():
+    cart = Cart(rules=[])
+    cart.load_package(PACKAGE)
+    assert cart.totals == {"list_subtotal": 1000, "subtotal": 1000, "adjustments": []}
+
+
+def test_custom_rules():
+    cart = Cart(rules=[percent_discount_rule])
+    cart.load_package(PACKAGE)
+    cart.set_discount_pct(50)
+    assert cart.totals["adjustments"] == [] and cart.totals["final"] == 500
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from customer_import import excel_cell_text, normalize_phone
+
+
+@pytest.mark.parametrize("cell", [812345678, 812345678.0])
+def test_numeric_mobile_cell_gets_leading_zero_back(cell):
+    assert excel_cell_text(cell) == "812345678"
+    assert normalize_phone(excel_cell_text(cell)) == "0812345678"
+
+
+def test_float_cell_is_not_read_as_ten_digits():
+    # str(812345678.0) would be '812345678.0' -> digits '8123456780'
+    assert normalize_phone("8123456780") == ""
+
+
+@pytest.mark.parametrize("raw, phone", [
+    ("081-234-5678", "0812345678"),
+    ("+66 81 234 5678", "0812345678"),
+    ("66812345678", "0812345678"),
+    ("02-123-4567", "021234567"),
+    ("21234567", ""),
+    ("", ""),
+    (None, ""),
+])
+def test_normalize_phone(raw, phone):
+    assert normalize_phone(raw) == phone
+
+
+@pytest.mark.parametrize("cell, text", [
+    (None, ""),
+    (10200, "10200"),
+    (10200.0, "10200"),
+    (12345.5, "12345.5"),
+    (float("nan"), ""),
+    ("@shop", "@shop"),
+    (datetime.datetime(1990, 5, 1), "1990-05-01"),
+    (datetime.date(1990, 5, 1), "1990-05-01"),
+])
+def test_excel_cell_text(cell, text):
+    assert excel_cell_text(cell) == text
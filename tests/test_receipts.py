@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("matplotlib")
+
+import receipts
+
+RECEIPT = {"bill_id": "INV-1", "sale_date": datetime.datetime(2026, 1, 5, 10, 30), "customer": "สมชาย",
+           "seller": "แอน", "payment_method": "เงินสด", "items": [{"name": "คอร์ส A", "qty": 1, "total": 500}],
+           "subtotal": 500, "discount": 0, "final": 500}
+
+
+@pytest.fixture
+def latin_only(monkeypatch, tmp_path):
+    # DejaVu Sans ships with matplotlib but has no Thai glyphs
+    monkeypatch.setattr(receipts, "PDF_FONTS", ["DejaVu Sans"])
+    monkeypatch.setattr(receipts, "FONT_DIR", str(tmp_path))
+    receipts.thai_font.cache_clear()
+    yield
+    receipts.thai_font.cache_clear()
+
+
+def test_font_without_thai_glyphs_is_rejected(latin_only):
+    with pytest.raises(receipts.ThaiFontMissing):
+        receipts.thai_font()
+
+
+def test_zip_fails_before_rendering_without_thai_font(latin_only):
+    with pytest.raises(receipts.ThaiFontMissing):
+        receipts.render_receipts_zip([RECEIPT])
+
+
+def test_empty_zip_needs_no_font(latin_only):
+    assert receipts.render_receipts_zip([])
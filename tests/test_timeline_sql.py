@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Static checks on the customer timeline SQL in crm_app (read with ast; the app needs Streamlit and PostgreSQL)."""
+import ast
+import os
+import re
+
+import pytest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "crm_app.py")
+
+
+def _constants():
+    with open(APP, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    found = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            if node.targets[0].id in ("TIMELINE_COLUMNS", "TIMELINE_SOURCES"):
+                found[node.targets[0].id] = ast.literal_eval(node.value)
+    return found["TIMELINE_COLUMNS"], found["TIMELINE_SOURCES"]
+
+
+def _select_aliases(select_sql):
+    """Output column names of the outer SELECT list (items split on top-level commas)."""
+    body = re.search(r"SELECT(.*?)\n\s*FROM ", select_sql, re.S).group(1)
+    items, depth, cur = [], 0, ""
+    for ch in body:
+        depth += ch == "("
+        depth -= ch == ")"
+        if ch == "," and depth == 0:
+            items.append(cur)
+            cur = ""
+        else:
+            cur += ch
+    items.append(cur)
+    aliases = []
+    for item in items:
+        m = re.search(r"\bAS\s+(\w+)\s*$", item.strip(), re.I)
+        aliases.append(m.group(1) if m else None)
+    return aliases
+
+
+COLUMNS, SOURCES = _constants()
+
+
+@pytest.mark.parametrize("kind", sorted(SOURCES))
+def test_single_kind_branch_names_every_column(kind):
+    # A single-kind timeline (Customer 360 tabs) has no other branch to take column names from
+    select_sql, ts_col, ref_col = SOURCES[kind]
+    assert _select_aliases(select_sql) == COLUMNS
+    assert f"'{kind}' AS kind" in select_sql
+
+
+@pytest.mark.parametrize("kind", sorted(SOURCES))
+def test_branch_filters_one_customer(kind):
+    select_sql, ts_col, ref_col = SOURCES[kind]
+    assert ":cid" in select_sql and select_sql.rstrip().endswith(":cid")
@@ -1,1085 +1,501 @@
 # -*- coding: utf-8 -*-
-LOCATION_DATA = {
-    "กรุงเทพมหานคร": {
-        "พระนคร": "10200",
-        "ดุสิต": "10300",
-        "หนองจอก": "10530",
-        "บางรัก": "10500",
-        "บางเขน": "10220",
-        "บางกะปิ": "10240",
-        "ปทุมวัน": "10330",
-        "ป้อมปราบศัตรูพ่าย": "10100",
-        "พระโขนง": "10260",
-        "มีนบุรี": "10510",
-        "ลาดกระบัง": "10520",
-        "ยานนาวา": "10120",
-        "สัมพันธวงศ์": "10100",
-        "พญาไท": "10400",
-        "ธนบุรี": "10600",
-        "บางกอกใหญ่": "10600",
-        "ห้วยขวาง": "10310",
-        "คลองสาน": "10600",
-        "ตลิ่งชัน": "10170",
-        "บางกอกน้อย": "10700",
-        "บางขุนเทียน": "10150",
-        "ภาษีเจริญ": "10160",
-        "หนองแขม": "10160",
-        "ราษฎร์บูรณะ": "10140",
-        "บางพลัด": "10700",
-        "ดินแดง": "10400",
-        "บึงกุ่ม": "10240",
-        "สาทร": "10120",
-        "บางซื่อ": "10800",
-        "จตุจักร": "10900",
-        "บางคอแหลม": "10120",
-        "ประเวศ": "10250",
-        "คลองเตย": "10110",
-        "สวนหลวง": "10250",
-        "จอมทอง": "10150",
-        "ดอนเมือง": "10210",
-        "ราชเทวี": "10400",
-        "ลาดพร้าว": "10230",
-        "วัฒนา": "10110",
-        "บางแค": "10160",
-        "หลักสี่": "10210",
-        "สายไหม": "10220",
-        "คันนายาว": "10230",
-        "สะพานสูง": "10240",
-        "วังทองหลาง": "10310",
-        "คลองสามวา": "10510",
-        "บางนา": "10260",
-        "ทวีวัฒนา": "10170",
-        "ทุ่งครุ": "10140",
-        "บางบอน": "10150"
-    },
-    "สมุทรปราการ": {
-        "เมืองสมุทรปราการ": "10270",
-        "บางบ่อ": "10560",
-        "บางพลี": "10540",
-        "พระประแดง": "10130",
-        "พระสมุทรเจดีย์": "10290",
-        "บางเสาธง": "10570"
-    },
-    "นนทบุรี": {
-        "เมืองนนทบุรี": "11000",
-        "บางกรวย": "11130",
-        "บางใหญ่": "11140",
-        "บางบัวทอง": "11110",
-        "ไทรน้อย": "11150",
-        "ปากเกร็ด": "11120"
-    },
-    "ปทุมธานี": {
-        "เมืองปทุมธานี": "12000",
-        "คลองหลวง": "12120",
-        "ธัญบุรี": "12130",
-        "หนองเสือ": "12170",
-        "ลาดหลุมแก้ว": "12140",
-        "ลำลูกกา": "12130",
-        "สามโคก": "12160"
-    },
-    "พระนครศรีอยุธยา": {
-        "พระนครศรีอยุธยา": "13000",
-        "ท่าเรือ": "13130",
-        "นครหลวง": "13260",
-        "บางไทร": "13190",
-        "บางบาล": "13250",
-        "บางปะอิน": "13160",
-        "บางปะหัน": "13220",
-        "ผักไห่": "13120",
-        "ภาชี": "13140",
-        "ลาดบัวหลวง": "13230",
-        "วังน้อย": "13170",
-        "เสนา": "13110",
-        "บางซ้าย": "13270",
-        "อุทัย": "13210",
-        "มหาราช": "13150",
-        "บ้านแพรก": "13240"
-    },
-    "อ่างทอง": {
-        "เมืองอ่างทอง": "14000",
-        "ไชโย": "14140",
-        "ป่าโมก": "14130",
-        "โพธิ์ทอง": "14120",
-        "แสวงหา": "14150",
-        "วิเศษชัยชาญ": "14110",
-        "สามโก้": "14160"
-    },
-    "ลพบุรี": {
-        "เมืองลพบุรี": "15000",
-        "พัฒนานิคม": "15140",
-        "โคกสำโรง": "15120",
-        "ชัยบาดาล": "15130",
-        "ท่าวุ้ง": "15150",
-        "บ้านหมี่": "15110",
-        "ท่าหลวง": "15230",
-        "สระโบสถ์": "15240",
-        "โคกเจริญ": "15250",
-        "ลำสนธิ": "15190",
-        "หนองม่วง": "15170"
-    },
-    "สิงห์บุรี": {
-        "เมืองสิงห์บุรี": "16000",
-        "บางระจัน": "16130",
-        "ค่ายบางระจัน": "16150",
-        "พรหมบุรี": "16120",
-        "ท่าช้าง": "16140",
-        "อินทร์บุรี": "16110"
-    },
-    "ชัยนาท": {
-        "เมืองชัยนาท": "17000",
-        "มโนรมย์": "17110",
-        "วัดสิงห์": "17120",
-        "สรรพยา": "17150",
-        "สรรคบุรี": "17140",
-        "หันคา": "17130",
-        "หนองมะโมง": "17120",
-        "เนินขาม": "17130"
-    },
-    "สระบุรี": {
-        "เมืองสระบุรี": "18000",
-        "แก่งคอย": "18110",
-        "หนองแค": "18140",
-        "วิหารแดง": "18150",
-        "หนองแซง": "18170",
-        "บ้านหมอ": "18130",
-        "ดอนพุด": "18210",
-        "หนองโดน": "18190",
-        "พระพุทธบาท": "18120",
-        "เสาไห้": "18160",
-        "มวกเหล็ก": "18180",
-        "วังม่วง": "18220",
-        "เฉลิมพระเกียรติ": "18000"
-    },
-    "ชลบุรี": {
-        "เมืองชลบุรี": "20000",
-        "บ้านบึง": "20170",
-        "หนองใหญ่": "20190",
-        "บางละมุง": "20150",
-        "พานทอง": "20160",
-        "พนัสนิคม": "20140",
-        "ศรีราชา": "20110",
-        "เกาะสีชัง": "20120",
-        "สัตหีบ": "20180",
-        "บ่อทอง": "20270",
-        "เกาะจันทร์": "20240"
-    },
-    "ระยอง": {
-        "เมืองระยอง": "21000",
-        "บ้านฉาง": "21130",
-        "แกลง": "21110",
-        "วังจันทร์": "21210",
-        "บ้านค่าย": "21120",
-        "ปลวกแดง": "21140",
-        "เขาชะเมา": "21110",
-        "นิคมพัฒนา": "21180"
-    },
-    "จันทบุรี": {
-        "เมืองจันทบุรี": "22000",
-        "ขลุง": "22110",
-        "ท่าใหม่": "22120",
-        "โป่งน้ำร้อน": "22140",
-        "มะขาม": "22150",
-        "แหลมสิงห์": "22130",
-        "สอยดาว": "22180",
-        "แก่งหางแมว": "22160",
-        "นายายอาม": "22160",
-        "เขาคิชฌกูฏ": "22210"
-    },
-    "ตราด": {
-        "เมืองตราด": "23000",
-        "คลองใหญ่": "23110",
-        "เขาสมิง": "23130",
-        "บ่อไร่": "23140",
-        "แหลมงอบ": "23120",
-        "เกาะกูด": "23000",
-        "เกาะช้าง": "23170"
-    },
-    "ฉะเชิงเทรา": {
-        "เมืองฉะเชิงเทรา": "24000",
-        "บางคล้า": "24110",
-        "บางน้ำเปรี้ยว": "24150",
-        "บางปะกง": "24130",
-        "บ้านโพธิ์": "24140",
-        "พนมสารคาม": "24120",
-        "ราชสาส์น": "24120",
-        "สนามชัยเขต": "24160",
-        "แปลงยาว": "24190",
-        "ท่าตะเกียบ": "24160",
-        "คลองเขื่อน": "24000"
-    },
-    "ปราจีนบุรี": {
-        "เมืองปราจีนบุรี": "25000",
-        "กบินทร์บุรี": "25110",
-        "นาดี": "25220",
-        "บ้านสร้าง": "25150",
-        "ประจันตคาม": "25130",
-        "ศรีมหาโพธิ": "25140",
-        "ศรีมโหสถ": "25190"
-    },
-    "นครนายก": {
-        "เมืองนครนายก": "26000",
-        "ปากพลี": "26130",
-        "บ้านนา": "26110",
-        "องครักษ์": "26120"
-    },
-    "สระแก้ว": {
-        "เมืองสระแก้ว": "27000",
-        "คลองหาด": "27260",
-        "ตาพระยา": "27180",
-        "วังน้ำเย็น": "27210",
-        "วัฒนานคร": "27160",
-        "อรัญประเทศ": "27120",
-        "เขาฉกรรจ์": "27000",
-        "โคกสูง": "27120",
-        "วังสมบูรณ์": "27250"
-    },
-    "นครราชสีมา": {
-        "เมืองนครราชสีมา": "30000",
-        "ครบุรี": "30250",
-        "เสิงสาง": "30330",
-        "คง": "30260",
-        "บ้านเหลื่อม": "30350",
-        "จักราช": "30230",
-        "โชคชัย": "30190",
-        "ด่านขุนทด": "30210",
-        "โนนไทย": "30220",
-        "โนนสูง": "30160",
-        "ขามสะแกแสง": "30290",
-        "บัวใหญ่": "30120",
-        "ประทาย": "30180",
-        "ปักธงชัย": "30150",
-        "พิมาย": "30110",
-        "ห้วยแถลง": "30240",
-        "ชุมพวง": "30270",
-        "สูงเนิน": "30170",
-        "ขามทะเลสอ": "30280",
-        "สีคิ้ว": "30140",
-        "ปากช่อง": "30130",
-        "หนองบุญมาก": "30410",
-        "แก้งสนามนาง": "30440",
-        "โนนแดง": "30360",
-        "วังน้ำเขียว": "30370",
-        "เทพารักษ์": "30210",
-        "เมืองยาง": "30270",
-        "พระทองคำ": "30220",
-        "ลำทะเมนชัย": "30270",
-        "บัวลาย": "30120",
-        "สีดา": "30430",
-        "เฉลิมพระเกียรติ": "30230"
-    },
-    "บุรีรัมย์": {
-        "เมืองบุรีรัมย์": "31000",
-        "คูเมือง": "31190",
-        "กระสัง": "31160",
-        "นางรอง": "31110",
-        "หนองกี่": "31210",
-        "ละหานทราย": "31170",
-        "ประโคนชัย": "31140",
-        "บ้านกรวด": "31180",
-        "พุทไธสง": "31120",
-        "ลำปลายมาศ": "31130",
-        "สตึก": "31150",
-        "ปะคำ": "31220",
-        "นาโพธิ์": "31230",
-        "หนองหงส์": "31240",
-        "พลับพลาชัย": "31250",
-        "ห้วยราช": "31000",
-        "โนนสุวรรณ": "31110",
-        "ชำนิ": "31110",
-        "บ้านใหม่ไชยพจน์": "31120",
-        "โนนดินแดง": "31260",
-        "บ้านด่าน": "31000",
-        "แคนดง": "31150",
-        "เฉลิมพระเกียรติ": "31110"
-    },
-    "สุรินทร์": {
-        "เมืองสุรินทร์": "32000",
-        "ชุมพลบุรี": "32190",
-        "ท่าตูม": "32120",
-        "จอมพระ": "32180",
-        "ปราสาท": "32140",
-        "กาบเชิง": "32210",
-        "รัตนบุรี": "32130",
-        "สนม": "32160",
-        "ศีขรภูมิ": "32110",
-        "สังขะ": "32150",
-        "ลำดวน": "32220",
-        "สำโรงทาบ": "32170",
-        "บัวเชด": "32230",
-        "พนมดงรัก": "32140",
-        "ศรีณรงค์": "32150",
-        "เขวาสินรินทร์": "32000",
-        "โนนนารายณ์": "32130"
-    },
-    "ศรีสะเกษ": {
-        "เมืองศรีสะเกษ": "33000",
-        "ยางชุมน้อย": "33190",
-        "กันทรารมย์": "33130",
-        "กันทรลักษ์": "33110",
-        "ขุขันธ์": "33140",
-        "ไพรบึง": "33180",
-        "ปรางค์กู่": "33170",
-        "ขุนหาญ": "33150",
-        "ราษีไศล": "33160",
-        "อุทุมพรพิสัย": "33120",
-        "บึงบูรพ์": "33220",
-        "ห้วยทับทัน": "33210",
-        "โนนคูณ": "33250",
-        "ศรีรัตนะ": "33240",
-        "น้ำเกลี้ยง": "33130",
-        "วังหิน": "33270",
-        "ภูสิงห์": "33140",
-        "เมืองจันทร์": "33120",
-        "เบญจลักษ์": "33110",
-        "พยุห์": "33230",
-        "โพธิ์ศรีสุวรรณ": "33120",
-        "ศิลาลาด": "33160"
-    },
-    "อุบลราชธานี": {
-        "เมืองอุบลราชธานี": "34000",
-        "ศรีเมืองใหม่": "34250",
-        "โขงเจียม": "34220",
-        "เขื่องใน": "34150",
-        "เขมราฐ": "34170",
-        "เดชอุดม": "34160",
-        "นาจะหลวย": "34280",
-        "น้ำยืน": "34260",
-        "บุณฑริก": "34230",
-        "ตระการพืชผล": "34130",
-        "กุดข้าวปุ้น": "34270",
-        "ม่วงสามสิบ": "34140",
-        "วารินชำราบ": "34190",
-        "พิบูลมังสาหาร": "34110",
-        "ตาลสุม": "34330",
-        "โพธิ์ไทร": "34340",
-        "สำโรง": "34360",
-        "ดอนมดแดง": "34000",
-        "สิรินธร": "34350",
-        "ทุ่งศรีอุดม": "34160",
-        "นาเยีย": "34160",
-        "นาตาล": "34170",
-        "เหล่าเสือโก้ก": "34000",
-        "สว่างวีระวงศ์": "34190",
-        "น้ำขุ่น": "34260"
-    },
-    "ยโสธร": {
-        "เมืองยโสธร": "35000",
-        "ทรายมูล": "35170",
-        "กุดชุม": "35140",
-        "คำเขื่อนแก้ว": "35110",
-        "ป่าติ้ว": "35150",
-        "มหาชนะชัย": "35130",
-        "ค้อวัง": "35160",
-        "เลิงนกทา": "35120",
-        "ไทยเจริญ": "35120"
-    },
-    "ชัยภูมิ": {
-        "เมืองชัยภูมิ": "36000",
-        "บ้านเขว้า": "36170",
-        "คอนสวรรค์": "36140",
-        "เกษตรสมบูรณ์": "36120",
-        "หนองบัวแดง": "36210",
-        "จัตุรัส": "36130",
-        "บำเหน็จณรงค์": "36160",
-        "หนองบัวระเหว": "36250",
-        "เทพสถิต": "36230",
-        "ภูเขียว": "36110",
-        "บ้านแท่น": "36190",
-        "แก้งคร้อ": "36150",
-        "คอนสาร": "36180",
-        "ภักดีชุมพล": "36260",
-        "เนินสง่า": "36130",
-        "ซับใหญ่": "36130"
-    },
-    "อำนาจเจริญ": {
-        "เมืองอำนาจเจริญ": "37000",
-        "ชานุมาน": "37210",
-        "ปทุมราชวงศา": "37110",
-        "พนา": "37180",
-        "เสนางคนิคม": "37290",
-        "หัวตะพาน": "37240",
-        "ลืออำนาจ": "37000"
-    },
-    "บึงกาฬ": {
-        "เมืองบึงกาฬ": "38000",
-        "พรเจริญ": "38150",
-        "โซ่พิสัย": "38170",
-        "เซกา": "38150",
-        "ปากคาด": "38190",
-        "บึงโขงหลง": "38220",
-        "ศรีวิไล": "38190",
-        "บุ่งคล้า": "38000"
-    },
-    "หนองบัวลำภู": {
-        "เมืองหนองบัวลำภู": "39000",
-        "นากลาง": "39170",
-        "โนนสัง": "39140",
-        "ศรีบุญเรือง": "39180",
-        "สุวรรณคูหา": "39270",
-        "นาวัง": "39170"
-    },
-    "ขอนแก่น": {
-        "เมืองขอนแก่น": "40000",
-        "บ้านฝาง": "40270",
-        "พระยืน": "40320",
-        "หนองเรือ": "40210",
-        "ชุมแพ": "40130",
-        "สีชมพู": "40220",
-        "น้ำพอง": "40140",
-        "อุบลรัตน์": "40250",
-        "กระนวน": "40170",
-        "บ้านไผ่": "40110",
-        "เปือยน้อย": "40340",
-        "พล": "40120",
-        "แวงใหญ่": "40330",
-        "แวงน้อย": "40230",
-        "หนองสองห้อง": "40190",
-        "ภูเวียง": "40150",
-        "มัญจาคีรี": "40160",
-        "ชนบท": "40180",
-        "เขาสวนกวาง": "40280",
-        "ภูผาม่าน": "40350",
-        "ซำสูง": "40170",
-        "โคกโพธิ์ไชย": "40160",
-        "หนองนาคำ": "40150",
-        "บ้านแฮด": "40110",
-        "โนนศิลา": "40110",
-        "เวียงเก่า": "40140"
-    },
-    "อุดรธานี": {
-        "เมืองอุดรธานี": "41000",
-        "กุดจับ": "41250",
-        "หนองวัวซอ": "41360",
-        "กุมภวาปี": "41110",
-        "โนนสะอาด": "41240",
-        "หนองหาน": "41130",
-        "ทุ่งฝน": "41310",
-        "ไชยวาน": "41290",
-        "ศรีธาตุ": "41230",
-        "วังสามหมอ": "41280",
-        "บ้านดุง": "41190",
-        "บ้านผือ": "41160",
-        "น้ำโสม": "41210",
-        "เพ็ญ": "41150",
-        "สร้างคอม": "41260",
-        "หนองแสง": "41340",
-        "นายูง": "41380",
-        "พิบูลย์รักษ์": "41130",
-        "กู่แก้ว": "41130",
-        "ประจักษ์ศิลปาคม": "41110"
-    },
-    "เลย": {
-        "เมืองเลย": "42000",
-        "นาด้วง": "42210",
-        "เชียงคาน": "42110",
-        "ปากชม": "42150",
-        "ด่านซ้าย": "42120",
-        "นาแห้ว": "42170",
-        "ภูเรือ": "42160",
-        "ท่าลี่": "42140",
-        "วังสะพุง": "42130",
-        "ภูกระดึง": "42180",
-        "ภูหลวง": "42230",
-        "ผาขาว": "42240",
-        "เอราวัณ": "42220",
-        "หนองหิน": "42190"
-    },
-    "หนองคาย": {
-        "เมืองหนองคาย": "43000",
-        "ท่าบ่อ": "43110",
-        "โพนพิสัย": "43120",
-        "ศรีเชียงใหม่": "43130",
-        "สังคม": "43160",
-        "สระใคร": "43100",
-        "เฝ้าไร่": "43120",
-        "รัตนวาปี": "43120",
-        "โพธิ์ตาก": "43130"
-    },
-    "มหาสารคาม": {
-        "เมืองมหาสารคาม": "44000",
-        "แกดำ": "44190",
-        "โกสุมพิสัย": "44140",
-        "กันทรวิชัย": "44150",
-        "เชียงยืน": "44160",
-        "บรบือ": "44130",
-        "นาเชือก": "44170",
-        "พยัคฆภูมิพิสัย": "44110",
-        "วาปีปทุม": "44120",
-        "นาดูน": "44180",
-        "ยางสีสุราช": "44210",
-        "กุดรัง": "44130",
-        "ชื่นชม": "44160"
-    },
-    "ร้อยเอ็ด": {
-        "เมืองร้อยเอ็ด": "45000",
-        "เกษตรวิสัย": "45150",
-        "ปทุมรัตต์": "45190",
-        "จตุรพักตรพิมาน": "45180",
-        "ธวัชบุรี": "45170",
-        "พนมไพร": "45140",
-        "โพนทอง": "45110",
-        "โพธิ์ชัย": "45230",
-        "หนองพอก": "45210",
-        "เสลภูมิ": "45120",
-        "สุวรรณภูมิ": "45130",
-        "เมืองสรวง": "45220",
-        "โพนทราย": "45240",
-        "อาจสามารถ": "45160",
-        "เมยวดี": "45250",
-        "ศรีสมเด็จ": "45000",
-        "จังหาร": "45000",
-        "เชียงขวัญ": "45000",
-        "หนองฮี": "45140",
-        "ทุ่งเขาหลวง": "45170"
-    },
-    "กาฬสินธุ์": {
-        "เมืองกาฬสินธุ์": "46000",
-        "นามน": "46230",
-        "กมลาไสย": "46130",
-        "ร่องคำ": "46210",
-        "กุฉินารายณ์": "46110",
-        "เขาวง": "46160",
-        "ยางตลาด": "46120",
-        "ห้วยเม็ก": "46170",
-        "สหัสขันธ์": "46140",
-        "คำม่วง": "46180",
-        "ท่าคันโท": "46190",
-        "หนองกุงศรี": "46220",
-        "สมเด็จ": "46150",
-        "ห้วยผึ้ง": "46240",
-        "สามชัย": "46180",
-        "นาคู": "46160",
-        "ดอนจาน": "46000",
-        "ฆ้องชัย": "46130"
-    },
-    "สกลนคร": {
-        "เมืองสกลนคร": "47000",
-        "กุสุมาลย์": "47210",
-        "กุดบาก": "47180",
-        "พรรณานิคม": "47130",
-        "พังโคน": "47160",
-        "วาริชภูมิ": "47150",
-        "นิคมน้ำอูน": "47270",
-        "วานรนิวาส": "47120",
-        "คำตากล้า": "47250",
-        "บ้านม่วง": "47140",
-        "อากาศอำนวย": "47170",
-        "สว่างแดนดิน": "47110",
-        "ส่องดาว": "47190",
-        "เต่างอย": "47260",
-        "โคกศรีสุพรรณ": "47280",
-        "เจริญศิลป์": "47290",
-        "โพนนาแก้ว": "47230",
-        "ภูพาน": "47180"
-    },
-    "นครพนม": {
-        "เมืองนครพนม": "48000",
-        "ปลาปาก": "48160",
-        "ท่าอุเทน": "48120",
-        "บ้านแพง": "48140",
-        "ธาตุพนม": "48110",
-        "เรณูนคร": "48170",
-        "นาแก": "48130",
-        "ศรีสงคราม": "48150",
-        "นาหว้า": "48180",
-        "โพนสวรรค์": "48190",
-        "นาทม": "48140",
-        "วังยาง": "48130"
-    },
-    "มุกดาหาร": {
-        "เมืองมุกดาหาร": "49000",
-        "นิคมคำสร้อย": "49130",
-        "ดอนตาล": "49120",
-        "ดงหลวง": "49140",
-        "คำชะอี": "49110",
-        "หว้านใหญ่": "49150",
-        "หนองสูง": "49160"
-    },
-    "เชียงใหม่": {
-        "เมืองเชียงใหม่": "50200",
-        "จอมทอง": "50160",
-        "แม่แจ่ม": "50270",
-        "เชียงดาว": "50170",
-        "ดอยสะเก็ด": "50220",
-        "แม่แตง": "50150",
-        "แม่ริม": "50180",
-        "สะเมิง": "50250",
-        "ฝาง": "50110",
-        "แม่อาย": "50280",
-        "พร้าว": "50190",
-        "สันป่าตอง": "50120",
-        "สันกำแพง": "50130",
-        "สันทราย": "50210",
-        "หางดง": "50230",
-        "ฮอด": "50240",
-        "ดอยเต่า": "50260",
-        "อมก๋อย": "50310",
-        "สารภี": "50140",
-        "เวียงแหง": "50350",
-        "ไชยปราการ": "50320",
-        "แม่วาง": "50360",
-        "แม่ออน": "50130",
-        "ดอยหล่อ": "50160",
-        "กัลยาณิวัฒนา": "58130"
-    },
-    "ลำพูน": {
-        "เมืองลำพูน": "51000",
-        "แม่ทา": "51140",
-        "บ้านโฮ่ง": "51130",
-        "ลี้": "51110",
-        "ทุ่งหัวช้าง": "51160",
-        "ป่าซาง": "51120",
-        "บ้านธิ": "51180",
-        "เวียงหนองล่อง": "51120"
-    },
-    "ลำปาง": {
-        "เมืองลำปาง": "52000",
-        "แม่เมาะ": "52220",
-        "เกาะคา": "52130",
-        "เสริมงาม": "52210",
-        "งาว": "52110",
-        "แจ้ห่ม": "52120",
-        "วังเหนือ": "52140",
-        "เถิน": "52160",
-        "แม่พริก": "52180",
-        "แม่ทะ": "52150",
-        "สบปราบ": "52170",
-        "ห้างฉัตร": "52190",
-        "เมืองปาน": "52240"
-    },
-    "อุตรดิตถ์": {
-        "เมืองอุตรดิตถ์": "53000",
-        "ตรอน": "53140",
-        "ท่าปลา": "53150",
-        "น้ำปาด": "53110",
-        "ฟากท่า": "53160",
-        "บ้านโคก": "53180",
-        "พิชัย": "53120",
-        "ลับแล": "53130",
-        "ทองแสนขัน": "53230"
-    },
-    "แพร่": {
-        "เมืองแพร่": "54000",
-        "ร้องกวาง": "54140",
-        "ลอง": "54150",
-        "สูงเม่น": "54130",
-        "เด่นชัย": "54110",
-        "สอง": "54120",
-        "วังชิ้น": "54160",
-        "หนองม่วงไข่": "54170"
-    },
-    "น่าน": {
-        "เมืองน่าน": "55000",
-        "แม่จริม": "55170",
-        "บ้านหลวง": "55190",
-        "นาน้อย": "55150",
-        "ปัว": "55120",
-        "ท่าวังผา": "55140",
-        "เวียงสา": "55110",
-        "ทุ่งช้าง": "55130",
-        "เชียงกลาง": "55160",
-        "นาหมื่น": "55180",
-        "สันติสุข": "55210",
-        "บ่อเกลือ": "55220",
-        "สองแคว": "55160",
-        "ภูเพียง": "55000",
-        "เฉลิมพระเกียรติ": "55130"
-    },
-    "พะเยา": {
-        "เมืองพะเยา": "56000",
-        "จุน": "56150",
-        "เชียงคำ": "56110",
-        "เชียงม่วน": "56160",
-        "ดอกคำใต้": "56120",
-        "ปง": "56140",
-        "แม่ใจ": "56130",
-        "ภูซาง": "56110",
-        "ภูกามยาว": "56000"
-    },
-    "เชียงราย": {
-        "เมืองเชียงราย": "57000",
-        "เวียงชัย": "57210",
-        "เชียงของ": "57140",
-        "เทิง": "57160",
-        "พาน": "57120",
-        "ป่าแดด": "57190",
-        "แม่จัน": "57110",
-        "เชียงแสน": "57150",
-        "แม่สาย": "57130",
-        "แม่สรวย": "57180",
-        "เวียงป่าเป้า": "57170",
-        "พญาเม็งราย": "57290",
-        "เวียงแก่น": "57310",
-        "ขุนตาล": "57340",
-        "แม่ฟ้าหลวง": "57240",
-        "แม่ลาว": "57250",
-        "เวียงเชียงรุ้ง": "57210",
-        "ดอยหลวง": "57110"
-    },
-    "แม่ฮ่องสอน": {
-        "เมืองแม่ฮ่องสอน": "58000",
-        "ขุนยวม": "58140",
-        "ปาย": "58130",
-        "แม่สะเรียง": "58110",
-        "แม่ลาน้อย": "58120",
-        "สบเมย": "58110",
-        "ปางมะผ้า": "58150"
-    },
-    "นครสวรรค์": {
-        "เมืองนครสวรรค์": "60000",
-        "โกรกพระ": "60170",
-        "ชุมแสง": "60120",
-        "หนองบัว": "60110",
-        "บรรพตพิสัย": "60180",
-        "เก้าเลี้ยว": "60230",
-        "ตาคลี": "60140",
-        "ท่าตะโก": "60160",
-        "ไพศาลี": "60220",
-        "พยุหะคีรี": "60130",
-        "ลาดยาว": "60150",
-        "ตากฟ้า": "60190",
-        "แม่วงก์": "60150",
-        "แม่เปิน": "60150",
-        "ชุมตาบง": "60150"
-    },
-    "อุทัยธานี": {
-        "เมืองอุทัยธานี": "61000",
-        "ทัพทัน": "61120",
-        "สว่างอารมณ์": "61150",
-        "หนองฉาง": "61110",
-        "หนองขาหย่าง": "61130",
-        "บ้านไร่": "61140",
-        "ลานสัก": "61160",
-        "ห้วยคต": "61170"
-    },
-    "กำแพงเพชร": {
-        "เมืองกำแพงเพชร": "62000",
-        "ไทรงาม": "62150",
-        "คลองลาน": "62180",
-        "ขาณุวรลักษบุรี": "62130",
-        "คลองขลุง": "62120",
-        "พรานกระต่าย": "62110",
-        "ลานกระบือ": "62170",
-        "ทรายทองวัฒนา": "62190",
-        "ปางศิลาทอง": "62120",
-        "บึงสามัคคี": "62210",
-        "โกสัมพีนคร": "62000"
-    },
-    "ตาก": {
-        "เมืองตาก": "63000",
-        "บ้านตาก": "63120",
-        "สามเงา": "63130",
-        "แม่ระมาด": "63140",
-        "ท่าสองยาง": "63150",
-        "แม่สอด": "63110",
-        "พบพระ": "63160",
-        "อุ้มผาง": "63170",
-        "วังเจ้า": "63000"
-    },
-    "สุโขทัย": {
-        "เมืองสุโขทัย": "64000",
-        "บ้านด่านลานหอย": "64140",
-        "คีรีมาศ": "64160",
-        "กงไกรลาศ": "64170",
-        "ศรีสัชนาลัย": "64130",
-        "ศรีสำโรง": "64120",
-        "สวรรคโลก": "64110",
-        "ศรีนคร": "64180",
-        "ทุ่งเสลี่ยม": "64230"
-    },
-    "พิษณุโลก": {
-        "เมืองพิษณุโลก": "65000",
-        "นครไทย": "65120",
-        "ชาติตระการ": "65170",
-        "บางระกำ": "65140",
-        "บางกระทุ่ม": "65110",
-        "พรหมพิราม": "65150",
-        "วัดโบสถ์": "65160",
-        "วังทอง": "65130",
-        "เนินมะปราง": "65190"
-    },
-    "พิจิตร": {
-        "เมืองพิจิตร": "66000",
-        "วังทรายพูน": "66180",
-        "โพธิ์ประทับช้าง": "66190",
-        "ตะพานหิน": "66110",
-        "บางมูลนาก": "66120",
-        "โพทะเล": "66130",
-        "สามง่าม": "66140",
-        "ทับคล้อ": "66150",
-        "สากเหล็ก": "66160",
-        "บึงนาราง": "66130",
-        "ดงเจริญ": "66210",
-        "วชิรบารมี": "66140"
-    },
-    "เพชรบูรณ์": {
-        "เมืองเพชรบูรณ์": "67000",
-        "ชนแดน": "67150",
-        "หล่มสัก": "67110",
-        "หล่มเก่า": "67120",
-        "วิเชียรบุรี": "67130",
-        "ศรีเทพ": "67170",
-        "หนองไผ่": "67140",
-        "บึงสามพัน": "67160",
-        "น้ำหนาว": "67260",
-        "วังโป่ง": "67240",
-        "เขาค้อ": "67270"
-    },
-    "ราชบุรี": {
-        "เมืองราชบุรี": "70000",
-        "จอมบึง": "70150",
-        "สวนผึ้ง": "70180",
-        "ดำเนินสะดวก": "70130",
-        "บ้านโป่ง": "70110",
-        "บางแพ": "70160",
-        "โพธาราม": "70120",
-        "ปากท่อ": "70140",
-        "วัดเพลง": "70170",
-        "บ้านคา": "70180"
-    },
-    "กาญจนบุรี": {
-        "เมืองกาญจนบุรี": "71000",
-        "ไทรโยค": "71150",
-        "บ่อพลอย": "71160",
-        "ศรีสวัสดิ์": "71250",
-        "ท่ามะกา": "71120",
-        "ท่าม่วง": "71110",
-        "ทองผาภูมิ": "71180",
-        "สังขละบุรี": "71240",
-        "พนมทวน": "71140",
-        "เลาขวัญ": "71210",
-        "ด่านมะขามเตี้ย": "71260",
-        "หนองปรือ": "71220",
-        "ห้วยกระเจา": "71170"
-    },
-    "สุพรรณบุรี": {
-        "เมืองสุพรรณบุรี": "72000",
-        "เดิมบางนางบวช": "72120",
-        "ด่านช้าง": "72180",
-        "บางปลาม้า": "72150",
-        "ศรีประจันต์": "72140",
-        "ดอนเจดีย์": "72170",
-        "สองพี่น้อง": "72110",
-        "สามชุก": "72130",
-        "อู่ทอง": "72160",
-        "หนองหญ้าไซ": "72240"
-    },
-    "นครปฐม": {
-        "เมืองนครปฐม": "73000",
-        "กำแพงแสน": "73140",
-        "นครชัยศรี": "73120",
-        "ดอนตูม": "73150",
-        "บางเลน": "73130",
-        "สามพราน": "73110",
-        "พุทธมณฑล": "73170"
-    },
-    "สมุทรสาคร": {
-        "เมืองสมุทรสาคร": "74000",
-        "กระทุ่มแบน": "74110",
-        "บ้านแพ้ว": "74120"
-    },
-    "สมุทรสงคราม": {
-        "เมืองสมุทรสงคราม": "75000",
-        "บางคนที": "75120",
-        "อัมพวา": "75110"
-    },
-    "เพชรบุรี": {
-        "เมืองเพชรบุรี": "76000",
-        "เขาย้อย": "76140",
-        "หนองหญ้าปล้อง": "76160",
-        "ชะอำ": "76120",
-        "ท่ายาง": "76130",
-        "บ้านลาด": "76150",
-        "บ้านแหลม": "76110",
-        "แก่งกระจาน": "76170"
-    },
-    "ประจวบคีรีขันธ์": {
-        "เมืองประจวบคีรีขันธ์": "77000",
-        "กุยบุรี": "77150",
-        "ทับสะแก": "77130",
-        "บางสะพาน": "77140",
-        "บางสะพานน้อย": "77170",
-        "ปราณบุรี": "77120",
-        "หัวหิน": "77110",
-        "สามร้อยยอด": "77120"
-    },
-    "นครศรีธรรมราช": {
-        "เมืองนครศรีธรรมราช": "80000",
-        "พรหมคีรี": "80320",
-        "ลานสกา": "80230",
-        "ฉวาง": "80150",
-        "พิปูน": "80270",
-        "เชียรใหญ่": "80190",
-        "ชะอวด": "80180",
-        "ท่าศาลา": "80160",
-        "ทุ่งสง": "80110",
-        "นาบอน": "80220",
-        "ทุ่งใหญ่": "80240",
-        "ปากพนัง": "80140",
-        "ร่อนพิบูลย์": "80130",
-        "สิชล": "80120",
-        "ขนอม": "80210",
-        "หัวไทร": "80170",
-        "บางขัน": "80360",
-        "ถ้ำพรรณรา": "80260",
-        "จุฬาภรณ์": "80180",
-        "พระพรหม": "80000",
-        "นบพิตำ": "80160",
-        "ช้างกลาง": "80250",
-        "เฉลิมพระเกียรติ": "80190"
-    },
-    "กระบี่": {
-        "เมืองกระบี่": "81000",
-        "เขาพนม": "81140",
-        "เกาะลันตา": "81150",
-        "คลองท่อม": "81120",
-        "อ่าวลึก": "81110",
-        "ปลายพระยา": "81160",
-        "ลำทับ": "81120",
-        "เหนือคลอง": "81130"
-    },
-    "พังงา": {
-        "เมืองพังงา": "82000",
-        "เกาะยาว": "82160",
-        "กะปง": "82170",
-        "ตะกั่วทุ่ง": "82130",
-        "ตะกั่วป่า": "82110",
-        "คุระบุรี": "82150",
-        "ทับปุด": "82180",
-        "ท้ายเหมือง": "82120"
-    },
-    "ภูเก็ต": {
-        "เมืองภูเก็ต": "83000",
-        "กะทู้": "83120",
-        "ถลาง": "83110"
-    },
-    "สุราษฎร์ธานี": {
-        "เมืองสุราษฎร์ธานี": "84000",
-        "กาญจนดิษฐ์": "84290",
-        "ดอนสัก": "84220",
-        "เกาะสมุย": "84140",
-        "เกาะพะงัน": "84280",
-        "ไชยา": "84110",
-        "ท่าชนะ": "84170",
-        "คีรีรัฐนิคม": "84180",
-        "บ้านตาขุน": "84230",
-        "พนม": "84250",
-        "ท่าฉาง": "84150",
-        "บ้านนาสาร": "84120",
-        "บ้านนาเดิม": "84240",
-        "เคียนซา": "84260",
-        "เวียงสระ": "84190",
-        "พระแสง": "84210",
-        "พุนพิน": "84130",
-        "ชัยบุรี": "84350",
-        "วิภาวดี": "84180"
-    },
-    "ระนอง": {
-        "เมืองระนอง": "85000",
-        "ละอุ่น": "85130",
-        "กะเปอร์": "85120",
-        "กระบุรี": "85110",
-        "สุขสำราญ": "85120"
-    },
-    "ชุมพร": {
-        "เมืองชุมพร": "86000",
-        "ท่าแซะ": "86140",
-        "ปะทิว": "86160",
-        "หลังสวน": "86110",
-        "ละแม": "86170",
-        "พะโต๊ะ": "86180",
-        "สวี": "86130",
-        "ทุ่งตะโก": "86220"
-    },
-    "สงขลา": {
-        "เมืองสงขลา": "90000",
-        "สทิงพระ": "90190",
-        "จะนะ": "90130",
-        "นาทวี": "90160",
-        "เทพา": "90150",
-        "สะบ้าย้อย": "90210",
-        "ระโนด": "90140",
-        "กระแสสินธุ์": "90270",
-        "รัตภูมิ": "90180",
-        "สะเดา": "90120",
-        "หาดใหญ่": "90110",
-        "นาหม่อม": "90310",
-        "ควนเนียง": "90220",
-        "บางกล่ำ": "90110",
-        "สิงหนคร": "90280",
-        "คลองหอยโข่ง": "90230"
-    },
-    "สตูล": {
-        "เมืองสตูล": "91000",
-        "ควนโดน": "91160",
-        "ควนกาหลง": "91130",
-        "ท่าแพ": "91150",
-        "ละงู": "91110",
-        "ทุ่งหว้า": "91120",
-        "มะนัง": "91130"
-    },
-    "ตรัง": {
-        "เมืองตรัง": "92000",
-        "กันตัง": "92110",
-        "ย่านตาขาว": "92140",
-        "ปะเหลียน": "92120",
-        "สิเกา": "92150",
-        "ห้วยยอด": "92130",
-        "วังวิเศษ": "92220",
-        "นาโยง": "92170",
-        "รัษฎา": "92160",
-        "หาดสำราญ": "92120"
-    },
-    "พัทลุง": {
-        "เมืองพัทลุง": "93000",
-        "กงหรา": "93180",
-        "เขาชัยสน": "93130",
-        "ตะโหมด": "93160",
-        "ควนขนุน": "93110",
-        "ปากพะยูน": "93120",
-        "ศรีบรรพต": "93190",
-        "ป่าบอน": "93170",
-        "บางแก้ว": "93140",
-        "ป่าพะยอม": "93110",
-        "ศรีนครินทร์": "93000"
-    },
-    "ปัตตานี": {
-        "เมืองปัตตานี": "94000",
-        "โคกโพธิ์": "94120",
-        "หนองจิก": "94170",
-        "ปะนาเระ": "94130",
-        "มายอ": "94140",
-        "ทุ่งยางแดง": "94140",
-        "สายบุรี": "94110",
-        "ไม้แก่น": "94220",
-        "ยะหริ่ง": "94150",
-        "ยะรัง": "94160",
-        "กะพ้อ": "94230",
-        "แม่ลาน": "94180"
-    },
-    "ยะลา": {
-        "เมืองยะลา": "95000",
-        "เบตง": "95110",
-        "บันนังสตา": "95130",
-        "ธารโต": "95150",
-        "ยะหา": "95120",
-        "รามัน": "95140",
-        "กาบัง": "95120",
-        "กรงปินัง": "95000"
-    },
-    "นราธิวาส": {
-        "เมืองนราธิวาส": "96000",
-        "ตากใบ": "96110",
-        "บาเจาะ": "96170",
-        "ยี่งอ": "96180",
-        "ระแงะ": "96130",
-        "รือเสาะ": "96150",
-        "ศรีสาคร": "96210",
-        "แว้ง": "96160",
-        "สุคิริน": "96190",
-        "สุไหงโก-ลก": "96120",
-        "สุไหงปาดี": "96140",
-        "จะแนะ": "96220",
-        "เจาะไอร้อง": "96130"
-    }
+"""Thai provinces, districts and zipcodes.
+
+The data lives in thai_locations.bin (a zlib-compressed string table plus
+array-backed province/district records) and is only decoded the first time
+LOCATION_DATA or one of the lookups is used, so importing this module is cheap.
+
+LOCATION_DATA keeps its original shape: {province: {district: zipcode}}.
+
+To edit the data:
+    python thai_locations.py dump > locations.json
+    (edit locations.json)
+    python thai_locations.py build locations.json
+"""
+import os
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thai_locations.bin")
+_MAGIC = b"TLOC"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHHHH")  # magic, version, n_strings, n_provinces, n_districts
+
+
+# --- Packed format ---
+
+def pack(data):
+    """Encode {province: {district: zipcode}} into the compact binary format."""
+    strings, string_ids = [], {}
+
+    def sid(s):
+        if s not in string_ids:
+            string_ids[s] = len(strings)
+            strings.append(s)
+        return string_ids[s]
+
+    prov_name, prov_start = array("H"), array("H")
+    dist_name, dist_zip = array("H"), array("I")
+    for province, districts in data.items():
+        prov_name.append(sid(province))
+        prov_start.append(len(dist_name))
+        for district, zipcode in districts.items():
+            dist_name.append(sid(district))
+            dist_zip.append(int(zipcode))
+
+    blob = b"".join(s.encode("utf-8") for s in strings)
+    offsets = array("I", [0])
+    for s in strings:
+        offsets.append(offsets[-1] + len(s.encode("utf-8")))
+
+    payload = b"".join([
+        _HEADER.pack(_MAGIC, _VERSION, len(strings), len(prov_name), len(dist_name)),
+        offsets.tobytes(), prov_name.tobytes(), prov_start.tobytes(),
+        dist_name.tobytes(), dist_zip.tobytes(), blob,
+    ])
+    return zlib.compress(payload, 9)
+
+
+def unpack(raw):
+    """Decode the binary format back into {province: {district: zipcode}}."""
+    payload = zlib.decompress(raw)
+    magic, version, n_strings, n_prov, n_dist = _HEADER.unpack_from(payload)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("thai_locations.bin has an unknown format")
+    pos = _HEADER.size
+
+    def take(typecode, n):
+        nonlocal pos
+        arr = array(typecode)
+        arr.frombytes(payload[pos:pos + n * arr.itemsize])
+        pos += n * arr.itemsize
+        return arr
+
+    offsets = take("I", n_strings + 1)
+    prov_name, prov_start = take("H", n_prov), take("H", n_prov)
+    dist_name, dist_zip = take("H", n_dist), take("I", n_dist)
+    blob = payload[pos:]
+    strings = [sys.intern(blob[offsets[i]:offsets[i + 1]].decode("utf-8")) for i in range(n_strings)]
+
+    data = {}
+    for p in range(n_prov):
+        end = prov_start[p + 1] if p + 1 < n_prov else n_dist
+        data[strings[prov_name[p]]] = {
+            strings[dist_name[d]]: "%05d" % dist_zip[d] for d in range(prov_start[p], end)
+        }
+    return data
+
+
+# --- Lazy loading ---
+
+_cache = {}
+
+
+def _data():
+    if "data" not in _cache:
+        with open(DATA_FILE, "rb") as f:
+            _cache["data"] = unpack(f.read())
+    return _cache["data"]
+
+
+class _LazyLocationData(Mapping):
+    """Read-only {province: {district: zipcode}} mapping that loads the data file on first use."""
+
+    def __getitem__(self, province):
+        return _data()[province]
+
+    def __iter__(self):
+        return iter(_data())
+
+    def __len__(self):
+        return len(_data())
+
+    def __contains__(self, province):
+        return province in _data()
+
+    def __repr__(self):
+        return "LOCATION_DATA(loaded)" if "data" in _cache else "LOCATION_DATA(not loaded)"
+
+
+LOCATION_DATA = _LazyLocationData()
+
+
+# --- Lookup indexes (built on first use) ---
+
+def _indexes():
+    if "indexes" not in _cache:
+        data = _data()
+        zip_index, district_index = {}, {}
+        for province, districts in data.items():
+            for district, zipcode in districts.items():
+                zip_index.setdefault(zipcode, []).append((province, district))
+                district_index.setdefault(district, []).append(province)
+        prefix_rows = sorted(
+            [(p, "province", p, "", "") for p in data]
+            + [(d, "district", p, d, z) for p, ds in data.items() for d, z in ds.items()]
+            + [(z, "zipcode", p, d, z) for p, ds in data.items() for d, z in ds.items()]
+        )
+        _cache["indexes"] = {
+            "PROVINCES": sorted(data),
+            "DISTRICTS_BY_PROVINCE": {p: sorted(ds) for p, ds in data.items()},
+            "ZIPCODE_INDEX": zip_index,
+            "DISTRICT_INDEX": district_index,
+            "_prefix_rows": prefix_rows,
+            "_prefix_keys": [row[0] for row in prefix_rows],
+        }
+    return _cache["indexes"]
+
+
+def __getattr__(name):
+    # PROVINCES, DISTRICTS_BY_PROVINCE, ZIPCODE_INDEX and DISTRICT_INDEX stay importable as module attributes
+    if name in ("PROVINCES", "DISTRICTS_BY_PROVINCE", "ZIPCODE_INDEX", "DISTRICT_INDEX"):
+        return _indexes()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def provinces():
+    """Sorted province names."""
+    return _indexes()["PROVINCES"]
+
+
+def districts_of(province):
+    """Sorted district names of a province (empty list if unknown)."""
+    return _indexes()["DISTRICTS_BY_PROVINCE"].get(province, [])
+
+
+def district_provinces(district):
+    """Provinces that have a district with this name."""
+    return _indexes()["DISTRICT_INDEX"].get(district, [])
+
+
+def lookup_zipcode(zipcode):
+    """Return [(province, district), ...] for a 5-digit zipcode (empty list if unknown)."""
+    return _indexes()["ZIPCODE_INDEX"].get(str(zipcode or "").strip(), [])
+
+
+def prefix_search(prefix, limit=10):
+    """Provinces, districts and zipcodes starting with `prefix`, as dicts, in sorted order."""
+    prefix = str(prefix or "").strip()
+    if not prefix:
+        return []
+    idx = _indexes()
+    rows, keys = idx["_prefix_rows"], idx["_prefix_keys"]
+    results = []
+    i = bisect_left(keys, prefix)
+    while i < len(rows) and keys[i].startswith(prefix) and len(results) < limit:
+        name, kind, province, district, zipcode = rows[i]
+        results.append({"name": name, "kind": kind, "province": province, "district": district, "zipcode": zipcode})
+        i += 1
+    return results
+
+
+# --- Regions ---
+
+# Six-region scheme (National Research Council, 1977) with Bangkok and its five
+# neighbouring provinces split out as the metro area.
+REGIONS = {
+    "กรุงเทพฯ และปริมณฑล": ["กรุงเทพมหานคร", "นนทบุรี", "ปทุมธานี", "สมุทรปราการ", "สมุทรสาคร", "นครปฐม"],
+    "ภาคเหนือ": ["เชียงราย", "เชียงใหม่", "น่าน", "พะเยา", "แพร่", "แม่ฮ่องสอน", "ลำปาง", "ลำพูน", "อุตรดิตถ์"],
+    "ภาคตะวันออกเฉียงเหนือ": ["กาฬสินธุ์", "ขอนแก่น", "ชัยภูมิ", "นครพนม", "นครราชสีมา", "บึงกาฬ", "บุรีรัมย์",
+                              "มหาสารคาม", "มุกดาหาร", "ยโสธร", "ร้อยเอ็ด", "เลย", "ศรีสะเกษ", "สกลนคร", "สุรินทร์",
+                              "หนองคาย", "หนองบัวลำภู", "อำนาจเจริญ", "อุดรธานี", "อุบลราชธานี"],
+    "ภาคกลาง": ["กำแพงเพชร", "ชัยนาท", "นครนายก", "นครสวรรค์", "พระนครศรีอยุธยา", "พิจิตร", "พิษณุโลก", "เพชรบูรณ์",
+                "ลพบุรี", "สมุทรสงคราม", "สระบุรี", "สิงห์บุรี", "สุโขทัย", "สุพรรณบุรี", "อ่างทอง", "อุทัยธานี"],
+    "ภาคตะวันออก": ["จันทบุรี", "ฉะเชิงเทรา", "ชลบุรี", "ตราด", "ปราจีนบุรี", "ระยอง", "สระแก้ว"],
+    "ภาคตะวันตก": ["กาญจนบุรี", "ตาก", "ประจวบคีรีขันธ์", "เพชรบุรี", "ราชบุรี"],
+    "ภาคใต้": ["กระบี่", "ชุมพร", "ตรัง", "นครศรีธรรมราช", "นราธิวาส", "ปัตตานี", "พังงา", "พัทลุง", "ภูเก็ต",
+               "ยะลา", "ระนอง", "สงขลา", "สตูล", "สุราษฎร์ธานี"],
 }
+REGION_OF_PROVINCE = {p: region for region, ps in REGIONS.items() for p in ps}
+
+
+def region_of(province):
+    """Region name of a canonical province name (None if unknown)."""
+    return REGION_OF_PROVINCE.get(province)
+
+
+def provinces_in(region):
+    """Provinces of a region (empty list if unknown)."""
+    return REGIONS.get(region, [])
+
+
+# --- Fuzzy search (typos, Thai or romanized input) ---
+
+_TONE_MARKS = "\u0e48\u0e49\u0e4a\u0e4b\u0e47"  # ่ ้ ๊ ๋ ็
+_NAME_PREFIXES = ("จังหวัด", "จ.", "อำเภอ", "อ.", "เขต", "ตำบล", "ต.", "แขวง")
+PROVINCE_ALIASES = {"กทม": "กรุงเทพมหานคร", "กทม.": "กรุงเทพมหานคร", "กรุงเทพ": "กรุงเทพมหานคร",
+                    "กรุงเทพฯ": "กรุงเทพมหานคร", "bangkok": "กรุงเทพมหานคร", "bkk": "กรุงเทพมหานคร",
+                    "โคราช": "นครราชสีมา", "korat": "นครราชสีมา", "อยุธยา": "พระนครศรีอยุธยา",
+                    "ayutthaya": "พระนครศรีอยุธยา", "พัทยา": "ชลบุรี", "pattaya": "ชลบุรี"}
+
+# Official RTGS names; romanized input is matched against these rather than romanize() output
+PROVINCE_RTGS = {
+    "กระบี่": "Krabi", "กรุงเทพมหานคร": "Bangkok", "กาญจนบุรี": "Kanchanaburi", "กาฬสินธุ์": "Kalasin",
+    "กำแพงเพชร": "Kamphaeng Phet", "ขอนแก่น": "Khon Kaen", "จันทบุรี": "Chanthaburi", "ฉะเชิงเทรา": "Chachoengsao",
+    "ชลบุรี": "Chon Buri", "ชัยนาท": "Chai Nat", "ชัยภูมิ": "Chaiyaphum", "ชุมพร": "Chumphon", "ตรัง": "Trang",
+    "ตราด": "Trat", "ตาก": "Tak", "นครนายก": "Nakhon Nayok", "นครปฐม": "Nakhon Pathom", "นครพนม": "Nakhon Phanom",
+    "นครราชสีมา": "Nakhon Ratchasima", "นครศรีธรรมราช": "Nakhon Si Thammarat", "นครสวรรค์": "Nakhon Sawan",
+    "นนทบุรี": "Nonthaburi", "นราธิวาส": "Narathiwat", "น่าน": "Nan", "บึงกาฬ": "Bueng Kan",
+    "บุรีรัมย์": "Buri Ram", "ปทุมธานี": "Pathum Thani", "ประจวบคีรีขันธ์": "Prachuap Khiri Khan",
+    "ปราจีนบุรี": "Prachin Buri", "ปัตตานี": "Pattani", "พระนครศรีอยุธยา": "Phra Nakhon Si Ayutthaya",
+    "พะเยา": "Phayao", "พังงา": "Phangnga", "พัทลุง": "Phatthalung", "พิจิตร": "Phichit", "พิษณุโลก": "Phitsanulok",
+    "ภูเก็ต": "Phuket", "มหาสารคาม": "Maha Sarakham", "มุกดาหาร": "Mukdahan", "ยะลา": "Yala", "ยโสธร": "Yasothon",
+    "ระนอง": "Ranong", "ระยอง": "Rayong", "ราชบุรี": "Ratchaburi", "ร้อยเอ็ด": "Roi Et", "ลพบุรี": "Lop Buri",
+    "ลำปาง": "Lampang", "ลำพูน": "Lamphun", "ศรีสะเกษ": "Si Sa Ket", "สกลนคร": "Sakon Nakhon", "สงขลา": "Songkhla",
+    "สตูล": "Satun", "สมุทรปราการ": "Samut Prakan", "สมุทรสงคราม": "Samut Songkhram", "สมุทรสาคร": "Samut Sakhon",
+    "สระบุรี": "Saraburi", "สระแก้ว": "Sa Kaeo", "สิงห์บุรี": "Sing Buri", "สุพรรณบุรี": "Suphan Buri",
+    "สุราษฎร์ธานี": "Surat Thani", "สุรินทร์": "Surin", "สุโขทัย": "Sukhothai", "หนองคาย": "Nong Khai",
+    "หนองบัวลำภู": "Nong Bua Lam Phu", "อำนาจเจริญ": "Amnat Charoen", "อุดรธานี": "Udon Thani",
+    "อุตรดิตถ์": "Uttaradit", "อุทัยธานี": "Uthai Thani", "อุบลราชธานี": "Ubon Ratchathani", "อ่างทอง": "Ang Thong",
+    "เชียงราย": "Chiang Rai", "เชียงใหม่": "Chiang Mai", "เพชรบุรี": "Phetchaburi", "เพชรบูรณ์": "Phetchabun",
+    "เลย": "Loei", "แพร่": "Phrae", "แม่ฮ่องสอน": "Mae Hong Son",
+}
+_RTGS_PROVINCE_KEYS = {"".join(c for c in v.lower() if c.isalpha()): k for k, v in PROVINCE_RTGS.items()}
+
+# Simplified RTGS: good enough as a fuzzy key, not a full transcription
+_RTGS_INITIAL = dict(zip("กขฃคฅฆงจฉชซฌญฎฏฐฑฒณดตถทธนบปผฝพฟภมยรลวศษสหฬอฮ",
+                         ["k", "kh", "kh", "kh", "kh", "kh", "ng", "ch", "ch", "ch", "s", "ch", "y", "d", "t", "th",
+                          "th", "th", "n", "d", "t", "th", "th", "th", "n", "b", "p", "ph", "f", "ph", "f", "ph",
+                          "m", "y", "r", "l", "w", "s", "s", "s", "h", "l", "", "h"]))
+_RTGS_FINAL = dict(zip("กขคฆงจชซฌญฎฏฐฑฒณดตถทธนบปพฟภมยรลวศษสฬอ",
+                       ["k", "k", "k", "k", "ng", "t", "t", "t", "t", "n", "t", "t", "t", "t", "t", "n", "t", "t",
+                        "t", "t", "t", "n", "p", "p", "p", "p", "p", "m", "i", "n", "n", "o", "t", "t", "t", "n", "o"]))
+_RTGS_VOWELS = {"เีย": "ia", "เือ": "uea", "เา": "ao", "เอ": "oe", "เิ": "oe", "ัว": "ua", "ือ": "ue",
+                "ะ": "a", "ั": "a", "า": "a", "ำ": "am", "ิ": "i", "ี": "i", "ึ": "ue", "ื": "ue", "ุ": "u",
+                "ู": "u", "เ": "e", "แ": "ae", "โ": "o", "ใ": "ai", "ไ": "ai", "ฤ": "rue"}
+_LEADING_VOWELS = "เแโใไ"
+_SONORANTS = "งญนมยรลว"
+_CLUSTER_HEADS = "กขคตทปผพ"
+
+
+def _is_vowel(c):
+    return bool(c) and (c in _RTGS_VOWELS or c in _LEADING_VOWELS)
+
+
+def romanize(text):
+    """Approximate RTGS romanization of Thai text (lowercase, no spaces)."""
+    chars = [c for c in str(text) if c not in _TONE_MARKS and c not in " ๆ."]
+    # Karan silences the consonant before it
+    while "\u0e4c" in chars:
+        i = chars.index("\u0e4c")
+        del chars[max(i - 1, 0):i + 1]
+    # Leading vowels are written before the consonant (or cluster / silent-ห pair) they follow in speech
+    i = 0
+    while i < len(chars) - 1:
+        if chars[i] in _LEADING_VOWELS and chars[i + 1] in _RTGS_INITIAL:
+            second = chars[i + 2] if i + 2 < len(chars) else ""
+            j = 2 if (chars[i + 1] == "ห" and second in _SONORANTS
+                      or chars[i + 1] in _CLUSTER_HEADS and second and second in "รลว") else 1
+            chars[i:i + j + 1] = chars[i + 1:i + j + 1] + [chars[i]]
+            i += j
+        i += 1
+
+    out, prev_vowel, i = [], False, 0
+    while i < len(chars):
+        c = chars[i]
+        nxt = chars[i + 1] if i + 1 < len(chars) else ""
+        if _is_vowel(c):
+            for length in (3, 2, 1):
+                combo = "".join(chars[i:i + length])
+                if combo in _RTGS_VOWELS:
+                    out.append(_RTGS_VOWELS[combo])
+                    i += length
+                    break
+            else:
+                i += 1
+            prev_vowel = True
+            continue
+        if c not in _RTGS_INITIAL:
+            out.append(c.lower() if c.isascii() and c.isalnum() else "")
+            prev_vowel = False
+            i += 1
+            continue
+        after = chars[i + 2] if i + 2 < len(chars) else ""
+        if prev_vowel and not _is_vowel(nxt) and not (nxt == "ว" and after in _RTGS_INITIAL):
+            out.append(_RTGS_FINAL.get(c, ""))
+            prev_vowel = False
+        elif c == "ห" and nxt in _SONORANTS:
+            pass  # silent ห before a sonorant
+        elif c == "อ" and out and not prev_vowel:
+            out.append("o")
+            prev_vowel = True
+        elif c == "ท" and nxt == "ร":
+            out.append("s")  # ทร sounds like ซ
+            i += 1
+        else:
+            out.append(_RTGS_INITIAL[c])
+            # Closed syllable with an implicit vowel: คน -> khon, จวบ -> chuap
+            if nxt == "ว" and after in _RTGS_INITIAL and after != "อ":
+                out.append("ua")
+                i += 1
+                prev_vowel = True
+            elif (nxt in _RTGS_INITIAL and nxt != "อ" and after in _RTGS_INITIAL
+                  and not (c in _CLUSTER_HEADS and nxt in "รลว")):
+                out.append("o")
+                prev_vowel = True
+            else:
+                prev_vowel = False
+        i += 1
+    return "".join(out)
+
+
+def _thai_key(text):
+    text = str(text or "").strip().lower()
+    for prefix in _NAME_PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+            break
+    return "".join(c for c in text if c not in _TONE_MARKS and c not in " .-")
+
+
+def _latin_key(text):
+    return "".join(c for c in str(text or "").lower() if c.isascii() and c.isalpha())
+
+
+def _skeleton(latin_key):
+    return "".join(c for c in latin_key if c not in "aeiouy")
+
+
+def _bigrams(key):
+    padded = f" {key} "
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def _edit_distance(a, b):
+    """Levenshtein distance."""
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def _similarity(a, b):
+    """1 - edit distance / longer length (1.0 = identical)."""
+    longest = max(len(a), len(b))
+    return 1 - _edit_distance(a, b) / longest if longest else 0.0
+
+
+def _fuzzy_index():
+    if "fuzzy" not in _cache:
+        entries = []
+        for province, districts in _data().items():
+            entries.append(("province", province, "", ""))
+            entries.extend(("district", province, d, z) for d, z in districts.items())
+        keys, grams = [], {}
+        for eid, (kind, province, district, _) in enumerate(entries):
+            name = province if kind == "province" else district
+            thai = _thai_key(name)
+            latin = _latin_key(PROVINCE_RTGS[name]) if kind == "province" and name in PROVINCE_RTGS else romanize(name)
+            keys.append((thai, latin, _skeleton(latin)))
+            for g in _bigrams(thai):
+                grams.setdefault(g, []).append(eid)
+            for g in _bigrams(latin):
+                grams.setdefault("~" + g, []).append(eid)
+        _cache["fuzzy"] = {"entries": entries, "keys": keys, "grams": grams}
+    return _cache["fuzzy"]
+
+
+def fuzzy_search(query, limit=5, kinds=("province", "district"), candidates=8):
+    """Best province/district matches for a possibly misspelled Thai or romanized name.
+
+    Candidates share character bigrams with the query; they are ranked by edit distance.
+    Returns dicts with kind, name, province, district, zipcode and score (1.0 = exact).
+    """
+    latin = not any("\u0e00" <= c <= "\u0e7f" for c in str(query or ""))
+    key = _latin_key(query) if latin else _thai_key(query)
+    if not key:
+        return []
+    idx = _fuzzy_index()
+    entries, counts = idx["entries"], {}
+    for g in _bigrams(key):
+        for eid in idx["grams"].get(("~" + g) if latin else g, ()):
+            counts[eid] = counts.get(eid, 0) + 1
+    top = sorted((e for e in counts if entries[e][0] in kinds), key=counts.get, reverse=True)[:candidates]
+
+    # Romanizations disagree mostly on vowels, so Latin queries also compare consonant skeletons
+    skeleton = _skeleton(key) if latin else ""
+    scored = []
+    for eid in top:
+        keys = idx["keys"][eid]
+        score = _similarity(key, keys[1] if latin else keys[0])
+        if skeleton and score < 1:
+            score = max(score, _similarity(skeleton, keys[2]))
+        scored.append((score, eid))
+    scored.sort(key=lambda x: x[0], reverse=True)
+
+    results = []
+    for score, eid in scored[:limit]:
+        kind, province, district, zipcode = entries[eid]
+        results.append({"kind": kind, "name": province if kind == "province" else district,
+                        "province": province, "district": district, "zipcode": zipcode, "score": round(score, 3)})
+    return results
+
+
+def canonical_province(text):
+    """Province name for text that names one exactly, up to a 'จ.'/'จังหวัด' prefix, tone marks or a known
+    alias ('กทม', 'korat'); None otherwise. Never guesses."""
+    raw = str(text or "").strip()
+    if not raw:
+        return None
+    if raw in LOCATION_DATA:
+        return raw
+    alias = PROVINCE_ALIASES.get(raw.lower()) or PROVINCE_ALIASES.get(_thai_key(raw))
+    if alias:
+        return alias
+    thai = _thai_key(raw)
+    if thai:
+        for province in LOCATION_DATA:
+            if _thai_key(province) == thai:
+                return province
+    latin = _latin_key(raw)
+    return _RTGS_PROVINCE_KEYS.get(latin) if latin else None
+
+
+def normalize_province(text, min_score=0.75, district_score=0.9, margin=0.1):
+    """Canonical province for free text ('จ.เชียงใหม', 'chiang mai', 'nakhon pathom', 'กทม'), or None.
+
+    Only province names are matched fuzzily (romanized input against the official RTGS names); the best
+    match must reach `min_score` and beat the runner-up by `margin`. A district name counts only when it
+    is unique across provinces and scores at least `district_score`. Anything less certain returns None.
+    """
+    exact = canonical_province(text)
+    if exact:
+        return exact
+    raw = str(text or "").strip()
+    latin = not any("\u0e00" <= c <= "\u0e7f" for c in raw)
+    if latin:
+        # A clear start of one official name: 'ubon', 'suphan' (but not 'nakhon')
+        key = _latin_key(raw)
+        starts = {p for k, p in _RTGS_PROVINCE_KEYS.items() if len(key) >= 4 and k.startswith(key)}
+        if len(starts) == 1:
+            return starts.pop()
+    hits = fuzzy_search(raw, limit=2, kinds=("province",))
+    if hits and hits[0]["score"] >= min_score and (len(hits) == 1 or hits[0]["score"] - hits[1]["score"] >= margin):
+        return hits[0]["province"]
+    hits = fuzzy_search(raw, limit=2, kinds=("district",))
+    if (hits and hits[0]["score"] >= district_score and len(district_provinces(hits[0]["name"])) == 1
+            and (len(hits) == 1 or hits[0]["score"] - hits[1]["score"] >= margin)):
+        return hits[0]["province"]
+    return None
+
+if __name__ == "__main__":
+    import json
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "dump":
+        json.dump(_data(), sys.stdout, ensure_ascii=False, indent=4)
+        sys.stdout.write("\n")
+    elif len(sys.argv) == 3 and sys.argv[1] == "build":
+        with open(sys.argv[2], encoding="utf-8") as f:
+            packed = pack(json.load(f))
+        with open(DATA_FILE, "wb") as f:
+            f.write(packed)
+        print(f"wrote {DATA_FILE} ({len(packed):,} bytes)")
+    else:
+        print(__doc__)